@@ -415,9 +415,7 @@ def extract_frames(
                 output_path.mkdir(parents=True, exist_ok=True)
                 is_valid = []
                 if opencv:
-                    for index in frames2pick:
-                        cap.set_to_frame(index)  # extract a particular frame
-                        frame = cap.read_frame(crop=True)
+                    for index, frame in cap.read_frames(frames2pick, crop=True):
                         if frame is not None:
                             image = img_as_ubyte(frame)
                             img_name = (
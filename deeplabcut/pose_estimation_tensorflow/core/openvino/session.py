@@ -13,7 +13,6 @@ import subprocess
 
 import numpy as np
 from tqdm import tqdm
-import cv2
 
 try:
     from openvino.runtime import Core, AsyncInferQueue
@@ -105,16 +104,15 @@ class OpenVINOSession:
 
 def GetPoseF_OV(cfg, dlc_cfg, sess, inputs, outputs, cap, nframes, batchsize):
     """Prediction of pose"""
-    PredictedData = np.zeros((nframes, 3 * len(dlc_cfg["all_joints_names"])))
-    ny, nx = int(cap.get(4)), int(cap.get(3))
-    if cfg["cropping"]:
-        ny, nx = checkcropping(cfg, cap)
+    from deeplabcut.pose_estimation_tensorflow.predict_videos import (
+        _make_frame_reader,
+    )
 
-    sess._init_model(ny, nx)
+    PredictedData = np.zeros((nframes, 3 * len(dlc_cfg["all_joints_names"])))
+    reader = _make_frame_reader(cfg, cap, nframes, batchsize)
+    sess._init_model(reader.ny, reader.nx)
 
     pbar = tqdm(total=nframes)
-    counter = 0
-    step = max(10, int(nframes / 100))
 
     def completion_callback(request, inp_id):
         pose = next(iter(request.results.values()))
@@ -125,23 +123,14 @@ def GetPoseF_OV(cfg, dlc_cfg, sess, inputs, outputs, cap, nframes, batchsize):
 
     sess.infer_queue.set_callback(completion_callback)
 
-    while cap.isOpened():
-        if counter % step == 0:
-            pbar.update(step)
-        ret, frame = cap.read()
-        if not ret:
-            break
-
-        # Prepare input data
-        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        if cfg["cropping"]:
-            frame = frame[cfg["y1"] : cfg["y2"], cfg["x1"] : cfg["x2"]]
-
-        sess.infer_queue.start_async(
-            {sess.input_name: np.expand_dims(frame, axis=0)}, counter
-        )
-
-        counter += 1
+    with reader:
+        for frames, inds in reader:
+            for i, ind in enumerate(inds):
+                # Copy, as the batch buffer is recycled before requests complete
+                sess.infer_queue.start_async(
+                    {sess.input_name: frames[i : i + 1].copy()}, ind
+                )
+            pbar.update(len(inds))
 
     sess.infer_queue.wait_all()
 
@@ -73,42 +73,45 @@ def compute_edge_costs(
     peak_inds_in_batch[:, 2] = np.clip(peak_inds_in_batch[:, 2], 0, w - 1)
 
     n_samples = pafs.shape[0]
-    sample_inds = []
-    edge_inds = []
-    all_edges = []
-    all_peaks = []
-    for i in range(n_samples):
-        samples_i = peak_inds_in_batch[:, 0] == i
-        peak_inds = peak_inds_in_batch[samples_i, 1:]
-        if not np.any(peak_inds):
-            continue
-        peaks = peak_inds[:, :2]
-        bpt_inds = peak_inds[:, 2]
-        idx = np.arange(peaks.shape[0])
-        idx_per_bpt = {j: idx[bpt_inds == j].tolist() for j in range(n_bodyparts)}
-        edges = []
-        for k, (s, t) in zip(paf_inds, graph):
-            inds_s = idx_per_bpt[s]
-            inds_t = idx_per_bpt[t]
-            if not (inds_s and inds_t):
-                continue
-            candidate_edges = ((i, j) for i in inds_s for j in inds_t)
-            edges.extend(candidate_edges)
-            edge_inds.extend([k] * len(inds_s) * len(inds_t))
-        if not edges:
-            continue
-        sample_inds.extend([i] * len(edges))
-        all_edges.extend(edges)
-        all_peaks.append(peaks[np.asarray(edges)])
-    if not all_peaks:
+    n_edges = len(graph)
+    samples = peak_inds_in_batch[:, 0]
+    # Samples whose peak indices are all zero are ignored
+    valid = np.zeros(n_samples, dtype=bool)
+    valid[samples[np.any(peak_inds_in_batch[:, 1:], axis=1)]] = True
+
+    # Group peaks by (sample, bodypart), preserving their order within a group
+    keys = samples * n_bodyparts + peak_inds_in_batch[:, 3]
+    order = np.argsort(keys, kind="stable")
+    counts = np.bincount(keys, minlength=n_samples * n_bodyparts).reshape(
+        (n_samples, n_bodyparts)
+    )
+    counts[~valid] = 0
+    group_starts = np.searchsorted(keys[order], np.arange(counts.size)).reshape(
+        counts.shape
+    )
+
+    # Every source is paired with every target of an edge, sample after sample
+    src, tgt = np.asarray(graph, dtype=int).reshape((-1, 2)).T
+    n_sources = counts[:, src]
+    n_targets = counts[:, tgt]
+    n_pairs = (n_sources * n_targets).ravel()
+    if not n_pairs.sum():
         return [dict() for _ in range(n_samples)]
+    pair_starts = np.cumsum(n_pairs) - n_pairs
+    segment = np.repeat(np.arange(n_pairs.size), n_pairs)
+    offset = np.arange(segment.size) - pair_starts[segment]
+    segment_targets = n_targets.ravel()[segment]
+    sample_inds, edge_ids = np.divmod(segment, n_edges)
+    rows_s = order[
+        group_starts[sample_inds, src[edge_ids]] + offset // segment_targets
+    ]
+    rows_t = order[
+        group_starts[sample_inds, tgt[edge_ids]] + offset % segment_targets
+    ]
+    edge_inds = np.asarray(paf_inds)[edge_ids]
 
-    sample_inds = np.asarray(sample_inds, dtype=np.int32)
-    edge_inds = np.asarray(edge_inds, dtype=np.int32)
-    all_edges = np.asarray(all_edges, dtype=np.int32)
-    all_peaks = np.concatenate(all_peaks)
-    vecs_s = all_peaks[:, 0]
-    vecs_t = all_peaks[:, 1]
+    vecs_s = peak_inds_in_batch[rows_s, 1:3]
+    vecs_t = peak_inds_in_batch[rows_t, 1:3]
     vecs = vecs_t - vecs_s
     lengths = np.linalg.norm(vecs, axis=1).astype(np.float32)
     lengths += np.spacing(1, dtype=np.float32)
@@ -127,20 +130,17 @@ def compute_edge_costs(
     np.round(affinities, decimals=n_decimals, out=affinities)
     np.round(lengths, decimals=n_decimals, out=lengths)
 
-    # Form cost matrices
+    # Form cost matrices from the contiguous segment of each sample and edge
     all_costs = []
     for i in range(n_samples):
-        samples_i_mask = sample_inds == i
         costs = dict()
-        for k in paf_inds:
-            edges_k_mask = edge_inds == k
-            idx = np.flatnonzero(samples_i_mask & edges_k_mask)
-            s, t = all_edges[idx].T
-            n_sources = np.unique(s).size
-            n_targets = np.unique(t).size
+        for e, k in enumerate(paf_inds):
+            j = i * n_edges + e
+            shape = (n_sources[i, e], n_targets[i, e]) if n_pairs[j] else (0, 0)
+            sl = slice(pair_starts[j], pair_starts[j] + n_pairs[j])
             costs[k] = dict()
-            costs[k]["m1"] = affinities[idx].reshape((n_sources, n_targets))
-            costs[k]["distance"] = lengths[idx].reshape((n_sources, n_targets))
+            costs[k]["m1"] = affinities[sl].reshape(shape)
+            costs[k]["distance"] = lengths[sl].reshape(shape)
         all_costs.append(costs)
 
     return all_costs
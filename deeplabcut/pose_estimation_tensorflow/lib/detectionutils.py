@@ -0,0 +1,699 @@
+#
+# DeepLabCut Toolbox (deeplabcut.org)
+# © A. & M.W. Mathis Labs
+# https://github.com/DeepLabCut/DeepLabCut
+#
+# Please see AUTHORS for contributors.
+# https://github.com/DeepLabCut/DeepLabCut/blob/master/AUTHORS
+#
+# Licensed under GNU Lesser General Public License v3.0
+#
+"""Columnar storage of the raw detections (peaks and edge costs) of a video.
+
+Multi-animal detections used to be stored as one small dict of arrays per frame
+(see ``predict_multianimal.compute_peaks_and_costs``), which is slow to pickle and
+memory hungry for long videos. A :class:`DetectionTable` instead keeps all peaks of
+all frames in a handful of flat arrays:
+
+* a peak table (``xy``, ``confidence``, ``identity``), sorted by frame and bodypart,
+  indexed by ``peak_offsets``;
+* an edge cost table (``m1``, ``distance``) holding the flattened cost matrices of
+  all frames and PAF edges, indexed by ``cost_offsets`` and ``cost_shapes``.
+
+A table behaves like the legacy ``{"metadata": ..., "frame000": {...}}`` dict,
+so existing consumers keep working, while the :class:`~deeplabcut.pose_estimation_tensorflow.lib.inferenceutils.Assembler`
+reads the flat arrays directly.
+
+During video analysis, detections are appended chunk by chunk to a
+:class:`DetectionStore`, a directory holding one raw binary file per column.
+:meth:`DetectionTable.open` memory-maps these files, so that any frame range of
+a long video can be read without loading the others; :func:`read_detections`
+also reads the legacy pickles and shelves.
+"""
+
+import json
+import os
+import pickle
+import shelve
+from collections.abc import Mapping
+
+import numpy as np
+
+
+class FrameDetections(Mapping):
+    """Read-only view on the detections of a single frame of a DetectionTable.
+
+    Items are built on request in the legacy per-frame format; all arrays are
+    views into the table, so nothing is copied.
+    """
+
+    def __init__(self, table, pos):
+        self.table = table
+        self.pos = pos
+        n_bodyparts = table.n_bodyparts
+        self._offsets = table.peak_offsets[
+            pos * n_bodyparts : (pos + 1) * n_bodyparts + 1
+        ]
+
+    @property
+    def xy(self):
+        return self.table.xy[self._offsets[0] : self._offsets[-1]]
+
+    @property
+    def confidence(self):
+        return self.table.confidence[self._offsets[0] : self._offsets[-1]]
+
+    @property
+    def identity(self):
+        if self.table.identity is None:
+            return None
+        return self.table.identity[self._offsets[0] : self._offsets[-1]]
+
+    @property
+    def bodyparts(self):
+        return np.repeat(np.arange(self.table.n_bodyparts), np.diff(self._offsets))
+
+    def _split(self, array):
+        return np.split(array, self._offsets[1:-1] - self._offsets[0])
+
+    def _keys(self):
+        keys = ["coordinates", "confidence"]
+        if self.table.cost_keys is not None:
+            keys.append("costs")
+        if self.table.identity is not None:
+            keys.append("identity")
+        return keys
+
+    def __getitem__(self, key):
+        if key not in self._keys():
+            raise KeyError(key)
+        if key == "coordinates":
+            return (self._split(self.xy),)
+        if key == "confidence":
+            return self._split(self.confidence[:, np.newaxis])
+        if key == "identity":
+            return self._split(self.identity)
+        return self.table.costs(self.pos)
+
+    def __contains__(self, key):
+        return key in self._keys()
+
+    def __iter__(self):
+        return iter(self._keys())
+
+    def __len__(self):
+        return len(self._keys())
+
+
+class DetectionTable(Mapping):
+    """Columnar container of the peaks and edge costs detected in a video.
+
+    Parameters
+    ----------
+    metadata: dict
+        Metadata of the analysis, as stored under the "metadata" key of the
+        legacy detection dicts.
+
+    frame_names: list of str
+        Names of the frames with detections, e.g. "frame0042".
+
+    n_bodyparts: int
+        Number of bodyparts (i.e., keypoint channels).
+
+    peak_offsets: np.ndarray
+        (n_frames * n_bodyparts + 1,) offsets into the peak table; the detections
+        of bodypart j in frame i are rows
+        ``peak_offsets[i * n_bodyparts + j] : peak_offsets[i * n_bodyparts + j + 1]``.
+
+    xy, confidence, identity: np.ndarray
+        Peak table: (n_peaks, 2) coordinates, (n_peaks,) confidences and
+        (n_peaks, n_identities) identity scores (or None).
+
+    cost_keys: np.ndarray or None
+        (n_edges,) PAF indices of the edge cost matrices; None if no costs were
+        computed.
+
+    cost_shapes: np.ndarray
+        (n_frames, n_edges, 2) shapes of the cost matrices; -1 marks missing ones.
+
+    cost_offsets: np.ndarray
+        (n_frames * n_edges + 1,) offsets into the flat cost arrays.
+
+    m1, distance: np.ndarray
+        Flattened affinity and distance cost matrices.
+    """
+
+    def __init__(
+        self,
+        metadata,
+        frame_names,
+        n_bodyparts,
+        peak_offsets,
+        xy,
+        confidence,
+        identity=None,
+        cost_keys=None,
+        cost_shapes=None,
+        cost_offsets=None,
+        m1=None,
+        distance=None,
+    ):
+        self.metadata = metadata
+        self.frame_names = list(frame_names)
+        self.n_bodyparts = n_bodyparts
+        self.peak_offsets = peak_offsets
+        self.xy = xy
+        self.confidence = confidence
+        self.identity = identity
+        self.cost_keys = cost_keys
+        self.cost_shapes = cost_shapes
+        self.cost_offsets = cost_offsets
+        self.m1 = m1
+        self.distance = distance
+        self._lookup = {name: i for i, name in enumerate(self.frame_names)}
+
+    def __getitem__(self, key):
+        if key == "metadata":
+            return self.metadata
+        return FrameDetections(self, self._lookup[key])
+
+    def __iter__(self):
+        yield "metadata"
+        yield from self.frame_names
+
+    def __len__(self):
+        return len(self.frame_names) + 1
+
+    def __contains__(self, key):
+        return key == "metadata" or key in self._lookup
+
+    @property
+    def n_frames(self):
+        return len(self.frame_names)
+
+    def frame(self, ind):
+        """Return the detections of the ``ind``-th stored frame."""
+        return FrameDetections(self, ind)
+
+    def costs(self, pos):
+        """Return the edge costs of the ``pos``-th stored frame as a legacy dict."""
+        costs = dict()
+        n_edges = len(self.cost_keys)
+        for e, k in enumerate(self.cost_keys):
+            shape = self.cost_shapes[pos, e]
+            if shape[0] < 0:
+                continue
+            j = pos * n_edges + e
+            sl = slice(self.cost_offsets[j], self.cost_offsets[j + 1])
+            costs[k] = {
+                "m1": self.m1[sl].reshape(shape),
+                "distance": self.distance[sl].reshape(shape),
+            }
+        return costs
+
+    def slice(self, start, stop):
+        """Return a table of the stored frames [start, stop), sharing its arrays."""
+        offsets = self.peak_offsets[
+            start * self.n_bodyparts : stop * self.n_bodyparts + 1
+        ]
+        peaks = slice(offsets[0], offsets[-1])
+        identity = None if self.identity is None else self.identity[peaks]
+        cost_shapes = cost_offsets = m1 = distance = None
+        if self.cost_keys is not None:
+            n_edges = len(self.cost_keys)
+            cost_offsets = self.cost_offsets[start * n_edges : stop * n_edges + 1]
+            costs = slice(cost_offsets[0], cost_offsets[-1])
+            cost_offsets = cost_offsets - cost_offsets[0]
+            cost_shapes = self.cost_shapes[start:stop]
+            m1 = self.m1[costs]
+            distance = self.distance[costs]
+        return DetectionTable(
+            self.metadata,
+            self.frame_names[start:stop],
+            self.n_bodyparts,
+            offsets - offsets[0],
+            self.xy[peaks],
+            self.confidence[peaks],
+            identity,
+            self.cost_keys,
+            cost_shapes,
+            cost_offsets,
+            m1,
+            distance,
+        )
+
+    @classmethod
+    def from_dict(cls, data):
+        """Convert a legacy dict (or shelf) of per-frame detections."""
+        writer = DetectionTableWriter()
+        for key, value in data.items():
+            writer[key] = value
+        return writer.to_table()
+
+    def save(self, filename):
+        """Write the table to a (uncompressed) .npz file."""
+        arrays = {
+            "metadata": np.frombuffer(
+                pickle.dumps(self.metadata, pickle.HIGHEST_PROTOCOL), dtype=np.uint8
+            ),
+            "frame_names": np.asarray(self.frame_names, dtype=str),
+            "n_bodyparts": np.asarray(self.n_bodyparts),
+            "peak_offsets": self.peak_offsets,
+            "xy": self.xy,
+            "confidence": self.confidence,
+        }
+        if self.identity is not None:
+            arrays["identity"] = self.identity
+        if self.cost_keys is not None:
+            arrays.update(
+                cost_keys=self.cost_keys,
+                cost_shapes=self.cost_shapes,
+                cost_offsets=self.cost_offsets,
+                m1=self.m1,
+                distance=self.distance,
+            )
+        with open(filename, "wb") as file:
+            np.savez(file, **arrays)
+
+    @classmethod
+    def load(cls, filename):
+        """Read a table written with :meth:`save`."""
+        with np.load(filename) as file:
+            arrays = dict(file)
+        metadata = pickle.loads(arrays.pop("metadata").tobytes())
+        n_bodyparts = int(arrays.pop("n_bodyparts"))
+        return cls(metadata, n_bodyparts=n_bodyparts, **arrays)
+
+    @classmethod
+    def open(cls, path, mmap_mode="r"):
+        """Read the table of a :class:`DetectionStore` directory.
+
+        Parameters
+        ----------
+        path: str
+            Path to the store directory.
+
+        mmap_mode: str or None, optional (default="r")
+            Columns are memory-mapped with this mode, so that only the frames
+            actually accessed are read from disk. If None, they are loaded
+            into memory.
+        """
+        index = _read_index(path)
+        with open(os.path.join(path, DetectionStore.METADATA_FILE), "rb") as file:
+            metadata = pickle.load(file)
+        frame_names = _read_frame_names(path, index["n_frames"])
+        columns = {
+            name: _read_column(path, name, index, mmap_mode)
+            for name in _column_shapes(index)
+        }
+        cost_keys = index["cost_keys"]
+        if cost_keys is not None:
+            cost_keys = np.asarray(cost_keys)
+        return cls(
+            metadata,
+            frame_names,
+            index["n_bodyparts"],
+            cost_keys=cost_keys,
+            **columns,
+        )
+
+
+class DetectionTableWriter:
+    """Accumulate per-frame detections into the columns of a DetectionTable.
+
+    Frames are added in the legacy per-frame format, either with :meth:`add` or by
+    item assignment, so that a writer can stand in for the dict (or shelf) the
+    detections of a video used to be collected into.
+    """
+
+    def __init__(self, metadata=None, cost_keys=None):
+        self.metadata = metadata
+        self.frame_names = []
+        self.n_bodyparts = None
+        self._cost_keys = None
+        if cost_keys is not None:
+            self._cost_keys = {k: e for e, k in enumerate(cost_keys)}
+        self._counts = []
+        self._xy = []
+        self._confidence = []
+        self._identity = []
+        self._cost_entries = []
+        self._m1 = []
+        self._distance = []
+
+    def __setitem__(self, key, value):
+        if key == "metadata":
+            self.metadata = value
+        else:
+            self.add(key, value)
+
+    def __contains__(self, key):
+        return key == "metadata" or key in self.frame_names
+
+    def keys(self):
+        return ["metadata", *self.frame_names]
+
+    def __len__(self):
+        return len(self.frame_names) + 1
+
+    def add(self, name, data):
+        """Append the detections ``data`` of frame ``name``."""
+        coords = data["coordinates"][0]
+        if self.n_bodyparts is None:
+            self.n_bodyparts = len(coords)
+        self.frame_names.append(name)
+        self._counts.append([len(xy) for xy in coords])
+        self._xy.extend(coords)
+        self._confidence.extend(c.ravel() for c in data["confidence"])
+        if "identity" in data:
+            self._identity.extend(data["identity"])
+        entries = []
+        if "costs" in data:
+            if self._cost_keys is None:
+                self._cost_keys = dict()
+            for k, costs in data["costs"].items():
+                e = self._cost_keys.setdefault(k, len(self._cost_keys))
+                entries.append((e, costs))
+            # Flat costs are stored in edge order
+            entries.sort(key=lambda entry: entry[0])
+            for _, costs in entries:
+                self._m1.append(costs["m1"].ravel())
+                self._distance.append(costs["distance"].ravel())
+        self._cost_entries.append([(e, costs["m1"].shape) for e, costs in entries])
+
+    def to_table(self):
+        """Build the DetectionTable from all frames added so far."""
+        n_bodyparts = self.n_bodyparts or 0
+        counts = np.asarray(self._counts, dtype=np.int64).reshape(-1)
+        peak_offsets = np.r_[0, np.cumsum(counts)]
+
+        def concat(arrays, shape, dtype):
+            if not arrays:
+                return np.empty(shape, dtype=dtype)
+            return np.concatenate(arrays)
+
+        xy = concat(self._xy, (0, 2), float)
+        confidence = concat(self._confidence, (0,), float)
+        identity = None
+        if self._identity:
+            identity = np.concatenate(self._identity)
+        cost_keys = cost_shapes = cost_offsets = m1 = distance = None
+        if self._cost_keys is not None:
+            cost_keys = np.asarray(list(self._cost_keys))
+            cost_shapes = np.full((len(self.frame_names), len(cost_keys), 2), -1)
+            for i, entries in enumerate(self._cost_entries):
+                for e, shape in entries:
+                    cost_shapes[i, e] = shape
+            sizes = np.clip(cost_shapes, 0, None).prod(axis=2).ravel()
+            cost_offsets = np.r_[0, np.cumsum(sizes)]
+            m1 = concat(self._m1, (0,), np.float32)
+            distance = concat(self._distance, (0,), np.float32)
+        return DetectionTable(
+            self.metadata,
+            self.frame_names,
+            n_bodyparts,
+            peak_offsets,
+            xy,
+            confidence,
+            identity,
+            cost_keys,
+            cost_shapes,
+            cost_offsets,
+            m1,
+            distance,
+        )
+
+
+class DetectionStore:
+    """Append the detections of a video to a chunked, on-disk DetectionTable.
+
+    Frames are added in the legacy per-frame format, as to a
+    :class:`DetectionTableWriter`, and buffered in memory. Every ``chunk_size``
+    frames, the buffer is appended to the raw column files of the store
+    directory, and its index is updated; the columns can then be memory-mapped
+    with :meth:`DetectionTable.open`. An existing store is opened for appending,
+    so that an interrupted analysis can resume after the last chunk written.
+
+    Parameters
+    ----------
+    path: str
+        Path to the store directory; it is created if needed.
+
+    chunk_size: int, optional (default=1000)
+        Number of frames buffered in memory before being written to disk.
+    """
+
+    INDEX_FILE = "index.json"
+    METADATA_FILE = "metadata.pickle"
+    FRAMES_FILE = "frame_names.txt"
+    VERSION = 1
+
+    def __init__(self, path, chunk_size=1000):
+        self.path = path
+        self.chunk_size = chunk_size
+        self.metadata = None
+        self.frame_names = []
+        self._index = None
+        self._table = None
+        os.makedirs(path, exist_ok=True)
+        if os.path.isfile(os.path.join(path, self.INDEX_FILE)):
+            self._index = _read_index(path)
+            self.frame_names = _read_frame_names(path, self._index["n_frames"])
+            self._truncate()
+        metadata_file = os.path.join(path, self.METADATA_FILE)
+        if os.path.isfile(metadata_file):
+            with open(metadata_file, "rb") as file:
+                self.metadata = pickle.load(file)
+        self._buffer = self._new_buffer()
+
+    def _new_buffer(self):
+        cost_keys = None
+        if self._index is not None:
+            cost_keys = self._index["cost_keys"]
+        elif self.metadata is not None and "PAFinds" in self.metadata:
+            # Frames of a video may lack some edges; fix their order up front
+            cost_keys = [int(k) for k in self.metadata["PAFinds"]]
+        return DetectionTableWriter(cost_keys=cost_keys)
+
+    def _column_file(self, name):
+        return os.path.join(self.path, name + ".bin")
+
+    def _truncate(self):
+        """Drop whatever was written past the index, e.g., by a crashed analysis."""
+        for name, shape in _column_shapes(self._index).items():
+            size = int(np.prod(shape)) * np.dtype(self._index["dtypes"][name]).itemsize
+            with open(self._column_file(name), "r+b") as file:
+                file.truncate(size)
+        with open(os.path.join(self.path, self.FRAMES_FILE), "w") as file:
+            file.writelines(name + "\n" for name in self.frame_names)
+
+    def __setitem__(self, key, value):
+        if key == "metadata":
+            self.metadata = value
+            with open(os.path.join(self.path, self.METADATA_FILE), "wb") as file:
+                pickle.dump(value, file, pickle.HIGHEST_PROTOCOL)
+            if self._index is None and not self._buffer.frame_names:
+                self._buffer = self._new_buffer()
+        else:
+            self.add(key, value)
+
+    def __getitem__(self, key):
+        if key == "metadata":
+            return self.metadata
+        if key in self._buffer:
+            self.flush()
+        return self.to_table()[key]
+
+    def __contains__(self, key):
+        return key in self.frame_names or key in self._buffer
+
+    def keys(self):
+        return ["metadata", *self.frame_names, *self._buffer.frame_names]
+
+    def __len__(self):
+        return len(self.frame_names) + len(self._buffer.frame_names) + 1
+
+    def add(self, name, data):
+        """Append the detections ``data`` of frame ``name``."""
+        self._buffer.add(name, data)
+        if len(self._buffer.frame_names) >= self.chunk_size:
+            self.flush()
+
+    def _init_index(self, table):
+        cost_keys = None
+        if table.cost_keys is not None:
+            cost_keys = [int(k) for k in table.cost_keys]
+        n_identities = None
+        if table.identity is not None:
+            n_identities = table.identity.shape[1]
+        self._index = {
+            "version": self.VERSION,
+            "n_frames": 0,
+            "n_bodyparts": table.n_bodyparts,
+            "n_peaks": 0,
+            "n_costs": 0,
+            "cost_keys": cost_keys,
+            "n_identities": n_identities,
+            "dtypes": {
+                "peak_offsets": "int64",
+                "xy": table.xy.dtype.str,
+                "confidence": table.confidence.dtype.str,
+                "identity": None if n_identities is None else table.identity.dtype.str,
+                "cost_shapes": "int64",
+                "cost_offsets": "int64",
+                "m1": None if cost_keys is None else table.m1.dtype.str,
+                "distance": None if cost_keys is None else table.distance.dtype.str,
+            },
+        }
+        for name in _column_shapes(self._index):
+            with open(self._column_file(name), "wb") as file:
+                if name.endswith("offsets"):
+                    np.zeros(1, dtype=np.int64).tofile(file)
+        open(os.path.join(self.path, self.FRAMES_FILE), "w").close()
+        self._write_index()
+
+    def _write_index(self):
+        filename = os.path.join(self.path, self.INDEX_FILE)
+        with open(filename + ".tmp", "w") as file:
+            json.dump(self._index, file)
+        os.replace(filename + ".tmp", filename)
+
+    def flush(self):
+        """Append the buffered frames to the store on disk."""
+        table = self._buffer.to_table()
+        if self._index is None:
+            self._init_index(table)
+        if not table.n_frames:
+            return
+        index = self._index
+        n_edges = len(index["cost_keys"] or [])
+        if (table.identity is None) != (index["n_identities"] is None):
+            raise ValueError("Either all or none of the frames must have identities.")
+        if table.cost_keys is not None and len(table.cost_keys) > n_edges:
+            raise ValueError(
+                f"Frames {table.frame_names[0]}-{table.frame_names[-1]} "
+                "have edge costs not found in the previous frames."
+            )
+        if table.n_bodyparts != index["n_bodyparts"]:
+            raise ValueError("All frames must have the same number of bodyparts.")
+        columns = {
+            "peak_offsets": table.peak_offsets[1:] + index["n_peaks"],
+            "xy": table.xy,
+            "confidence": table.confidence,
+            "identity": table.identity,
+        }
+        if index["cost_keys"] is not None:
+            if table.cost_keys is None:  # No costs at all in this chunk
+                cost_shapes = np.full((table.n_frames, n_edges, 2), -1)
+                cost_offsets = np.zeros(table.n_frames * n_edges + 1, dtype=int)
+                m1 = distance = np.empty(0)
+            else:
+                cost_shapes, cost_offsets = table.cost_shapes, table.cost_offsets
+                m1, distance = table.m1, table.distance
+            columns.update(
+                cost_shapes=cost_shapes,
+                cost_offsets=cost_offsets[1:] + index["n_costs"],
+                m1=m1,
+                distance=distance,
+            )
+        for name in _column_shapes(index):
+            array = np.ascontiguousarray(columns[name], dtype=index["dtypes"][name])
+            with open(self._column_file(name), "ab") as file:
+                array.tofile(file)
+        with open(os.path.join(self.path, self.FRAMES_FILE), "a") as file:
+            file.writelines(name + "\n" for name in table.frame_names)
+        index["n_frames"] += table.n_frames
+        index["n_peaks"] += len(table.xy)
+        index["n_costs"] += len(columns.get("m1", []))
+        self._write_index()
+        self.frame_names.extend(table.frame_names)
+        self._buffer = self._new_buffer()
+        self._table = None
+
+    def to_table(self, mmap_mode="r"):
+        """Return the (memory-mapped) DetectionTable of the frames written so far."""
+        if self._index is None:
+            self.flush()
+        if mmap_mode != "r":
+            return DetectionTable.open(self.path, mmap_mode)
+        if self._table is None:
+            self._table = DetectionTable.open(self.path, mmap_mode)
+        return self._table
+
+    def close(self):
+        """Write the remaining frames, and return the table of the whole store."""
+        self.flush()
+        return self.to_table()
+
+
+def _read_index(path):
+    with open(os.path.join(path, DetectionStore.INDEX_FILE)) as file:
+        index = json.load(file)
+    if index["version"] > DetectionStore.VERSION:
+        raise IOError(f"{path} was written by a newer version of DeepLabCut.")
+    return index
+
+
+def _read_frame_names(path, n_frames):
+    with open(os.path.join(path, DetectionStore.FRAMES_FILE)) as file:
+        return [line.rstrip("\n") for _, line in zip(range(n_frames), file)]
+
+
+def _column_shapes(index):
+    n_frames = index["n_frames"]
+    n_peaks = index["n_peaks"]
+    shapes = {
+        "peak_offsets": (n_frames * index["n_bodyparts"] + 1,),
+        "xy": (n_peaks, 2),
+        "confidence": (n_peaks,),
+    }
+    if index["n_identities"] is not None:
+        shapes["identity"] = (n_peaks, index["n_identities"])
+    if index["cost_keys"] is not None:
+        n_edges = len(index["cost_keys"])
+        shapes.update(
+            cost_shapes=(n_frames, n_edges, 2),
+            cost_offsets=(n_frames * n_edges + 1,),
+            m1=(index["n_costs"],),
+            distance=(index["n_costs"],),
+        )
+    return shapes
+
+
+def _read_column(path, name, index, mmap_mode):
+    shape = _column_shapes(index)[name]
+    dtype = np.dtype(index["dtypes"][name])
+    filename = os.path.join(path, name + ".bin")
+    size = int(np.prod(shape))
+    if mmap_mode is None or not size:  # Empty files cannot be memory-mapped
+        return np.fromfile(filename, dtype=dtype, count=size).reshape(shape)
+    return np.memmap(filename, dtype=dtype, mode=mmap_mode, shape=shape)
+
+
+def read_detections(filename, mmap_mode="r"):
+    """Read the raw detections of a video, in any of the formats they are saved in.
+
+    Parameters
+    ----------
+    filename: str
+        Path to a :class:`DetectionStore` directory, to a DetectionTable saved
+        as .npz, or to a legacy "_full.pickle" file, holding either a pickled
+        dict (or DetectionTable) or a shelf.
+
+    mmap_mode: str or None, optional (default="r")
+        Memory-map mode of the columns of a DetectionStore.
+
+    Returns
+    -------
+    DetectionTable, dict or shelve.Shelf
+        Detections in the legacy ``{"metadata": ..., "frame000": {...}}`` layout.
+    """
+    if os.path.isdir(filename):
+        return DetectionTable.open(filename, mmap_mode)
+    if filename.endswith(".npz"):
+        return DetectionTable.load(filename)
+    try:
+        with open(filename, "rb") as file:
+            return pickle.load(file)
+    except (pickle.UnpicklingError, FileNotFoundError):
+        return shelve.open(filename, flag="r")
@@ -9,6 +9,7 @@
 # Licensed under GNU Lesser General Public License v3.0
 #
 
+import copy
 import heapq
 import itertools
 import multiprocessing
@@ -29,6 +30,11 @@ from scipy.stats import gaussian_kde, chi2
 from tqdm import tqdm
 from typing import Tuple
 
+from deeplabcut.pose_estimation_tensorflow.lib.detectionutils import (
+    DetectionTable,
+    FrameDetections,
+)
+
 
 def _conv_square_to_condensed_indices(ind_row, ind_col, n):
     if ind_row == ind_col:
@@ -364,6 +370,10 @@ class Assembler:
 
     @staticmethod
     def _flatten_detections(data_dict):
+        if isinstance(data_dict, FrameDetections):
+            yield from Assembler._flatten_frame_detections(data_dict)
+            return
+
         ind = 0
         coordinates = data_dict["coordinates"][0]
         confidence = data_dict["confidence"]
@@ -380,6 +390,24 @@ class Assembler:
                 ind += 1
                 yield joint
 
+    @staticmethod
+    def _flatten_frame_detections(frame):
+        """Same as _flatten_detections, reading the columns of a DetectionTable."""
+        coords = frame.xy
+        conf = frame.confidence
+        labels = frame.bodyparts
+        ids = frame.identity
+        if ids is None:
+            ids = np.full(len(conf), -1)
+        else:
+            ids = ids.argmax(axis=1)
+        # Body parts whose detections all lie at the origin are skipped
+        keep = np.isin(labels, labels[np.any(coords, axis=1)])
+        for ind, (xy, p, i, g) in enumerate(
+            zip(coords[keep], conf[keep].tolist(), labels[keep].tolist(), ids[keep])
+        ):
+            yield Joint(tuple(xy), p, i, ind, g)
+
     def extract_best_links(self, joints_dict, costs, trees=None):
         links = []
         for ind in self.paf_inds:
@@ -779,36 +807,103 @@ class Assembler:
 
         return assemblies, unique
 
-    def assemble(self, chunk_size=1, n_processes=None):
+    def assemble_frame(self, frame, ind):
+        """Assemble the detections ``frame`` of the frame of index ``ind``.
+
+        Meant for frames coming in one at a time, in increasing order (e.g.,
+        during inference): the frame need not be part of the data the assembler
+        was created with, and only the links of the last ``window_size`` frames
+        are kept in memory. Assemblies are stored as with :meth:`assemble`.
+
+        Returns the assemblies and the unique body parts of the frame.
+        """
+        assemblies, unique = self._assemble(frame, ind)
+        # Links are only looked up in the last `window_size` frames
+        for key in [key for key in self._trees if key <= ind - self.window_size]:
+            del self._trees[key]
+        if assemblies:
+            self.assemblies[ind] = assemblies
+        if unique is not None:
+            self.unique[ind] = unique
+        return assemblies, unique
+
+    def _segment(self, start, stop):
+        """Return a copy of the assembler restricted to frames [start, stop)."""
+        imnames = self.metadata["imnames"][start:stop]
+        segment = copy.copy(self)
+        if isinstance(self.data, DetectionTable):
+            segment.data = self.data.slice(start, stop)
+        else:  # Also loads the frames of a shelf, which cannot be pickled
+            segment.data = {"metadata": self.data["metadata"]}
+            segment.data.update((name, self.data[name]) for name in imnames)
+        segment.metadata = dict(self.metadata, imnames=imnames)
+        segment._trees = dict()
+        segment.assemblies = dict()
+        segment.unique = dict()
+        return segment
+
+    def assemble(self, chunk_size=1, n_processes=None, overlap=None):
+        """Assemble the detections of all frames into individuals.
+
+        Parameters
+        ----------
+        chunk_size: int, optional (default=1)
+            Minimal number of frames assembled by a worker process at once.
+            If 0, all frames are assembled serially in the current process.
+
+        n_processes: int, optional (default=None)
+            Number of worker processes; by default, as many as there are CPUs.
+
+        overlap: int, optional (default=None)
+            Frames are split into contiguous segments that are assembled serially
+            by the workers. With temporal coupling (``window_size`` >= 1), each
+            segment is assembled starting ``overlap`` frames early, so that the
+            links of the preceding frames are known at its first frame.
+            Defaults to 10 * ``window_size``.
+        """
         self.assemblies = dict()
         self.unique = dict()
-        # Spawning (rather than forking) multiple processes does not
-        # work nicely with the GUI or interactive sessions.
-        # In that case, we fall back to the serial assembly.
-        if chunk_size == 0 or multiprocessing.get_start_method() == "spawn":
-            for i, data_dict in enumerate(tqdm(self)):
-                assemblies, unique = self._assemble(data_dict, i)
-                if assemblies:
-                    self.assemblies[i] = assemblies
-                if unique is not None:
-                    self.unique[i] = unique
+        n_frames = len(self.metadata["imnames"])
+        if chunk_size == 0:
+            segments = [(0, n_frames)]
         else:
-            global wrapped  # Hack to make the function pickable
-
-            def wrapped(i):
-                return i, self._assemble(self[i], i)
-
-            n_frames = len(self.metadata["imnames"])
-            with multiprocessing.Pool(n_processes) as p:
-                with tqdm(total=n_frames) as pbar:
-                    for i, (assemblies, unique) in p.imap_unordered(
-                        wrapped, range(n_frames), chunksize=chunk_size
-                    ):
-                        if assemblies:
-                            self.assemblies[i] = assemblies
-                        if unique is not None:
-                            self.unique[i] = unique
-                        pbar.update()
+            if n_processes is None:
+                n_processes = multiprocessing.cpu_count()
+            # A few segments per process help balancing the load
+            size = max(chunk_size, int(np.ceil(n_frames / (4 * n_processes))))
+            segments = [
+                (start, min(start + size, n_frames))
+                for start in range(0, n_frames, size)
+            ]
+        if overlap is None:
+            overlap = 10 * self.window_size
+        if not self.window_size:
+            overlap = 0
+
+        def tasks():
+            if len(segments) == 1:  # Serial assembly in place
+                yield self, 0, 0
+                return
+            for start, stop in segments:
+                first = max(0, start - overlap)
+                yield self._segment(first, stop), first, start - first
+
+        with tqdm(total=n_frames) as pbar:
+            if len(segments) == 1:
+                results = map(_assemble_segment, tasks())
+                pool = None
+            else:
+                pool = multiprocessing.Pool(n_processes)
+                results = pool.imap(_assemble_segment, tasks())
+            try:
+                for assemblies, unique, n in results:
+                    self.assemblies.update(assemblies)
+                    self.unique.update(unique)
+                    pbar.update(n)
+            finally:
+                if pool is not None:
+                    pool.close()
+                    pool.join()
 
     def from_pickle(self, pickle_path):
         with open(pickle_path, "rb") as file:
@@ -865,6 +960,26 @@ class Assembler:
             pickle.dump(data, file, pickle.HIGHEST_PROTOCOL)
 
 
+def _assemble_segment(args):
+    """Serially assemble a segment of frames, discarding its first n_warmup frames.
+
+    Defined at module level so that it can be sent to worker processes,
+    whether they are forked or spawned.
+    """
+    assembler, offset, n_warmup = args
+    assemblies = dict()
+    unique = dict()
+    for i in range(len(assembler.metadata["imnames"])):
+        assemblies_, unique_ = assembler._assemble(assembler[i], offset + i)
+        if i < n_warmup:
+            continue
+        if assemblies_:
+            assemblies[offset + i] = assemblies_
+        if unique_ is not None:
+            unique[offset + i] = unique_
+    return assemblies, unique, len(assembler.metadata["imnames"]) - n_warmup
+
+
 def calc_object_keypoint_similarity(
     xy_pred,
     xy_true,
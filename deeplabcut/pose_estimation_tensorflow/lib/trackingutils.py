@@ -12,6 +12,9 @@
 import abc
 import math
 import numpy as np
+import pandas as pd
+import pickle
+import re
 import warnings
 from collections import defaultdict
 from filterpy.common import kinematic_kf
@@ -23,6 +26,8 @@ from scipy.optimize import linear_sum_assignment
 from scipy.stats import mode
 from tqdm import tqdm
 
+from deeplabcut.pose_estimation_tensorflow.lib.inferenceutils import Assembler
+
 
 warnings.simplefilter("ignore", category=NumbaPerformanceWarning)
 
@@ -49,6 +54,97 @@ def calc_iou(bbox1, bbox2):
     )
 
 
+def calc_pairwise_iou(bboxes1, bboxes2):
+    """Intersection over union of all pairs of (x1, y1, x2, y2[, ...]) boxes."""
+    bboxes1 = np.atleast_2d(np.asarray(bboxes1, dtype=float))
+    bboxes2 = np.atleast_2d(np.asarray(bboxes2, dtype=float))
+    b1 = bboxes1[:, np.newaxis]
+    b2 = bboxes2[np.newaxis]
+    x1 = np.maximum(b1[..., 0], b2[..., 0])
+    y1 = np.maximum(b1[..., 1], b2[..., 1])
+    x2 = np.minimum(b1[..., 2], b2[..., 2])
+    y2 = np.minimum(b1[..., 3], b2[..., 3])
+    wh = np.maximum(0, x2 - x1) * np.maximum(0, y2 - y1)
+    area1 = (b1[..., 2] - b1[..., 0]) * (b1[..., 3] - b1[..., 1])
+    area2 = (b2[..., 2] - b2[..., 0]) * (b2[..., 3] - b2[..., 1])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return wh / (area1 + area2 - wh)
+
+
+def calc_pairwise_ellipse_similarity(params, params_ref):
+    """Vectorized :meth:`Ellipse.calc_similarity_with` of all pairs of ellipses.
+
+    Parameters
+    ----------
+    params, params_ref : array-like
+        (n, 5) and (m, 5) ellipse parameters (x, y, width, height, theta).
+
+    Returns
+    -------
+    (n, m) array of similarities
+    """
+    params = np.asarray(params, dtype=float).reshape((-1, 5))
+    params_ref = np.asarray(params_ref, dtype=float).reshape((-1, 5))
+    max_dist = np.maximum(
+        params[:, 2:4].max(axis=1)[:, np.newaxis],
+        params_ref[:, 2:4].max(axis=1),
+    )
+    dx = params[:, np.newaxis, 0] - params_ref[:, 0]
+    dy = params[:, np.newaxis, 1] - params_ref[:, 1]
+    dist = np.sqrt(dx**2 + dy**2)
+    cost1 = 1 - np.minimum(dist / max_dist, 1)
+    cost2 = np.abs(np.cos(params[:, np.newaxis, 4] - params_ref[:, 4]))
+    return 0.8 * cost1 + 0.2 * cost2 * cost1
+
+
+def _ellipse_filter():
+    kf = kinematic_kf(5, 1, dim_z=5, order_by_dim=False)
+    kf.R[2:, 2:] *= 10.0
+    # High uncertainty to the unobservable initial velocities
+    kf.P[5:, 5:] *= 1000.0
+    kf.P *= 10.0
+    kf.Q[5:, 5:] *= 0.01
+    return kf
+
+
+def _skeleton_filter(n_bodyparts):
+    kf = kinematic_kf(n_bodyparts * 2, 1, dim_z=n_bodyparts, order_by_dim=False)
+    kf.Q[kf.dim_z :, kf.dim_z :] *= 10
+    kf.R[kf.dim_z :, kf.dim_z :] *= 0.01
+    kf.P[kf.dim_z :, kf.dim_z :] *= 1000
+    return kf
+
+
+def _box_filter():
+    kf = KalmanFilter(dim_x=7, dim_z=4)
+    kf.F = np.array(
+        [
+            [1, 0, 0, 0, 1, 0, 0],
+            [0, 1, 0, 0, 0, 1, 0],
+            [0, 0, 1, 0, 0, 0, 1],
+            [0, 0, 0, 1, 0, 0, 0],
+            [0, 0, 0, 0, 1, 0, 0],
+            [0, 0, 0, 0, 0, 1, 0],
+            [0, 0, 0, 0, 0, 0, 1],
+        ]
+    )
+    kf.H = np.array(
+        [
+            [1, 0, 0, 0, 0, 0, 0],
+            [0, 1, 0, 0, 0, 0, 0],
+            [0, 0, 1, 0, 0, 0, 0],
+            [0, 0, 0, 1, 0, 0, 0],
+        ]
+    )
+    kf.R[2:, 2:] *= 10.0
+    # Give high uncertainty to the unobservable initial velocities
+    kf.P[4:, 4:] *= 1000.0
+    kf.P *= 10.0
+    kf.Q[-1, -1] *= 0.01
+    kf.Q[4:, 4:] *= 0.01
+    return kf
+
+
 class BaseTracker:
     """Base class for a constant-velocity Kalman filter-based tracker."""
 
@@ -171,8 +267,13 @@ class EllipseFitter:
         if self.sd:
             self.params = self._fit_error(self.x, self.y, self.sd)
         else:
-            self._coeffs = self._fit(self.x, self.y)
+            # Fitting the centered points is much better conditioned; the
+            # coefficients are those of the conic about the points' centroid.
+            center = np.mean(self.x), np.mean(self.y)
+            self._coeffs = self._fit(self.x - center[0], self.y - center[1])
             self.params = self.calc_parameters(self._coeffs)
+            self.params[0] += center[0]
+            self.params[1] += center[1]
         if not np.isnan(self.params).any():
             el = Ellipse(*self.params)
             # Regularize by forcing AR <= 5
@@ -190,6 +291,118 @@ class EllipseFitter:
             return el
         return None
 
+    def fit_batch(self, xy):
+        """Fit ellipses to many sets of keypoints at once.
+
+        Parameters
+        ----------
+        xy : array-like
+            (..., n_bodyparts, 2) coordinates, e.g. of shape
+            (n_frames, n_animals, n_bodyparts, 2). Missing keypoints are NaN.
+
+        Returns
+        -------
+        (..., 5) array of ellipse parameters (x, y, width, height, theta);
+        rows are NaN wherever :meth:`fit` would return None.
+        """
+        xy = np.asarray(xy, dtype=np.float64)
+        shape = xy.shape[:-2]
+        xy = xy.reshape((-1, *xy.shape[-2:]))
+        mask = np.isfinite(xy).all(axis=2)
+        params = np.full((xy.shape[0], 5), np.nan)
+        valid = mask.sum(axis=1) >= 3
+        if valid.any():
+            with np.errstate(divide="ignore", invalid="ignore"):
+                if self.sd:
+                    params[valid] = self._fit_error_batch(
+                        xy[valid], mask[valid], self.sd
+                    )
+                else:
+                    # Fit the centered points, as in `fit`
+                    xy, mask = xy[valid], mask[valid]
+                    center = np.nanmean(np.where(mask[..., np.newaxis], xy, np.nan), 1)
+                    coeffs = self._fit_batch(xy - center[:, np.newaxis], mask)
+                    params[valid] = self._calc_parameters_batch(coeffs)
+                    params[valid, :2] += center
+        params[np.isnan(params).any(axis=1)] = np.nan
+        return params.reshape((*shape, 5))
+
+    @staticmethod
+    def _fit_batch(xy, mask):
+        """Vectorized :meth:`_fit` of (n, n_points, 2) coordinates.
+
+        Points outside the boolean (n, n_points) ``mask`` are ignored.
+        Coefficients are NaN where no ellipse solution exists.
+        """
+        w = mask.astype(np.float64)
+        x = np.where(mask, xy[..., 0], 0)
+        y = np.where(mask, xy[..., 1], 0)
+        D1 = np.stack((x * x, x * y, y * y), axis=1)
+        D2 = np.stack((x, y, w), axis=1)
+        S1 = D1 @ D1.transpose((0, 2, 1))
+        S2 = D1 @ D2.transpose((0, 2, 1))
+        S3 = D2 @ D2.transpose((0, 2, 1))
+        singular = np.linalg.det(S3) == 0
+        S3[singular] = np.eye(3)
+        T = -np.linalg.inv(S3) @ S2.transpose((0, 2, 1))
+        temp = S1 + S2 @ T
+        M = np.stack((temp[:, 2] * 0.5, -temp[:, 1], temp[:, 0] * 0.5), axis=1)
+        _, V = np.linalg.eig(M)
+        cond = 4 * V[:, 0].real * V[:, 2].real - V[:, 1].real ** 2
+        col = np.argmax(cond > 0, axis=1)
+        a1 = V[np.arange(len(V)), :, col]
+        # No real solution where the eigenvector is complex
+        found = (cond > 0).any(axis=1) & ~singular & ~np.iscomplex(a1).any(axis=1)
+        a1 = a1.real
+        a1[a1[:, 0] < 0] *= -1  # Same sign convention as `_fit`
+        a2 = (T @ a1[..., np.newaxis])[..., 0]
+        coeffs = np.c_[a1, a2]
+        coeffs[~found] = np.nan
+        return coeffs
+
+    @staticmethod
+    def _fit_error_batch(xy, mask, sd):
+        """Vectorized :meth:`_fit_error` of (n, n_points, 2) coordinates.
+
+        Points outside the boolean (n, n_points) ``mask`` are ignored.
+        """
+        mask = mask[..., np.newaxis]
+        n = mask.sum(axis=1)
+        mean = np.where(mask, xy, 0).sum(axis=1) / n
+        demeaned = np.where(mask, xy - mean[:, np.newaxis], 0)
+        cov = np.einsum("nki,nkj->nij", demeaned, demeaned) / (n[..., np.newaxis] - 1)
+        E, V = np.linalg.eigh(cov)  # Returns the eigenvalues in ascending order
+        height, width = 2 * sd * np.sqrt(E.T)
+        rotation = np.arctan2(V[:, 1, 1], V[:, 0, 1]) % np.pi
+        return np.c_[mean, width, height, rotation]
+
+    @staticmethod
+    def _calc_parameters_batch(coeffs):
+        """Vectorized :meth:`calc_parameters` of (n, 6) coefficients."""
+        a, b, c, d, f, g = coeffs.T
+        b = b * 0.5
+        d = d * 0.5
+        f = f * 0.5
+
+        # Ellipse center coordinates
+        x0 = (c * d - b * f) / (b * b - a * c)
+        y0 = (a * f - b * d) / (b * b - a * c)
+
+        # Semi-axes lengths
+        num = 2 * (a * f * f + c * d * d + g * b * b - 2 * b * d * f - a * c * g)
+        den1 = (b * b - a * c) * (np.sqrt((a - c) ** 2 + 4 * b * b) - (a + c))
+        den2 = (b * b - a * c) * (-np.sqrt((a - c) ** 2 + 4 * b * b) - (a + c))
+        major = np.sqrt(num / den1)
+        minor = np.sqrt(num / den2)
+
+        # Angle to the horizontal
+        phi = np.where(
+            b == 0,
+            np.where(a < c, 0, np.pi / 2),
+            np.arctan(2 * b / (a - c)) / 2 + np.where(a < c, 0, np.pi / 2),
+        )
+        return np.c_[x0, y0, 2 * major, 2 * minor, phi]
+
     @staticmethod
     @jit(nopython=True)
     def _fit(x, y):
@@ -217,6 +430,10 @@ class EllipseFitter:
         E, V = np.linalg.eig(M)
         cond = 4 * V[0] * V[2] - V[1] ** 2
         a1 = V[:, cond > 0][:, 0]
+        # Eigenvectors are only defined up to their sign, which would otherwise
+        # swap the axes of the ellipse; make the leading coefficient positive.
+        if a1[0] < 0:
+            a1 = -a1
         a2 = T @ a1
         return np.hstack((a1, a2))
 
@@ -288,11 +505,7 @@ class EllipseFitter:
 class EllipseTracker(BaseTracker):
     def __init__(self, params):
         super().__init__(dim=5, dim_z=5)
-        self.kf.R[2:, 2:] *= 10.0
-        # High uncertainty to the unobservable initial velocities
-        self.kf.P[5:, 5:] *= 1000.0
-        self.kf.P *= 10.0
-        self.kf.Q[5:, 5:] *= 0.01
+        self.kf = _ellipse_filter()
         self.state = params
 
     @BaseTracker.state.setter
@@ -304,9 +517,7 @@ class EllipseTracker(BaseTracker):
 class SkeletonTracker(BaseTracker):
     def __init__(self, n_bodyparts):
         super().__init__(dim=n_bodyparts * 2, dim_z=n_bodyparts)
-        self.kf.Q[self.kf.dim_z :, self.kf.dim_z :] *= 10
-        self.kf.R[self.kf.dim_z :, self.kf.dim_z :] *= 0.01
-        self.kf.P[self.kf.dim_z :, self.kf.dim_z :] *= 1000
+        self.kf = _skeleton_filter(n_bodyparts)
 
     def update(self, pose):
         flat = pose.reshape((-1, 1))
@@ -332,32 +543,7 @@ class SkeletonTracker(BaseTracker):
 class BoxTracker(BaseTracker):
     def __init__(self, bbox):
         super().__init__(dim=4, dim_z=4)
-        self.kf = KalmanFilter(dim_x=7, dim_z=4)
-        self.kf.F = np.array(
-            [
-                [1, 0, 0, 0, 1, 0, 0],
-                [0, 1, 0, 0, 0, 1, 0],
-                [0, 0, 1, 0, 0, 0, 1],
-                [0, 0, 0, 1, 0, 0, 0],
-                [0, 0, 0, 0, 1, 0, 0],
-                [0, 0, 0, 0, 0, 1, 0],
-                [0, 0, 0, 0, 0, 0, 1],
-            ]
-        )
-        self.kf.H = np.array(
-            [
-                [1, 0, 0, 0, 0, 0, 0],
-                [0, 1, 0, 0, 0, 0, 0],
-                [0, 0, 1, 0, 0, 0, 0],
-                [0, 0, 0, 1, 0, 0, 0],
-            ]
-        )
-        self.kf.R[2:, 2:] *= 10.0
-        # Give high uncertainty to the unobservable initial velocities
-        self.kf.P[4:, 4:] *= 1000.0
-        self.kf.P *= 10.0
-        self.kf.Q[-1, -1] *= 0.01
-        self.kf.Q[4:, 4:] *= 0.01
+        self.kf = _box_filter()
         self.state = bbox
 
     def update(self, bbox):
@@ -410,10 +596,130 @@ class BoxTracker(BaseTracker):
         return np.array([x, y, s, r]).reshape((4, 1))
 
 
+class BatchTracker:
+    """Constant-velocity Kalman filters of many targets, stacked into arrays.
+
+    All filters share the model of the template filter ``kf`` (state transition,
+    measurement function and noise covariances), so that the states and
+    covariances of all targets are predicted and updated in a single vectorized
+    step. Each target is otherwise handled as a :class:`BaseTracker` would.
+
+    Parameters
+    ----------
+    kf : filterpy.kalman.KalmanFilter
+        Template filter; its covariance P is the prior of every new target.
+    """
+
+    def __init__(self, kf):
+        self.F = np.asarray(kf.F, dtype=float)
+        self.H = np.asarray(kf.H, dtype=float)
+        self.Q = np.asarray(kf.Q, dtype=float)
+        self.R = np.asarray(kf.R, dtype=float)
+        self.P0 = np.asarray(kf.P, dtype=float)
+        self.dim_x = kf.dim_x
+        self.dim_z = kf.dim_z
+        self.n_trackers = 0
+        self.x = np.empty((0, self.dim_x))
+        self.P = np.empty((0, self.dim_x, self.dim_x))
+        self.id = np.empty(0, dtype=int)
+        self.labels = np.empty(0, dtype=int)
+        self.time_since_update = np.empty(0, dtype=int)
+        self.age = np.empty(0, dtype=int)
+        self.hits = np.empty(0, dtype=int)
+        self.hit_streak = np.empty(0, dtype=int)
+
+    def __len__(self):
+        return self.x.shape[0]
+
+    @property
+    def state(self):
+        return self.x[:, : self.dim_z]
+
+    def add(self, states, labels=None):
+        """Start tracking new targets at the (n, dim_z) ``states``.
+
+        ``labels`` optionally attaches an integer label (e.g., a predicted
+        identity) to each new target; it defaults to -1.
+        """
+        states = np.asarray(states, dtype=float).reshape((-1, self.dim_z))
+        n = states.shape[0]
+        x = np.zeros((n, self.dim_x))
+        x[:, : self.dim_z] = states
+        if labels is None:
+            labels = np.full(n, -1)
+        zeros = np.zeros(n, dtype=int)
+        self.x = np.concatenate((self.x, x))
+        P = np.broadcast_to(self.P0, (n, *self.P0.shape))
+        self.P = np.concatenate((self.P, P))
+        self.id = np.r_[self.id, np.arange(self.n_trackers, self.n_trackers + n)]
+        self.labels = np.r_[self.labels, labels].astype(int)
+        self.time_since_update = np.r_[self.time_since_update, zeros]
+        self.age = np.r_[self.age, zeros]
+        self.hits = np.r_[self.hits, zeros]
+        self.hit_streak = np.r_[self.hit_streak, zeros]
+        self.n_trackers += n
+
+    def remove(self, mask):
+        """Stop tracking the targets flagged in the boolean ``mask``."""
+        keep = ~np.asarray(mask, dtype=bool)
+        for attr in (
+            "x",
+            "P",
+            "id",
+            "labels",
+            "time_since_update",
+            "age",
+            "hits",
+            "hit_streak",
+        ):
+            setattr(self, attr, getattr(self, attr)[keep])
+
+    def predict(self):
+        self.x = self.x @ self.F.T
+        self.P = self.F @ self.P @ self.F.T + self.Q
+        self.age += 1
+        self.hit_streak[self.time_since_update > 0] = 0
+        self.time_since_update += 1
+        return self.state
+
+    def update(self, inds, z, observed=None):
+        """Correct the filters ``inds`` with the (n, dim_z) measurements ``z``.
+
+        ``observed`` is an optional (n, dim_z) boolean mask of the measured
+        components; the others are ignored by zeroing the corresponding rows
+        of the measurement function. Only complete measurements count as hits.
+        """
+        inds = np.asarray(inds, dtype=int)
+        if not inds.size:
+            return
+        z = np.asarray(z, dtype=float).reshape((-1, self.dim_z))
+        H = np.broadcast_to(self.H, (len(inds), *self.H.shape))
+        complete = np.ones(len(inds), dtype=bool)
+        if observed is not None:
+            H = H * observed[..., np.newaxis]
+            z = np.where(observed, z, 0)
+            complete = observed.all(axis=1)
+        x = self.x[inds]
+        P = self.P[inds]
+        HT = H.transpose((0, 2, 1))
+        y = z - (H @ x[..., np.newaxis])[..., 0]
+        PHT = P @ HT
+        S = H @ PHT + self.R
+        K = PHT @ np.linalg.inv(S)
+        self.x[inds] = x + (K @ y[..., np.newaxis])[..., 0]
+        I_KH = np.eye(self.dim_x) - K @ H
+        KT = K.transpose((0, 2, 1))
+        self.P[inds] = I_KH @ P @ I_KH.transpose((0, 2, 1)) + K @ self.R @ KT
+        hit = inds[complete]
+        self.time_since_update[hit] = 0
+        self.hits[hit] += 1
+        self.hit_streak[hit] += 1
+
+
 class SORTBase(metaclass=abc.ABCMeta):
-    def __init__(self):
+    def __init__(self, trackers):
         self.n_frames = 0
-        self.trackers = []
+        self.trackers = trackers
 
     @abc.abstractmethod
     def track(self):
@@ -426,107 +732,58 @@ class SORTEllipse(SORTBase):
         self.min_hits = min_hits
         self.iou_threshold = iou_threshold
         self.fitter = EllipseFitter(sd)
-        EllipseTracker.n_trackers = 0
-        super().__init__()
+        super().__init__(BatchTracker(_ellipse_filter()))
 
     def track(self, poses, identities=None):
         self.n_frames += 1
 
-        trackers = np.zeros((len(self.trackers), 6))
-        for i in range(len(trackers)):
-            trackers[i, :5] = self.trackers[i].predict()
-        empty = np.isnan(trackers).any(axis=1)
-        trackers = trackers[~empty]
-        for ind in np.flatnonzero(empty)[::-1]:
-            self.trackers.pop(ind)
+        trackers = self.trackers
+        if len(trackers):
+            states = trackers.predict()
+            trackers.remove(np.isnan(states).any(axis=1))
 
-        ellipses = []
+        ellipses = self.fitter.fit_batch(poses).reshape((-1, 5))
+        found = np.flatnonzero(~np.isnan(ellipses).any(axis=1))
+        ellipses = ellipses[found]
         pred_ids = []
-        for i, pose in enumerate(poses):
-            el = self.fitter.fit(pose)
-            if el is not None:
-                ellipses.append(el)
-                if identities is not None:
-                    pred_ids.append(mode(identities[i])[0][0])
+        if identities is not None:
+            pred_ids = [mode(identities[i])[0][0] for i in found]
         if not len(trackers):
             matches = np.empty((0, 2), dtype=int)
             unmatched_detections = np.arange(len(ellipses))
-            unmatched_trackers = np.empty((0, 6), dtype=int)
         else:
-            ellipses_trackers = [Ellipse(*t[:5]) for t in trackers]
-            cost_matrix = np.zeros((len(ellipses), len(ellipses_trackers)))
-            for i, el in enumerate(ellipses):
-                for j, el_track in enumerate(ellipses_trackers):
-                    cost = el.calc_similarity_with(el_track)
-                    if identities is not None:
-                        match = 2 if pred_ids[i] == self.trackers[j].id_ else 1
-                        cost *= match
-                    cost_matrix[i, j] = cost
-            row_indices, col_indices = linear_sum_assignment(cost_matrix, maximize=True)
-            unmatched_detections = [
-                i for i, _ in enumerate(ellipses) if i not in row_indices
-            ]
-            unmatched_trackers = [
-                j for j, _ in enumerate(trackers) if j not in col_indices
-            ]
-            matches = []
-            for row, col in zip(row_indices, col_indices):
-                val = cost_matrix[row, col]
-                # diff = val - cost_matrix
-                # diff[row, col] += val
-                # if (
-                #         val < self.iou_threshold
-                #         or np.any(diff[row] <= 0.2)
-                #         or np.any(diff[:, col] <= 0.2)
-                # ):
-                if val < self.iou_threshold:
-                    unmatched_detections.append(row)
-                    unmatched_trackers.append(col)
-                else:
-                    matches.append([row, col])
-            if not len(matches):
-                matches = np.empty((0, 2), dtype=int)
-            else:
-                matches = np.stack(matches)
-            unmatched_trackers = np.asarray(unmatched_trackers)
-            unmatched_detections = np.asarray(unmatched_detections)
-
-        animalindex = []
-        for t, tracker in enumerate(self.trackers):
-            if t not in unmatched_trackers:
-                ind = matches[matches[:, 1] == t, 0][0]
-                animalindex.append(ind)
-                tracker.update(ellipses[ind].parameters)
-            else:
-                animalindex.append(-1)
-
-        for i in unmatched_detections:
-            trk = EllipseTracker(ellipses[i].parameters)
+            cost_matrix = calc_pairwise_ellipse_similarity(ellipses, trackers.state)
             if identities is not None:
-                trk.id_ = mode(identities[i])[0][0]
-            self.trackers.append(trk)
-            animalindex.append(i)
-
-        i = len(self.trackers)
-        ret = []
-        for trk in reversed(self.trackers):
-            d = trk.state
-            if (trk.time_since_update < 1) and (
-                trk.hit_streak >= self.min_hits or self.n_frames <= self.min_hits
-            ):
-                ret.append(
-                    np.concatenate((d, [trk.id, int(animalindex[i - 1])])).reshape(
-                        1, -1
-                    )
-                )  # for DLC we also return the original animalid
-                # +1 as MOT benchmark requires positive >> this is removed for DLC!
-            i -= 1
-            # remove dead tracklet
-            if trk.time_since_update > self.max_age:
-                self.trackers.pop(i)
+                same_id = np.asarray(pred_ids)[:, np.newaxis] == trackers.labels
+                cost_matrix *= np.where(same_id, 2, 1)
+            row_indices, col_indices = linear_sum_assignment(cost_matrix, maximize=True)
+            valid = cost_matrix[row_indices, col_indices] >= self.iou_threshold
+            unmatched_detections = np.r_[
+                np.setdiff1d(np.arange(len(ellipses)), row_indices),
+                row_indices[~valid],
+            ].astype(int)
+            matches = np.c_[row_indices[valid], col_indices[valid]]
+
+        animalindex = np.full(len(trackers), -1)
+        animalindex[matches[:, 1]] = matches[:, 0]
+        trackers.update(matches[:, 1], ellipses[matches[:, 0]])
+
+        labels = None
+        if identities is not None:
+            labels = [pred_ids[i] for i in unmatched_detections]
+        trackers.add(ellipses[unmatched_detections], labels)
+        animalindex = np.r_[animalindex, unmatched_detections]
+
+        visible = (trackers.time_since_update < 1) & (
+            (trackers.hit_streak >= self.min_hits) | (self.n_frames <= self.min_hits)
+        )
+        # For DLC we also return the original animalid
+        ret = np.c_[trackers.state, trackers.id, animalindex][visible][::-1]
+        # Remove dead tracklets
+        trackers.remove(trackers.time_since_update > self.max_age)
 
         if len(ret) > 0:
-            return np.concatenate(ret)
+            return ret
         return np.empty((0, 7))
 
 
@@ -536,8 +793,7 @@ class SORTSkeleton(SORTBase):
         self.max_age = max_age
         self.min_hits = min_hits
         self.oks_threshold = oks_threshold
-        SkeletonTracker.n_trackers = 0
-        super().__init__()
+        super().__init__(BatchTracker(_skeleton_filter(n_bodyparts)))
 
     @staticmethod
     def weighted_hausdorff(x, y):
@@ -573,81 +829,68 @@ class SORTSkeleton(SORTBase):
         return np.mean(oks)
 
     def calc_pairwise_hausdorff_dist(self, poses, poses_ref):
-        mat = np.zeros((len(poses), len(poses_ref)))
-        for i, pose in enumerate(poses):
-            for j, pose_ref in enumerate(poses_ref):
-                mat[i, j] = self.weighted_hausdorff(pose, pose_ref)
-        return mat
+        # Vectorized weighted_hausdorff over all pairs of poses;
+        # missing keypoints are ignored.
+        x = np.asarray(poses, dtype=float)[:, np.newaxis, :, np.newaxis]
+        y = np.asarray(poses_ref, dtype=float)[np.newaxis, :, np.newaxis]
+        d = ((x - y) ** 2).sum(axis=-1)
+        cmin = np.where(np.isnan(d), np.inf, d).min(axis=3, initial=np.inf)
+        cmin[np.isinf(cmin)] = 0
+        return np.sqrt(cmin.max(axis=2, initial=0))
 
     def calc_pairwise_oks(self, poses, poses_ref):
-        mat = np.zeros((len(poses), len(poses_ref)))
-        for i, pose in enumerate(poses):
-            for j, pose_ref in enumerate(poses_ref):
-                mat[i, j] = self.object_keypoint_similarity(pose, pose_ref)
-        return mat
+        # Vectorized object_keypoint_similarity over all pairs of poses
+        x = np.asarray(poses, dtype=float)[:, np.newaxis]
+        y = np.asarray(poses_ref, dtype=float)[np.newaxis]
+        mask = ~np.isnan(x * y).all(axis=3)  # Intersection visible keypoints
+        dist = np.linalg.norm(x - y, axis=3)
+        mask_ = mask[..., np.newaxis]
+        ptp = np.where(mask_, y, -np.inf).max(axis=2) - np.where(
+            mask_, y, np.inf
+        ).min(axis=2)
+        scale = np.sqrt(np.prod(ptp, axis=2))  # square root of bounding box area
+        with np.errstate(divide="ignore", invalid="ignore"):
+            oks = np.exp(-0.5 * (dist / (0.05 * scale[..., np.newaxis])) ** 2)
+            return np.where(mask, oks, 0).sum(axis=2) / mask.sum(axis=2)
+
+    def _init_states(self, poses):
+        # Missing keypoints start at the centroid of the visible ones
+        poses = np.asarray(poses, dtype=float)
+        empty = np.isnan(poses).all(axis=2, keepdims=True)
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", category=RuntimeWarning)
+            fill = np.nanmean(poses, axis=1, keepdims=True)
+        return np.where(empty, fill, poses).reshape((-1, poses.shape[1] * 2))
 
     def track(self, poses):
         self.n_frames += 1
 
-        if not len(self.trackers):
-            for pose in poses:
-                tracker = SkeletonTracker(self.n_bodyparts)
-                tracker.state = pose
-                self.trackers.append(tracker)
+        poses = np.asarray(poses, dtype=float).reshape((-1, self.n_bodyparts, 2))
+        trackers = self.trackers
+        if not len(trackers):
+            trackers.add(self._init_states(poses))
 
-        poses_ref = []
-        for i, tracker in enumerate(self.trackers):
-            pose_ref = tracker.predict()
-            poses_ref.append(pose_ref.reshape((-1, 2)))
+        poses_ref = trackers.predict().reshape((-1, self.n_bodyparts, 2))
 
         # mat = self.calc_pairwise_oks(poses, poses_ref)
         mat = self.calc_pairwise_hausdorff_dist(poses, poses_ref)
         row_indices, col_indices = linear_sum_assignment(mat, maximize=False)
+        unmatched_poses = np.setdiff1d(np.arange(len(poses)), row_indices)
 
-        unmatched_poses = [p for p, _ in enumerate(poses) if p not in row_indices]
-        unmatched_trackers = [
-            t for t, _ in enumerate(poses_ref) if t not in col_indices
-        ]
-        # Remove matched detections with low OKS
-        # matches = []
-        # for row, col in zip(row_indices, col_indices):
-        #     if mat[row, col] < self.oks_threshold:
-        #         unmatched_poses.append(row)
-        #         unmatched_trackers.append(col)
-        #     else:
-        #         matches.append([row, col])
-        # if not len(matches):
-        #     matches = np.empty((0, 2), dtype=int)
-        # else:
-        #     matches = np.stack(matches)
-        matches = np.c_[row_indices, col_indices]
-
-        animalindex = []
-        for t, tracker in enumerate(self.trackers):
-            if t not in unmatched_trackers:
-                ind = matches[matches[:, 1] == t, 0][0]
-                animalindex.append(ind)
-                tracker.update(poses[ind])
-            else:
-                animalindex.append(-1)
-
-        for i in unmatched_poses:
-            tracker = SkeletonTracker(self.n_bodyparts)
-            tracker.state = poses[i]
-            self.trackers.append(tracker)
-            animalindex.append(i)
-
-        states = []
-        i = len(self.trackers)
-        for tracker in reversed(self.trackers):
-            i -= 1
-            if tracker.time_since_update > self.max_age:
-                self.trackers.pop()
-                continue
-            state = tracker.predict()
-            states.append(np.r_[state, [tracker.id, int(animalindex[i])]])
-        if len(states) > 0:
-            return np.stack(states)
+        animalindex = np.full(len(trackers), -1)
+        animalindex[col_indices] = row_indices
+        flat = poses[row_indices].reshape((-1, self.n_bodyparts * 2))
+        trackers.update(col_indices, flat, observed=~np.isnan(flat))
+
+        trackers.add(self._init_states(poses[unmatched_poses]))
+        animalindex = np.r_[animalindex, unmatched_poses]
+
+        dead = trackers.time_since_update > self.max_age
+        trackers.remove(dead)
+        states = trackers.predict()
+        ret = np.c_[states, trackers.id, animalindex[~dead]][::-1]
+        if len(ret) > 0:
+            return ret
         return np.empty((0, self.n_bodyparts * 2 + 2))
 
 
@@ -656,60 +899,65 @@ class SORTBox(SORTBase):
         self.max_age = max_age
         self.min_hits = min_hits
         self.iou_threshold = iou_threshold
-        BoxTracker.n_trackers = 0
-        super().__init__()
+        super().__init__(BatchTracker(_box_filter()))
+
+    @staticmethod
+    def convert_x_to_bboxes(x):
+        """Vectorized :meth:`BoxTracker.convert_x_to_bbox` of (n, >=4) states."""
+        w = np.sqrt(x[:, 2] * x[:, 3])
+        h = x[:, 2] / w
+        return np.c_[
+            x[:, 0] - w / 2.0, x[:, 1] - h / 2.0, x[:, 0] + w / 2.0, x[:, 1] + h / 2.0
+        ]
+
+    @staticmethod
+    def convert_bboxes_to_z(bboxes):
+        """Vectorized :meth:`BoxTracker.convert_bbox_to_z` of (n, >=4) boxes."""
+        w = bboxes[:, 2] - bboxes[:, 0]
+        h = bboxes[:, 3] - bboxes[:, 1]
+        return np.c_[bboxes[:, 0] + w / 2.0, bboxes[:, 1] + h / 2.0, w * h, w / h]
 
     def track(self, dets):
         self.n_frames += 1
 
-        trackers = np.zeros((len(self.trackers), 5))
-        for i in range(len(trackers)):
-            trackers[i, :4] = self.trackers[i].predict()
-        empty = np.isnan(trackers).any(axis=1)
-        trackers = trackers[~empty]
-        for ind in np.flatnonzero(empty)[::-1]:
-            self.trackers.pop(ind)
+        dets = np.asarray(dets, dtype=float)
+        trackers = self.trackers
+        if len(trackers):
+            x = trackers.x
+            x[x[:, 6] + x[:, 2] <= 0, 6] *= 0.0
+            trackers.predict()
+            bboxes = self.convert_x_to_bboxes(trackers.x)
+            empty = np.isnan(bboxes).any(axis=1)
+            trackers.remove(empty)
+            bboxes = bboxes[~empty]
+        else:
+            bboxes = np.empty((0, 4))
 
-        matched, unmatched_dets, unmatched_trks = self.match_detections_to_trackers(
-            dets, trackers, self.iou_threshold
+        matched, unmatched_dets, _ = self.match_detections_to_trackers(
+            dets, bboxes, self.iou_threshold
         )
 
         # update matched trackers with assigned detections
-        animalindex = []
-        for t, trk in enumerate(self.trackers):
-            if t not in unmatched_trks:
-                d = matched[np.where(matched[:, 1] == t)[0], 0]
-                animalindex.append(d[0])
-                trk.update(dets[d, :][0])  # update coordinates
-            else:
-                animalindex.append("nix")  # lost trk!
+        animalindex = np.full(len(trackers), -1)  # -1 for lost trackers
+        animalindex[matched[:, 1]] = matched[:, 0]
+        trackers.update(matched[:, 1], self.convert_bboxes_to_z(dets[matched[:, 0]]))
 
         # create and initialise new trackers for unmatched detections
-        for i in unmatched_dets:
-            trk = BoxTracker(dets[i, :])
-            self.trackers.append(trk)
-            animalindex.append(i)
-
-        i = len(self.trackers)
-        ret = []
-        for trk in reversed(self.trackers):
-            d = trk.state
-            if (trk.time_since_update < 1) and (
-                trk.hit_streak >= self.min_hits or self.n_frames <= self.min_hits
-            ):
-                ret.append(
-                    np.concatenate((d, [trk.id, int(animalindex[i - 1])])).reshape(
-                        1, -1
-                    )
-                )  # for DLC we also return the original animalid
-                # +1 as MOT benchmark requires positive >> this is removed for DLC!
-            i -= 1
-            # remove dead tracklet
-            if trk.time_since_update > self.max_age:
-                self.trackers.pop(i)
+        unmatched_dets = np.asarray(unmatched_dets, dtype=int)
+        trackers.add(self.convert_bboxes_to_z(dets[unmatched_dets]))
+        animalindex = np.r_[animalindex, unmatched_dets]
+
+        visible = (trackers.time_since_update < 1) & (
+            (trackers.hit_streak >= self.min_hits) | (self.n_frames <= self.min_hits)
+        )
+        # For DLC we also return the original animalid
+        ret = np.c_[self.convert_x_to_bboxes(trackers.x), trackers.id, animalindex]
+        ret = ret[visible][::-1]
+        # Remove dead tracklets
+        trackers.remove(trackers.time_since_update > self.max_age)
 
         if len(ret) > 0:
-            return np.concatenate(ret)
+            return ret
         return np.empty((0, 5))
 
     @staticmethod
@@ -725,35 +973,21 @@ class SORTBox(SORTBase):
                 np.arange(len(detections)),
                 np.empty((0, 5), dtype=int),
             )
-        iou_matrix = np.zeros((len(detections), len(trackers)), dtype=np.float32)
-
-        for d, det in enumerate(detections):
-            for t, trk in enumerate(trackers):
-                iou_matrix[d, t] = calc_iou(det, trk)
+        iou_matrix = calc_pairwise_iou(detections, trackers).astype(np.float32)
         row_indices, col_indices = linear_sum_assignment(-iou_matrix)
 
-        unmatched_detections = []
-        for d, det in enumerate(detections):
-            if d not in row_indices:
-                unmatched_detections.append(d)
-        unmatched_trackers = []
-        for t, trk in enumerate(trackers):
-            if t not in col_indices:
-                unmatched_trackers.append(t)
-
         # filter out matched with low IOU
-        matches = []
-        for row, col in zip(row_indices, col_indices):
-            if iou_matrix[row, col] < iou_threshold:
-                unmatched_detections.append(row)
-                unmatched_trackers.append(col)
-            else:
-                matches.append([row, col])
-        if not len(matches):
-            matches = np.empty((0, 2), dtype=int)
-        else:
-            matches = np.stack(matches)
-        return matches, np.array(unmatched_detections), np.array(unmatched_trackers)
+        valid = iou_matrix[row_indices, col_indices] >= iou_threshold
+        unmatched_detections = np.r_[
+            np.setdiff1d(np.arange(len(detections)), row_indices),
+            row_indices[~valid],
+        ]
+        unmatched_trackers = np.r_[
+            np.setdiff1d(np.arange(len(trackers)), col_indices),
+            col_indices[~valid],
+        ]
+        matches = np.c_[row_indices[valid], col_indices[valid]]
+        return matches, unmatched_detections, unmatched_trackers
 
 
 def fill_tracklets(tracklets, trackers, animals, imname):
@@ -769,6 +1003,200 @@ def fill_tracklets(tracklets, trackers, animals, imname):
             tracklets[tracklet_id][imname] = pred
 
 
+class TrackletBuilder:
+    """Assemble and track the detections of a video frame by frame.
+
+    A builder stands in for the store that the detections of a video are
+    written to during inference (see ``GetPoseandCostsF`` in
+    ``predict_multianimal``): each frame is assembled into individuals and
+    tracked as soon as it is predicted, so tracklets are ready when the analysis
+    finishes and the full detections need not be kept at all.
+    ``convert_detections2tracklets`` tracks offline assemblies with the same
+    :meth:`track` method.
+
+    Parameters
+    ----------
+    cfg : dict
+        Project configuration.
+
+    inferencecfg : dict
+        Inference configuration, as read from inference_cfg.yaml.
+
+    track_method : str, optional (default="ellipse")
+        Either 'box', 'skeleton', or 'ellipse'.
+
+    greedy, window_size, identity_only : optional
+        Assembly parameters; see :class:`~deeplabcut.pose_estimation_tensorflow.lib.inferenceutils.Assembler`.
+
+    ignore_bodyparts : list, optional (default=None)
+        Multi-animal body parts that should be ignored during tracking.
+
+    train_data_file : str, optional (default=None)
+        If given, the assembly is calibrated on these training data.
+
+    keep_detections : bool, optional (default=True)
+        Whether frames are also forwarded to the store the builder is opened
+        with, so the full detections can still be saved.
+    """
+
+    def __init__(
+        self,
+        cfg,
+        inferencecfg,
+        track_method="ellipse",
+        greedy=False,
+        window_size=0,
+        identity_only=False,
+        ignore_bodyparts=None,
+        train_data_file=None,
+        keep_detections=True,
+    ):
+        if track_method not in TRACK_METHODS:
+            raise ValueError(f"Unknown {track_method} tracker.")
+        self.inferencecfg = inferencecfg
+        self.track_method = track_method
+        self.greedy = greedy
+        self.window_size = window_size
+        self.identity_only = identity_only
+        self.train_data_file = train_data_file
+        self.keep_detections = keep_detections
+        self.multi_bpts = cfg["multianimalbodyparts"]
+        keep = set(self.multi_bpts).difference(ignore_bodyparts or [])
+        self.keep_inds = sorted(self.multi_bpts.index(bpt) for bpt in keep)
+        if track_method == "box":
+            self.tracker = SORTBox(
+                inferencecfg["max_age"],
+                inferencecfg["min_hits"],
+                inferencecfg.get("oks_threshold", 0.3),
+            )
+        elif track_method == "skeleton":
+            self.tracker = SORTSkeleton(
+                len(self.keep_inds),
+                inferencecfg["max_age"],
+                inferencecfg["min_hits"],
+                inferencecfg.get("oks_threshold", 0.5),
+            )
+        else:
+            self.tracker = SORTEllipse(
+                inferencecfg.get("max_age", 1),
+                inferencecfg.get("min_hits", 1),
+                inferencecfg.get("iou_threshold", 0.6),
+            )
+        self.tracklets = dict()
+        if cfg["uniquebodyparts"]:
+            self.tracklets["single"] = dict()
+        if inferencecfg["topktoretain"] == 1:
+            self.tracklets[0] = dict()
+        self.metadata = None
+        self.assembler = None
+        self.store = None
+        self._imnames = []
+
+    def open(self, store, metadata):
+        """Start forwarding frames to ``store``, which holds these ``metadata``.
+
+        Frames already on the store (e.g., on the shelf of a resumed analysis)
+        are tracked first. Returns the builder, to be written to instead of
+        the store.
+        """
+        self.metadata = metadata
+        frames = sorted(key for key in store.keys() if key.startswith("frame"))
+        for key in frames:
+            self.add(key, store[key])
+        if self.keep_detections:
+            self.store = store
+        return self
+
+    def __setitem__(self, key, value):
+        if self.store is not None:
+            self.store[key] = value
+        if key == "metadata":
+            self.metadata = value
+        else:
+            self.add(key, value)
+
+    def keys(self):
+        return ["metadata", *self._imnames]
+
+    def _make_assembler(self, imname, frame):
+        assembler = Assembler(
+            {"metadata": self.metadata, imname: frame},
+            max_n_individuals=self.inferencecfg["topktoretain"],
+            n_multibodyparts=len(self.multi_bpts),
+            greedy=self.greedy,
+            pcutoff=self.inferencecfg.get("pcutoff", 0.1),
+            min_affinity=self.inferencecfg.get("pafthreshold", 0.05),
+            window_size=self.window_size,
+            identity_only=self.identity_only,
+        )
+        if self.train_data_file is not None:
+            assembler.calibrate(self.train_data_file)
+        return assembler
+
+    def add(self, imname, frame):
+        """Assemble and track the detections ``frame`` of image ``imname``."""
+        if self.assembler is None:
+            self.assembler = self._make_assembler(imname, frame)
+        # Frames are passed one at a time; none is kept
+        assemblies, unique = self.assembler.assemble_frame(frame, len(self._imnames))
+        self._imnames.append(imname)
+        self.track(imname, assemblies, unique)
+
+    def track(self, imname, assemblies, unique=None):
+        """Track the assemblies (and unique body parts) of image ``imname``."""
+        if unique is not None and "single" in self.tracklets:
+            imindex = int(re.findall(r"\d+", imname)[0])
+            self.tracklets["single"][imindex] = unique
+        if not assemblies:
+            return
+        if self.inferencecfg["topktoretain"] == 1:
+            self.tracklets[0][imname] = assemblies[0].data
+            return
+        animals = np.stack([assembly.data for assembly in assemblies])
+        if not self.identity_only:
+            if self.track_method == "box":
+                xy = calc_bboxes_from_keypoints(
+                    animals[:, self.keep_inds],
+                    self.inferencecfg["boundingboxslack"],
+                )  # TODO: get cropping parameters and utilize!
+            else:
+                xy = animals[:, self.keep_inds, :2]
+            trackers = self.tracker.track(xy)
+        else:
+            # Optimal identity assignment based on soft voting
+            mat = np.zeros((len(assemblies), self.inferencecfg["topktoretain"]))
+            for nrow, assembly in enumerate(assemblies):
+                for k, v in assembly.soft_identity.items():
+                    mat[nrow, k] = v
+            inds = linear_sum_assignment(mat, maximize=True)
+            trackers = np.c_[inds][:, ::-1]
+        fill_tracklets(self.tracklets, trackers, animals, imname)
+
+    def to_pickle(self, output_path, scorer, joint_names):
+        """Write the tracklets, with their column header, to ``output_path``."""
+        bodypartlabels = [bpt for bpt in joint_names for _ in range(3)]
+        scorers = len(bodypartlabels) * [scorer]
+        xylvalue = len(joint_names) * ["x", "y", "likelihood"]
+        self.tracklets["header"] = pd.MultiIndex.from_arrays(
+            np.vstack([scorers, bodypartlabels, xylvalue]),
+            names=["scorer", "bodyparts", "coords"],
+        )
+        with open(output_path, "wb") as f:
+            pickle.dump(self.tracklets, f, pickle.HIGHEST_PROTOCOL)
+
+    def save(self, dataname, scorer, joint_names):
+        """Write the assemblies and tracklets next to the video's ``dataname``.
+
+        Returns the path to the tracklets.
+        """
+        prefix = dataname.split(".h5")[0]
+        if self.assembler is not None:
+            self.assembler.to_pickle(prefix + "_assemblies.pickle")
+        trackname = prefix + TRACK_METHODS[self.track_method] + ".pickle"
+        self.to_pickle(trackname, scorer, joint_names)
+        return trackname
+
+
 def calc_bboxes_from_keypoints(data, slack=0, offset=0):
     data = np.asarray(data)
     if data.shape[-1] < 3:
@@ -794,10 +1222,7 @@ def reconstruct_all_ellipses(data, sd):
     fitter = EllipseFitter(sd)
     for n, animal in enumerate(animals):
         data = xy.xs(animal, axis=1, level="individuals").values.reshape((nrows, -1, 2))
-        for i, coords in enumerate(tqdm(data)):
-            el = fitter.fit(coords.astype(np.float64))
-            if el is not None:
-                ellipses[n, i] = el.parameters
+        ellipses[n] = fitter.fit_batch(data)
     return ellipses
 
 
@@ -21,6 +21,11 @@ from skimage.util import img_as_ubyte
 from tqdm import tqdm
 
 from deeplabcut.pose_estimation_tensorflow.core import predict_multianimal as predict
+from deeplabcut.pose_estimation_tensorflow.lib.detectionutils import (
+    DetectionStore,
+    DetectionTableWriter,
+)
+from deeplabcut.pose_estimation_tensorflow.lib.trackingutils import TrackletBuilder
 from deeplabcut.utils import auxiliaryfunctions, auxfun_multianimal
 from deeplabcut.utils.auxfun_videos import VideoWriter
 import pickle
@@ -118,8 +123,19 @@ def AnalyzeMultiAnimalVideo(
     destfolder=None,
     robust_nframes=False,
     use_shelve=False,
+    tracklet_builder=None,
 ):
-    """Helper function for analyzing a video with multiple individuals"""
+    """Helper function for analyzing a video with multiple individuals
+
+    Raw detections are appended during inference to a chunked
+    ``detectionutils.DetectionStore`` ("_full.detections" directory), or to a
+    legacy "_full.pickle" shelf if ``use_shelve`` is True; either way, an
+    interrupted analysis resumes from the frames already stored.
+
+    If a ``tracklet_builder`` (see ``trackingutils.TrackletBuilder``) is given,
+    detections are assembled and tracked as they are predicted, and the
+    assemblies and tracklets are saved along with the video analysis.
+    """
 
     print("Starting to analyze % ", video)
     vname = Path(video).stem
@@ -129,7 +145,8 @@ def AnalyzeMultiAnimalVideo(
     auxiliaryfunctions.attempt_to_make_folder(destfolder)
     dataname = os.path.join(destfolder, vname + DLCscorer + ".h5")
 
-    if os.path.isfile(dataname.split(".h5")[0] + "_full.pickle"):
+    # Metadata are written last, so an interrupted analysis can be resumed
+    if os.path.isfile(dataname.split(".h5")[0] + "_meta.pickle"):
         print("Video already analyzed!", dataname)
     else:
         print("Loading ", video)
@@ -164,10 +181,13 @@ def AnalyzeMultiAnimalVideo(
             "Starting to extract posture from the video(s) with batchsize:",
             dlc_cfg["batch_size"],
         )
-        if use_shelve:
+        keep_detections = tracklet_builder is None or tracklet_builder.keep_detections
+        if not keep_detections:
+            shelf_path = ""
+        elif use_shelve:
             shelf_path = dataname.split(".h5")[0] + "_full.pickle"
         else:
-            shelf_path = ""
+            shelf_path = dataname.split(".h5")[0] + "_full.detections"
         if int(dlc_cfg["batch_size"]) > 1:
             PredicteData, nframes = GetPoseandCostsF(
                 cfg,
@@ -179,6 +199,7 @@ def AnalyzeMultiAnimalVideo(
                 nframes,
                 int(dlc_cfg["batch_size"]),
                 shelf_path,
+                tracklet_builder,
             )
         else:
             PredicteData, nframes = GetPoseandCostsS(
@@ -190,6 +211,7 @@ def AnalyzeMultiAnimalVideo(
                 vid,
                 nframes,
                 shelf_path,
+                tracklet_builder,
             )
 
         stop = time.time()
@@ -217,7 +239,13 @@ def AnalyzeMultiAnimalVideo(
         metadata = {"data": dictionary}
         print("Video Analyzed. Saving results in %s..." % (destfolder))
 
-        if use_shelve:
+        if tracklet_builder is not None:
+            trackname = tracklet_builder.save(
+                dataname, DLCscorer, dlc_cfg["all_joints_names"]
+            )
+            print("Tracklets saved in", trackname)
+
+        if shelf_path or PredicteData is None:
             metadata_path = dataname.split(".h5")[0] + "_meta.pickle"
             with open(metadata_path, "wb") as f:
                 pickle.dump(metadata, f, pickle.HIGHEST_PROTOCOL)
@@ -362,6 +390,65 @@ def GetPoseandCostsF_from_assemblies(
     return PredicteData, nframes
 
 
+def _open_detection_store(shelf_path, dlc_cfg, nframes, tracklet_builder=None):
+    """Open the store of per-frame detections and find the first frame to analyze.
+
+    Frames are written in order to a legacy shelf (".pickle" path) or to a
+    chunked DetectionStore (any other path), so an interrupted analysis resumes
+    right after the last frame found on it. Without path, detections are
+    collected in memory into the columns of a DetectionTable. With a tracklet
+    builder, frames are written to the builder, which assembles and tracks them
+    and forwards them to the store if detections are to be kept.
+    """
+    if shelf_path.endswith(".pickle"):
+        db = shelve.open(
+            shelf_path,
+            protocol=pickle.DEFAULT_PROTOCOL,
+        )
+    elif shelf_path:
+        db = DetectionStore(shelf_path)
+    elif tracklet_builder is not None and not tracklet_builder.keep_detections:
+        db = dict()
+    else:
+        db = DetectionTableWriter()
+    start = 1 + max(
+        (int(key[5:]) for key in db.keys() if key.startswith("frame")), default=-1
+    )
+    if start:
+        print(f"Resuming analysis from frame {start}.")
+    metadata = {
+        "nms radius": dlc_cfg["nmsradius"],
+        "minimal confidence": dlc_cfg["minconfidence"],
+        "sigma": dlc_cfg.get("sigma", 1),
+        "PAFgraph": dlc_cfg["partaffinityfield_graph"],
+        "PAFinds": dlc_cfg.get(
+            "paf_best", np.arange(len(dlc_cfg["partaffinityfield_graph"]))
+        ),
+        "all_joints": [[i] for i in range(len(dlc_cfg["all_joints"]))],
+        "all_joints_names": [
+            dlc_cfg["all_joints_names"][i] for i in range(len(dlc_cfg["all_joints"]))
+        ],
+        "nframes": nframes,
+    }
+    db["metadata"] = metadata
+    if tracklet_builder is not None:
+        db = tracklet_builder.open(db, metadata)
+    return db, start
+
+
+def _close_detection_store(db):
+    if isinstance(db, TrackletBuilder):
+        db = db.store
+    if db is None:
+        return None
+    if isinstance(db, DetectionTableWriter):
+        return db.to_table()
+    if isinstance(db, DetectionStore):
+        return db.close()
+    db.close()
+    return db
+
+
 def GetPoseandCostsF(
     cfg,
     dlc_cfg,
@@ -372,6 +459,7 @@ def GetPoseandCostsF(
     nframes,
     batchsize,
     shelf_path,
+    tracklet_builder=None,
 ):
     """Batchwise prediction of pose"""
     strwidth = int(np.ceil(np.log10(nframes)))  # width for strings
@@ -384,38 +472,17 @@ def GetPoseandCostsF(
     frames = np.empty(
         (batchsize, ny, nx, 3), dtype="ubyte"
     )  # this keeps all frames in a batch
-    pbar = tqdm(total=nframes)
-    counter = 0
     inds = []
 
-    if shelf_path:
-        db = shelve.open(
-            shelf_path,
-            protocol=pickle.DEFAULT_PROTOCOL,
-        )
-    else:
-        db = dict()
-    db["metadata"] = {
-        "nms radius": dlc_cfg["nmsradius"],
-        "minimal confidence": dlc_cfg["minconfidence"],
-        "sigma": dlc_cfg.get("sigma", 1),
-        "PAFgraph": dlc_cfg["partaffinityfield_graph"],
-        "PAFinds": dlc_cfg.get(
-            "paf_best", np.arange(len(dlc_cfg["partaffinityfield_graph"]))
-        ),
-        "all_joints": [[i] for i in range(len(dlc_cfg["all_joints"]))],
-        "all_joints_names": [
-            dlc_cfg["all_joints_names"][i] for i in range(len(dlc_cfg["all_joints"]))
-        ],
-        "nframes": nframes,
-    }
+    db, counter = _open_detection_store(
+        shelf_path, dlc_cfg, nframes, tracklet_builder
+    )
+    if counter:
+        cap.set_to_frame(counter)
+    pbar = tqdm(total=nframes, initial=counter)
     while cap.video.isOpened():
         frame = cap.read_frame(crop=cfg["cropping"])
-        key = "frame" + str(counter).zfill(strwidth)
         if frame is not None:
-            # Avoid overwriting data already on the shelf
-            if isinstance(db, shelve.Shelf) and key in db:
-                continue
             frame = img_as_ubyte(frame)
             if frame.shape[-1] == 4:
                 frame = rgba2rgb(frame)
@@ -455,49 +522,35 @@ def GetPoseandCostsF(
 
     cap.close()
     pbar.close()
-    try:
-        db.close()
-    except AttributeError:
-        pass
-    return db, nframes
+    return _close_detection_store(db), nframes
 
 
-def GetPoseandCostsS(cfg, dlc_cfg, sess, inputs, outputs, cap, nframes, shelf_path):
+def GetPoseandCostsS(
+    cfg,
+    dlc_cfg,
+    sess,
+    inputs,
+    outputs,
+    cap,
+    nframes,
+    shelf_path,
+    tracklet_builder=None,
+):
     """Non batch wise pose estimation for video cap."""
     strwidth = int(np.ceil(np.log10(nframes)))  # width for strings
     if cfg["cropping"]:
         cap.set_bbox(cfg["x1"], cfg["x2"], cfg["y1"], cfg["y2"])
 
-    if shelf_path:
-        db = shelve.open(
-            shelf_path,
-            protocol=pickle.DEFAULT_PROTOCOL,
-        )
-    else:
-        db = dict()
-    db["metadata"] = {
-        "nms radius": dlc_cfg["nmsradius"],
-        "minimal confidence": dlc_cfg["minconfidence"],
-        "sigma": dlc_cfg.get("sigma", 1),
-        "PAFgraph": dlc_cfg["partaffinityfield_graph"],
-        "PAFinds": dlc_cfg.get(
-            "paf_best", np.arange(len(dlc_cfg["partaffinityfield_graph"]))
-        ),
-        "all_joints": [[i] for i in range(len(dlc_cfg["all_joints"]))],
-        "all_joints_names": [
-            dlc_cfg["all_joints_names"][i] for i in range(len(dlc_cfg["all_joints"]))
-        ],
-        "nframes": nframes,
-    }
-    pbar = tqdm(total=nframes)
-    counter = 0
+    db, counter = _open_detection_store(
+        shelf_path, dlc_cfg, nframes, tracklet_builder
+    )
+    if counter:
+        cap.set_to_frame(counter)
+    pbar = tqdm(total=nframes, initial=counter)
     while cap.video.isOpened():
         frame = cap.read_frame(crop=cfg["cropping"])
         key = "frame" + str(counter).zfill(strwidth)
         if frame is not None:
-            # Avoid overwriting data already on the shelf
-            if isinstance(db, shelve.Shelf) and key in db:
-                continue
             frame = img_as_ubyte(frame)
             if frame.shape[-1] == 4:
                 frame = rgba2rgb(frame)
@@ -518,8 +571,4 @@ def GetPoseandCostsS(cfg, dlc_cfg, sess, inputs, outputs, cap, nframes, shelf_pa
         pbar.update(1)
 
     pbar.close()
-    try:
-        db.close()
-    except AttributeError:
-        pass
-    return db, nframes
+    return _close_detection_store(db), nframes
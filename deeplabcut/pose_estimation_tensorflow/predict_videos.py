@@ -18,7 +18,6 @@ import argparse
 import os
 import os.path
 import pickle
-import re
 import time
 import warnings
 from pathlib import Path
@@ -27,7 +26,6 @@ import cv2
 import numpy as np
 import pandas as pd
 import tensorflow as tf
-from scipy.optimize import linear_sum_assignment
 from skimage.util import img_as_ubyte
 from tqdm import tqdm
 
@@ -37,6 +35,10 @@ from deeplabcut.pose_estimation_tensorflow.lib import inferenceutils, trackingut
 
 from deeplabcut.refine_training_dataset.stitch import stitch_tracklets
 from deeplabcut.utils import auxiliaryfunctions, auxfun_multianimal, auxfun_models
+from deeplabcut.utils.auxfun_videos import (
+    BatchedFrameReader,
+    InterleavedFrameReader,
+)
 from deeplabcut.pose_estimation_tensorflow.core.openvino.session import (
     GetPoseF_OV,
     is_openvino_available,
@@ -288,6 +290,14 @@ def analyze_videos(
     calibrate=False,
     identity_only=False,
     use_openvino="CPU" if is_openvino_available else None,
+    n_concurrent_videos=1,
+    checkpoint_every=None,
+    low_memory=False,
+    use_float32=False,
+    keyframe_interval=None,
+    keyframe_motion_threshold=None,
+    track_online=False,
+    save_detections=True,
 ):
     """Makes prediction based on a trained network.
 
@@ -356,12 +366,18 @@ def analyze_videos(
         Mert Yüksekgönül, Byron Rogers, Matthias Bethge, Mackenzie W. Mathis.
         Source: https://arxiv.org/abs/1909.11229
 
-    dynamic: tuple(bool, float, int) triple containing (state, detectiontreshold, margin)
+    dynamic: tuple(bool, float, int[, float]) containing (state, detectiontreshold, margin[, downscale])
         If the state is true, then dynamic cropping will be performed. That means that if an object is detected (i.e. any body part > detectiontreshold),
         then object boundaries are computed according to the smallest/largest x position and smallest/largest y position of all body parts. This  window is
         expanded by the margin and from then on only the posture within this crop is analyzed (until the object is lost, i.e. <detectiontreshold). The
         current position is utilized for updating the crop window for the next frame (this is why the margin is important and should be set large
         enough given the movement of the animal).
+        Frames are analyzed one at a time, unless a ``batchsize`` > 1 is explicitly passed (the batch size of the config is ignored in this mode):
+        crop windows for the frames of a batch are then extrapolated from the last detection with a constant-velocity motion model and
+        analyzed together; frames in which the animal is lost are re-analyzed on the full frame.
+        An optional fourth element, e.g. ``(True, 0.5, 10, 4)``, sets a downscaling factor: whenever the animal has to be searched for on the
+        full frame, it is first located on a copy of the frame downscaled by this factor, and only a full resolution crop around it is
+        analyzed. This considerably speeds up the analysis of large frames with a small animal.
 
     modelprefix: str, optional, default=""
         Directory containing the deeplabcut models to use when evaluating the network.
@@ -379,10 +395,11 @@ def analyze_videos(
         See issue: https://forum.image.sc/t/how-to-stop-running-out-of-vram/30551/2
 
     use_shelve: bool, optional, default=False
-        By default, data are dumped in a pickle file at the end of the video analysis.
-        Otherwise, data are written to disk on the fly using a "shelf"; i.e., a
-        pickle-based, persistent, database-like object by default, resulting in
-        constant memory footprint.
+        By default, the raw detections of multi-animal videos are written to disk
+        on the fly, in chunks, to a "_full.detections" directory of memory-mappable
+        arrays, resulting in constant memory footprint.
+        If ``True``, they are instead written to a legacy "_full.pickle" "shelf";
+        i.e., a pickle-based, persistent, database-like object.
 
     The following parameters are only relevant for multi-animal projects:
 
@@ -414,6 +431,59 @@ def analyze_videos(
     use_openvino: str, optional
         Use "CPU" for inference if OpenVINO is available in the Python environment.
 
+    n_concurrent_videos: int, optional, default=1
+        Number of single-animal videos decoded concurrently. If greater than 1,
+        frames from different videos are interleaved into the same inference
+        batches, which considerably speeds up the analysis of many short clips.
+        Only supported with ``batchsize`` > 1, without dynamic cropping or OpenVINO;
+        videos are analyzed one at a time if ``checkpoint_every``, ``low_memory`` or
+        ``keyframe_interval`` is given.
+
+    checkpoint_every: int or None, optional, default=None
+        If an integer is given, predictions of single-animal videos are checkpointed
+        to disk every ``checkpoint_every`` frames, and an interrupted analysis
+        resumes from the last checkpoint (rather than from the first frame) when
+        the video is analyzed again. Not supported with dynamic cropping or OpenVINO,
+        and takes precedence over ``n_concurrent_videos``. Multi-animal analyses
+        resume from the detections already stored.
+
+    low_memory: bool, optional, default=False
+        If ``True``, predictions of single-animal videos are written to a
+        memory-mapped file on disk rather than kept in RAM, and the .h5 file is
+        written in chunks; memory use then no longer grows with the video length.
+        Not supported with dynamic cropping or OpenVINO, and takes precedence over
+        ``n_concurrent_videos``.
+
+    use_float32: bool, optional, default=False
+        Store predictions as 32-bit rather than 64-bit floats, halving memory and
+        disk usage. Only effective together with ``low_memory`` or
+        ``checkpoint_every``.
+
+    keyframe_interval: int or None, optional, default=None
+        If an integer k > 1 is given, only every k-th frame of single-animal videos
+        is analyzed, and the poses in the frames in between are interpolated with
+        cubic splines (likelihoods linearly). This divides inference time by about k
+        and is meant for high frame rate recordings. The indices of interpolated
+        frames are stored under ``"interpolated_frames"`` in the metadata.
+        Not supported with dynamic cropping or OpenVINO, and takes precedence over
+        ``checkpoint_every``, ``low_memory`` and ``n_concurrent_videos``.
+
+    keyframe_motion_threshold: float or None, optional, default=None
+        Only used together with ``keyframe_interval``. If a body part detected in
+        two consecutive keyframes moved by more than this many pixels, all frames
+        in between are analyzed instead of interpolated.
+
+    track_online: bool, optional, default=False
+        Multi-animal projects only. If ``True``, detections are assembled into
+        individuals and tracked frame by frame during inference, so the tracklets
+        are ready when the analysis finishes rather than being computed from the
+        saved detections by ``convert_detections2tracklets``.
+
+    save_detections: bool, optional, default=True
+        Only used together with ``track_online``. If ``False``, the full detections
+        (the "_full.detections" store) are not kept; only the assemblies and tracklets
+        are written to disk.
+
     Returns
     -------
     DLCScorer: str
@@ -569,10 +639,19 @@ def analyze_videos(
         print("Starting analysis in dynamic cropping mode with parameters:", dynamic)
         dlc_cfg["num_outputs"] = 1
         TFGPUinference = False
-        dlc_cfg["batch_size"] = 1
         print(
-            "Switching batchsize to 1, num_outputs (per animal) to 1 and TFGPUinference to False (all these features are not supported in this mode)."
+            "Switching num_outputs (per animal) to 1 and TFGPUinference to False (these features are not supported in this mode)."
         )
+        # Batched dynamic cropping is opt-in, through an explicit batchsize
+        if batchsize is None or int(batchsize) <= 1:
+            dlc_cfg["batch_size"] = 1
+            print(
+                "Switching batchsize to 1; pass batchsize > 1 to analyze frames in batches of motion-predicted crops."
+            )
+        else:
+            print(
+                f"Analyzing batches of {batchsize} frames, cropped around positions predicted with a constant-velocity motion model."
+            )
 
     # Name for scorer:
     DLCscorer, DLCscorerlegacy = auxiliaryfunctions.get_scorer_name(
@@ -625,6 +704,16 @@ def analyze_videos(
             )
 
             for video in Videos:
+                tracklet_builder = None
+                if track_online:
+                    tracklet_builder = _make_tracklet_builder(
+                        config,
+                        cfg,
+                        modelfolder,
+                        calibrate=calibrate,
+                        identity_only=identity_only,
+                        keep_detections=save_detections,
+                    )
                 AnalyzeMultiAnimalVideo(
                     video,
                     DLCscorer,
@@ -637,6 +726,7 @@ def analyze_videos(
                     destfolder,
                     robust_nframes=robust_nframes,
                     use_shelve=use_shelve,
+                    tracklet_builder=tracklet_builder,
                 )
                 if auto_track:  # tracker type is taken from default in cfg
                     convert_detections2tracklets(
@@ -661,7 +751,37 @@ def analyze_videos(
                         modelprefix=modelprefix,
                         save_as_csv=save_as_csv,
                     )
+        elif (
+            n_concurrent_videos > 1
+            and int(dlc_cfg["batch_size"]) > 1
+            and not dynamic[0]
+            and not use_openvino
+            and not checkpoint_every
+            and not low_memory
+            and not keyframe_interval
+        ):
+            DLCscorer = AnalyzeVideosInterleaved(
+                Videos,
+                DLCscorer,
+                trainFraction,
+                cfg,
+                dlc_cfg,
+                sess,
+                inputs,
+                outputs,
+                pdindex,
+                save_as_csv,
+                destfolder,
+                TFGPUinference,
+                n_streams=n_concurrent_videos,
+            )
         else:
+            if n_concurrent_videos > 1:
+                print(
+                    "Concurrent video analysis requires a batchsize > 1 and is not "
+                    "supported with dynamic cropping, OpenVINO, checkpoint_every, "
+                    "low_memory or keyframe_interval; analyzing videos one at a time."
+                )
             for video in Videos:
                 DLCscorer = AnalyzeVideo(
                     video,
@@ -679,6 +799,11 @@ def analyze_videos(
                     TFGPUinference,
                     dynamic,
                     use_openvino,
+                    checkpoint_every,
+                    low_memory,
+                    use_float32,
+                    keyframe_interval,
+                    keyframe_motion_threshold,
                 )
 
         os.chdir(str(start_path))
@@ -725,194 +850,287 @@ def checkcropping(cfg, cap):
     return int(ny), int(nx)
 
 
-def GetPoseF(cfg, dlc_cfg, sess, inputs, outputs, cap, nframes, batchsize):
-    """Batchwise prediction of pose"""
-    PredictedData = np.zeros(
-        (nframes, dlc_cfg["num_outputs"] * 3 * len(dlc_cfg["all_joints_names"]))
-    )
-    batch_ind = 0  # keeps track of which image within a batch should be written to
-    batch_num = 0  # keeps track of which batch you are at
-    ny, nx = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)), int(
-        cap.get(cv2.CAP_PROP_FRAME_WIDTH)
-    )
+def _make_frame_reader(cfg, cap, nframes, batchsize, start=0, indices=None):
+    """Set up background decoding of (cropped) RGB frames for pose estimation."""
+    cropping = None
     if cfg["cropping"]:
-        ny, nx = checkcropping(cfg, cap)
+        checkcropping(cfg, cap)
+        cropping = cfg["x1"], cfg["x2"], cfg["y1"], cfg["y2"]
+    return BatchedFrameReader(
+        cap, nframes, batchsize, cropping, start=start, indices=indices
+    )
 
-    frames = np.empty(
-        (batchsize, ny, nx, 3), dtype="ubyte"
-    )  # this keeps all frames in a batch
-    pbar = tqdm(total=nframes)
-    counter = 0
-    step = max(10, int(nframes / 100))
-    inds = []
-    while cap.isOpened():
-        if counter != 0 and counter % step == 0:
-            pbar.update(step)
-        ret, frame = cap.read()
-        if ret:
-            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            if cfg["cropping"]:
-                frames[batch_ind] = img_as_ubyte(
-                    frame[cfg["y1"] : cfg["y2"], cfg["x1"] : cfg["x2"]]
-                )
-            else:
-                frames[batch_ind] = img_as_ubyte(frame)
-            inds.append(counter)
-            if batch_ind == batchsize - 1:
-                pose = predict.getposeNP(frames, dlc_cfg, sess, inputs, outputs)
-                PredictedData[inds] = pose
-                batch_ind = 0
-                inds.clear()
-                batch_num += 1
-            else:
-                batch_ind += 1
-        elif counter >= nframes:
-            if batch_ind > 0:
-                pose = predict.getposeNP(
-                    frames, dlc_cfg, sess, inputs, outputs
-                )  # process the whole batch (some frames might be from previous batch!)
-                PredictedData[inds[:batch_ind]] = pose[:batch_ind]
-            break
-        counter += 1
+
+class _PredictionStore:
+    """Memory-mapped storage for the predictions of a video being analyzed.
+
+    Predictions are written into a ``.npy`` file next to the final output instead of
+    being held in memory, so that memory use does not grow with the video length.
+    If ``checkpoint_every`` is given, the index of the next frame to analyze is also
+    recorded in a small manifest every ``checkpoint_every`` frames; an interrupted
+    analysis can thus be resumed from the last checkpoint instead of starting over.
+    """
+
+    def __init__(self, prefix, checkpoint_every=None, dtype=np.float64):
+        self.data_path = prefix + "_predictions.npy"
+        self.manifest_path = prefix + "_checkpoint.pickle"
+        self.checkpoint_every = checkpoint_every
+        self.dtype = np.dtype(dtype)
+        self._data = None
+        self._last = 0
+
+    def open(self, nframes, n_cols):
+        """Return the array to store predictions into and the first frame to analyze."""
+        start = 0
+        if (
+            self.checkpoint_every
+            and os.path.isfile(self.manifest_path)
+            and os.path.isfile(self.data_path)
+        ):
+            manifest = auxiliaryfunctions.read_pickle(self.manifest_path)
+            if manifest["shape"] == (nframes, n_cols) and manifest["dtype"] == str(
+                self.dtype
+            ):
+                self._data = np.lib.format.open_memmap(self.data_path, mode="r+")
+                start = manifest["next_frame"]
+                print(f"Resuming analysis from frame {start}.")
+        if self._data is None:
+            self._data = np.lib.format.open_memmap(
+                self.data_path, mode="w+", dtype=self.dtype, shape=(nframes, n_cols)
+            )
+        self._last = start
+        return self._data, start
+
+    def update(self, next_frame):
+        if not self.checkpoint_every:
+            return
+        if next_frame - self._last < self.checkpoint_every:
+            return
+        self._data.flush()
+        # Write to a temporary file first so a crash never leaves a corrupt manifest
+        temp_path = self.manifest_path + ".tmp"
+        auxiliaryfunctions.write_pickle(
+            temp_path,
+            {
+                "shape": self._data.shape,
+                "dtype": str(self.dtype),
+                "next_frame": next_frame,
+            },
+        )
+        os.replace(temp_path, self.manifest_path)
+        self._last = next_frame
+
+    def remove(self):
+        """Delete the files of the store.
+
+        The arrays returned by :meth:`open` must no longer be referenced, as a file
+        cannot be deleted while it is memory-mapped on Windows.
+        """
+        self._data = None
+        for path in (self.data_path, self.manifest_path):
+            if os.path.isfile(path):
+                os.remove(path)
+
+
+def _init_predictions(nframes, n_cols, store=None):
+    if store is None:
+        return np.zeros((nframes, n_cols)), 0
+    return store.open(nframes, n_cols)
+
+
+def GetPoseF(
+    cfg, dlc_cfg, sess, inputs, outputs, cap, nframes, batchsize, store=None
+):
+    """Batchwise prediction of pose"""
+    PredictedData, start = _init_predictions(
+        nframes,
+        dlc_cfg["num_outputs"] * 3 * len(dlc_cfg["all_joints_names"]),
+        store,
+    )
+    pbar = tqdm(total=nframes, initial=start)
+    with _make_frame_reader(cfg, cap, nframes, batchsize, start) as reader:
+        for frames, inds in reader:
+            # process the whole batch (some frames might be from previous batch!)
+            pose = predict.getposeNP(frames, dlc_cfg, sess, inputs, outputs)
+            PredictedData[inds] = pose[: len(inds)]
+            pbar.update(len(inds))
+            if store is not None:
+                store.update(inds[-1] + 1)
 
     pbar.close()
     return PredictedData, nframes
 
 
-def GetPoseS(cfg, dlc_cfg, sess, inputs, outputs, cap, nframes):
+def GetPoseS(cfg, dlc_cfg, sess, inputs, outputs, cap, nframes, store=None):
     """Non batch wise pose estimation for video cap."""
-    if cfg["cropping"]:
-        ny, nx = checkcropping(cfg, cap)
-
-    PredictedData = np.zeros(
-        (nframes, dlc_cfg["num_outputs"] * 3 * len(dlc_cfg["all_joints_names"]))
+    PredictedData, start = _init_predictions(
+        nframes,
+        dlc_cfg["num_outputs"] * 3 * len(dlc_cfg["all_joints_names"]),
+        store,
     )
-    pbar = tqdm(total=nframes)
-    counter = 0
-    step = max(10, int(nframes / 100))
-    while cap.isOpened():
-        if counter != 0 and counter % step == 0:
-            pbar.update(step)
-
-        ret, frame = cap.read()
-        if ret:
-            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            if cfg["cropping"]:
-                frame = img_as_ubyte(
-                    frame[cfg["y1"] : cfg["y2"], cfg["x1"] : cfg["x2"]]
-                )
-            else:
-                frame = img_as_ubyte(frame)
-            pose = predict.getpose(frame, dlc_cfg, sess, inputs, outputs)
+    pbar = tqdm(total=nframes, initial=start)
+    with _make_frame_reader(cfg, cap, nframes, 1, start) as reader:
+        for frames, inds in reader:
+            pose = predict.getpose(frames[0], dlc_cfg, sess, inputs, outputs)
             PredictedData[
-                counter, :
+                inds[0], :
             ] = (
                 pose.flatten()
             )  # NOTE: thereby cfg['all_joints_names'] should be same order as bodyparts!
-        elif counter >= nframes:
-            break
-        counter += 1
+            pbar.update(1)
+            if store is not None:
+                store.update(inds[0] + 1)
 
     pbar.close()
     return PredictedData, nframes
 
 
-def GetPoseS_GTF(cfg, dlc_cfg, sess, inputs, outputs, cap, nframes):
+def GetPoseS_GTF(
+    cfg, dlc_cfg, sess, inputs, outputs, cap, nframes, store=None
+):
     """Non batch wise pose estimation for video cap."""
-    if cfg["cropping"]:
-        ny, nx = checkcropping(cfg, cap)
-
     pose_tensor = predict.extract_GPUprediction(
         outputs, dlc_cfg
     )  # extract_output_tensor(outputs, dlc_cfg)
-    PredictedData = np.zeros((nframes, 3 * len(dlc_cfg["all_joints_names"])))
-    pbar = tqdm(total=nframes)
-    counter = 0
-    step = max(10, int(nframes / 100))
-    while cap.isOpened():
-        if counter != 0 and counter % step == 0:
-            pbar.update(step)
-
-        ret, frame = cap.read()
-        if ret:
-            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            if cfg["cropping"]:
-                frame = img_as_ubyte(
-                    frame[cfg["y1"] : cfg["y2"], cfg["x1"] : cfg["x2"]]
-                )
-            else:
-                frame = img_as_ubyte(frame)
-
-            pose = sess.run(
-                pose_tensor,
-                feed_dict={inputs: np.expand_dims(frame, axis=0).astype(float)},
-            )
+    PredictedData, start = _init_predictions(
+        nframes, 3 * len(dlc_cfg["all_joints_names"]), store
+    )
+    pbar = tqdm(total=nframes, initial=start)
+    with _make_frame_reader(cfg, cap, nframes, 1, start) as reader:
+        for frames, inds in reader:
+            pose = sess.run(pose_tensor, feed_dict={inputs: frames.astype(float)})
             pose[:, [0, 1, 2]] = pose[:, [1, 0, 2]]
-            # pose = predict.getpose(frame, dlc_cfg, sess, inputs, outputs)
             PredictedData[
-                counter, :
+                inds[0], :
             ] = (
                 pose.flatten()
             )  # NOTE: thereby cfg['all_joints_names'] should be same order as bodyparts!
-        elif counter >= nframes:
-            break
-        counter += 1
+            pbar.update(1)
+            if store is not None:
+                store.update(inds[0] + 1)
 
     pbar.close()
     return PredictedData, nframes
 
 
-def GetPoseF_GTF(cfg, dlc_cfg, sess, inputs, outputs, cap, nframes, batchsize):
+def GetPoseF_GTF(
+    cfg, dlc_cfg, sess, inputs, outputs, cap, nframes, batchsize, store=None
+):
     """Batchwise prediction of pose"""
-    PredictedData = np.zeros((nframes, 3 * len(dlc_cfg["all_joints_names"])))
-    batch_ind = 0  # keeps track of which image within a batch should be written to
-    batch_num = 0  # keeps track of which batch you are at
-    ny = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-    nx = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-    if cfg["cropping"]:
-        ny, nx = checkcropping(cfg, cap)
+    PredictedData, start = _init_predictions(
+        nframes, 3 * len(dlc_cfg["all_joints_names"]), store
+    )
 
     # Flip x, y, confidence and reshape
     pose_tensor = predict.extract_GPUprediction(outputs, dlc_cfg)
     pose_tensor = tf.gather(pose_tensor, [1, 0, 2], axis=1)
     pose_tensor = tf.reshape(pose_tensor, (batchsize, -1))
 
-    frames = np.empty((batchsize, ny, nx, 3), dtype="ubyte")
-    pbar = tqdm(total=nframes)
-    counter = -1
-    inds = []
-    while cap.isOpened() and counter < nframes - 1:
-        ret, frame = cap.read()
-        counter += 1
-        if not ret:
-            warnings.warn(f"Could not decode frame #{counter}.")
-            continue
-
-        if cfg["cropping"]:
-            frame = img_as_ubyte(frame[cfg["y1"] : cfg["y2"], cfg["x1"] : cfg["x2"]])
-        else:
-            frame = img_as_ubyte(frame)
-        frames[batch_ind] = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        inds.append(counter)
-        if batch_ind == batchsize - 1:
+    pbar = tqdm(total=nframes, initial=start)
+    with _make_frame_reader(cfg, cap, nframes, batchsize, start) as reader:
+        for frames, inds in reader:
             pose = sess.run(pose_tensor, feed_dict={inputs: frames})
-            PredictedData[inds] = pose
-            batch_ind = 0
-            batch_num += 1
-            inds.clear()
-            pbar.update(batchsize)
-        else:
-            batch_ind += 1
-
-    if batch_ind > 0:
-        pose = sess.run(pose_tensor, feed_dict={inputs: frames})
-        PredictedData[inds[:batch_ind]] = pose[:batch_ind]
-        pbar.update(batch_ind)
+            PredictedData[inds] = pose[: len(inds)]
+            pbar.update(len(inds))
+            if store is not None:
+                store.update(inds[-1] + 1)
 
     pbar.close()
     return PredictedData, nframes
 
 
+def _interpolate_poses(PredictedData, analyzed):
+    """Fill the rows of frames that were not analyzed from the analyzed ones.
+
+    Coordinates are interpolated with cubic splines, likelihoods linearly.
+    """
+    from deeplabcut.post_processing.filtering import columnwise_spline_interp
+
+    data = PredictedData.copy()
+    data[~analyzed] = np.nan
+    xy = np.ones(data.shape[1], dtype=bool)
+    xy[2::3] = False
+    filled = columnwise_spline_interp(data[:, xy])
+    rows = np.flatnonzero(~analyzed)
+    data[np.ix_(rows, np.flatnonzero(xy))] = filled[rows]
+    frames = np.flatnonzero(analyzed)
+    for col in range(2, data.shape[1], 3):
+        data[rows, col] = np.interp(rows, frames, PredictedData[frames, col])
+    return data
+
+
+def GetPoseKeyframes(
+    cfg,
+    dlc_cfg,
+    sess,
+    inputs,
+    outputs,
+    cap,
+    nframes,
+    batchsize,
+    keyframe_interval,
+    motion_threshold=None,
+    TFGPUinference=False,
+):
+    """Batchwise pose estimation on keyframes only, interpolating the other frames.
+
+    The network only runs on every ``keyframe_interval``-th frame (and on the last
+    frame). If ``motion_threshold`` is given, all frames between two consecutive
+    keyframes are analyzed as well whenever a body part detected in both (i.e.,
+    with a likelihood above pcutoff) moved by more than ``motion_threshold`` pixels
+    between them. Remaining frames are interpolated; their indices are returned
+    along with the predictions.
+    """
+    n_cols = dlc_cfg["num_outputs"] * 3 * len(dlc_cfg["all_joints_names"])
+    PredictedData = np.zeros((nframes, n_cols))
+    analyzed = np.zeros(nframes, dtype=bool)
+    if TFGPUinference:
+        pose_tensor = predict.extract_GPUprediction(outputs, dlc_cfg)
+        pose_tensor = tf.gather(pose_tensor, [1, 0, 2], axis=1)
+        pose_tensor = tf.reshape(pose_tensor, (batchsize, -1))
+
+    keyframes = np.unique(np.r_[np.arange(0, nframes, keyframe_interval), nframes - 1])
+    if len(keyframes) < 4:  # Too few frames to fit splines through
+        keyframes = np.arange(nframes)
+    pbar = tqdm(total=len(keyframes))
+
+    def analyze(indices):
+        cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+        with _make_frame_reader(
+            cfg, cap, nframes, batchsize, indices=indices
+        ) as reader:
+            for frames, inds in reader:
+                if TFGPUinference:
+                    pose = sess.run(pose_tensor, feed_dict={inputs: frames})
+                else:
+                    pose = predict.getposeNP(frames, dlc_cfg, sess, inputs, outputs)
+                PredictedData[inds] = pose[: len(inds)]
+                analyzed[inds] = True
+                pbar.update(len(inds))
+
+    analyze(keyframes)
+    if motion_threshold is not None:
+        analyzed_keys = keyframes[analyzed[keyframes]]
+        poses = PredictedData[analyzed_keys].reshape((len(analyzed_keys), -1, 3))
+        visible = poses[:, :, 2] > cfg["pcutoff"]
+        motion = np.linalg.norm(np.diff(poses[:, :, :2], axis=0), axis=2)
+        motion[~(visible[1:] & visible[:-1])] = 0
+        fast = np.flatnonzero(motion.max(axis=1, initial=0) > motion_threshold)
+        extra = np.concatenate(
+            [np.arange(analyzed_keys[i] + 1, analyzed_keys[i + 1]) for i in fast]
+            + [np.empty(0, dtype=int)]
+        )
+        if extra.size:
+            pbar.total += extra.size
+            pbar.refresh()
+            analyze(extra)
+    pbar.close()
+
+    if analyzed.any() and not analyzed.all():
+        PredictedData = _interpolate_poses(PredictedData, analyzed)
+    return PredictedData, nframes, np.flatnonzero(~analyzed)
+
+
 def getboundingbox(x, y, nx, ny, margin):
     x1 = max([0, int(np.amin(x)) - margin])
     x2 = min([nx, int(np.amax(x)) + margin])
@@ -921,8 +1139,69 @@ def getboundingbox(x, y, nx, ny, margin):
     return x1, x2, y1, y2
 
 
+def _coarse_to_fine_pose(
+    frames, dlc_cfg, sess, inputs, outputs, detectiontreshold, margin, downscale
+):
+    """Locate the animal on downscaled frames, then analyze full resolution crops.
+
+    The network first runs on copies of ``frames`` shrunk by ``downscale``; frames
+    in which anything is detected are cropped around the (upscaled) detection and
+    analyzed again at full resolution. Poses are returned in full frame coordinates;
+    frames without detection keep the coarse estimate.
+    """
+    n, ny, nx = frames.shape[:3]
+    small = np.stack(
+        [
+            cv2.resize(
+                frame,
+                None,
+                fx=1 / downscale,
+                fy=1 / downscale,
+                interpolation=cv2.INTER_AREA,
+            )
+            for frame in frames
+        ]
+    )
+    pose = predict.getposeNP(small, dlc_cfg, sess, inputs, outputs)
+    pose[:, 0::3] *= nx / small.shape[2]
+    pose[:, 1::3] *= ny / small.shape[1]
+    found = np.flatnonzero(np.any(pose[:, 2::3] > detectiontreshold, axis=1))
+    if not found.size:
+        return pose
+
+    # Coarse keypoints are only accurate up to the stride of the downscaled image
+    margin = margin + int(np.ceil(downscale * dlc_cfg["stride"]))
+    boxes = np.array(
+        [getboundingbox(pose[i, 0::3], pose[i, 1::3], nx, ny, margin) for i in found]
+    )
+    w = np.max(boxes[:, 1] - boxes[:, 0])
+    h = np.max(boxes[:, 3] - boxes[:, 2])
+    xs = np.zeros(n, dtype=int)
+    ys = np.zeros(n, dtype=int)
+    xs[found] = np.clip(boxes[:, 0], 0, nx - w)
+    ys[found] = np.clip(boxes[:, 2], 0, ny - h)
+    crops = np.zeros((n, h, w, 3), dtype=frames.dtype)
+    for i in found:
+        crops[i] = frames[i, ys[i] : ys[i] + h, xs[i] : xs[i] + w]
+    fine = predict.getposeNP(crops, dlc_cfg, sess, inputs, outputs)
+    fine[:, 0::3] += xs[:, None]
+    fine[:, 1::3] += ys[:, None]
+    refined = found[np.any(fine[found, 2::3] > detectiontreshold, axis=1)]
+    pose[refined] = fine[refined]
+    return pose
+
+
 def GetPoseDynamic(
-    cfg, dlc_cfg, sess, inputs, outputs, cap, nframes, detectiontreshold, margin
+    cfg,
+    dlc_cfg,
+    sess,
+    inputs,
+    outputs,
+    cap,
+    nframes,
+    detectiontreshold,
+    margin,
+    downscale=1,
 ):
     """Non batch wise pose estimation for video cap by dynamically cropping around previously detected parts."""
     if cfg["cropping"]:
@@ -933,7 +1212,6 @@ def GetPoseDynamic(
         )
     x1, x2, y1, y2 = 0, nx, 0, ny
     detected = False
-    # TODO: perform detection on resized image (For speed)
 
     PredictedData = np.zeros((nframes, 3 * len(dlc_cfg["all_joints_names"])))
     pbar = tqdm(total=nframes)
@@ -954,7 +1232,19 @@ def GetPoseDynamic(
             else:
                 frame = img_as_ubyte(originalframe[y1:y2, x1:x2])
 
-            pose = predict.getpose(frame, dlc_cfg, sess, inputs, outputs).flatten()
+            if downscale > 1 and not detected:  # locate the animal on a smaller frame
+                pose = _coarse_to_fine_pose(
+                    frame[None],
+                    dlc_cfg,
+                    sess,
+                    inputs,
+                    outputs,
+                    detectiontreshold,
+                    margin,
+                    downscale,
+                )[0]
+            else:
+                pose = predict.getpose(frame, dlc_cfg, sess, inputs, outputs).flatten()
             detection = np.any(pose[2::3] > detectiontreshold)  # is anything detected?
             if detection:
                 pose[0::3], pose[1::3] = (
@@ -977,9 +1267,21 @@ def GetPoseDynamic(
                         )
                     else:
                         frame = img_as_ubyte(originalframe)
-                    pose = predict.getpose(
-                        frame, dlc_cfg, sess, inputs, outputs
-                    ).flatten()  # no offset is necessary
+                    if downscale > 1:
+                        pose = _coarse_to_fine_pose(
+                            frame[None],
+                            dlc_cfg,
+                            sess,
+                            inputs,
+                            outputs,
+                            detectiontreshold,
+                            margin,
+                            downscale,
+                        )[0]
+                    else:
+                        pose = predict.getpose(
+                            frame, dlc_cfg, sess, inputs, outputs
+                        ).flatten()  # no offset is necessary
 
                 x0, y0 = x1, y1
                 x1, x2, y1, y2 = 0, nx, 0, ny
@@ -994,6 +1296,179 @@ def GetPoseDynamic(
     return PredictedData, nframes
 
 
+def _predict_crop_origins(box, velocity, steps, nx, ny):
+    """Extrapolate the top-left corners of a crop window ``steps`` frames ahead.
+
+    The window keeps the size of ``box`` = (x1, x2, y1, y2) and its top-left corner
+    moves at constant ``velocity`` (in pixels per frame); windows are kept inside
+    the frame.
+    """
+    x1, x2, y1, y2 = box
+    w, h = x2 - x1, y2 - y1
+    steps = np.asarray(steps)
+    xs = np.rint(x1 + velocity[0] * steps).astype(int)
+    ys = np.rint(y1 + velocity[1] * steps).astype(int)
+    return np.clip(xs, 0, nx - w), np.clip(ys, 0, ny - h)
+
+
+def GetPoseDynamicBatched(
+    cfg,
+    dlc_cfg,
+    sess,
+    inputs,
+    outputs,
+    cap,
+    nframes,
+    batchsize,
+    detectiontreshold,
+    margin,
+    downscale=1,
+):
+    """Batch wise pose estimation for video cap with dynamic cropping.
+
+    Crop windows for a batch of upcoming frames are extrapolated from the last
+    detection with a constant-velocity motion model, so that all crops share the
+    size of the last bounding box and can be processed as a single batch. Only
+    frames in which the animal was lost within its crop are re-analyzed on the
+    full frame (or, if ``downscale`` > 1, located on a downscaled copy of the frame
+    and analyzed within a full resolution crop around it).
+    """
+
+    def full_frame_pose(frames):
+        if downscale > 1:
+            return _coarse_to_fine_pose(
+                frames,
+                dlc_cfg,
+                sess,
+                inputs,
+                outputs,
+                detectiontreshold,
+                margin,
+                downscale,
+            )
+        return predict.getposeNP(frames, dlc_cfg, sess, inputs, outputs)
+
+    PredictedData = np.zeros((nframes, 3 * len(dlc_cfg["all_joints_names"])))
+    box = None  # bounding box of the last detection; None if the animal is lost
+    velocity = np.zeros(2)
+    last_ind = 0
+    pbar = tqdm(total=nframes)
+    with _make_frame_reader(cfg, cap, nframes, batchsize) as reader:
+        ny, nx = reader.ny, reader.nx
+        for frames, inds in reader:
+            n = len(inds)
+            if box is None:
+                pose = full_frame_pose(frames)
+                lost = np.zeros(batchsize, dtype=bool)
+            else:
+                x1, x2, y1, y2 = box
+                steps = np.arange(inds[0], inds[0] + batchsize) - last_ind
+                xs, ys = _predict_crop_origins(box, velocity, steps, nx, ny)
+                crops = np.stack(
+                    [
+                        frames[i, y : y + y2 - y1, x : x + x2 - x1]
+                        for i, (x, y) in enumerate(zip(xs, ys))
+                    ]
+                )
+                pose = predict.getposeNP(crops, dlc_cfg, sess, inputs, outputs)
+                pose[:, 0::3] += xs[:, None]
+                pose[:, 1::3] += ys[:, None]
+                lost = ~np.any(pose[:, 2::3] > detectiontreshold, axis=1)
+                lost[n:] = False
+                if lost.any():  # re-run on the full frame
+                    pose[lost] = full_frame_pose(frames)[lost]
+            PredictedData[inds] = pose[:n]
+
+            # Update the motion model from the detections within this batch
+            detected = np.flatnonzero(
+                np.any(pose[:n, 2::3] > detectiontreshold, axis=1)
+            )
+            if detected.size and detected[-1] == n - 1:
+                new_box = getboundingbox(
+                    pose[n - 1, 0::3], pose[n - 1, 1::3], nx, ny, margin
+                )
+                if detected.size > 1:
+                    prev = detected[-2]
+                    prev_box = getboundingbox(
+                        pose[prev, 0::3], pose[prev, 1::3], nx, ny, margin
+                    )
+                    gap = inds[-1] - inds[prev]
+                elif box is not None:
+                    prev_box, gap = box, inds[-1] - last_ind
+                else:
+                    prev_box, gap = new_box, 1
+                velocity = (
+                    np.array([new_box[0] - prev_box[0], new_box[2] - prev_box[2]])
+                    / gap
+                )
+                box = new_box
+                last_ind = inds[-1]
+            else:
+                box = None
+            pbar.update(n)
+
+    pbar.close()
+    return PredictedData, nframes
+
+
+def _save_video_analysis(
+    PredictedData,
+    vname,
+    destfolder,
+    DLCscorer,
+    trainFraction,
+    cfg,
+    dlc_cfg,
+    pdindex,
+    save_as_csv,
+    fps,
+    nframes,
+    frame_dimensions,
+    start,
+    stop,
+    chunksize=None,
+    interpolated=None,
+):
+    """Store the predictions of a single-animal video along with its metadata."""
+    ny, nx = frame_dimensions
+    if cfg["cropping"] == True:
+        coords = [cfg["x1"], cfg["x2"], cfg["y1"], cfg["y2"]]
+    else:
+        coords = [0, nx, 0, ny]
+
+    dictionary = {
+        "start": start,
+        "stop": stop,
+        "run_duration": stop - start,
+        "Scorer": DLCscorer,
+        "DLC-model-config file": dlc_cfg,
+        "fps": fps,
+        "batch_size": dlc_cfg["batch_size"],
+        "frame_dimensions": (ny, nx),
+        "nframes": nframes,
+        "iteration (active-learning)": cfg["iteration"],
+        "training set fraction": trainFraction,
+        "cropping": cfg["cropping"],
+        "cropping_parameters": coords
+        # "gpu_info": device_lib.list_local_devices()
+    }
+    if interpolated is not None:
+        dictionary["interpolated_frames"] = interpolated
+    metadata = {"data": dictionary}
+
+    print(f"Saving results in {destfolder}...")
+    dataname = os.path.join(destfolder, vname + DLCscorer + ".h5")
+    auxiliaryfunctions.save_data(
+        PredictedData[:nframes, :],
+        metadata,
+        dataname,
+        pdindex,
+        range(nframes),
+        save_as_csv,
+        chunksize,
+    )
+
+
 def AnalyzeVideo(
     video,
     DLCscorer,
@@ -1010,6 +1485,11 @@ def AnalyzeVideo(
     TFGPUinference=True,
     dynamic=(False, 0.5, 10),
     use_openvino="CPU" if is_openvino_available else None,
+    checkpoint_every=None,
+    low_memory=False,
+    use_float32=False,
+    keyframe_interval=None,
+    keyframe_motion_threshold=None,
 ):
     """Helper function for analyzing a video."""
     print("Starting to analyze % ", video)
@@ -1051,10 +1531,58 @@ def AnalyzeVideo(
             ny,
         )
 
-        dynamic_analysis_state, detectiontreshold, margin = dynamic
+        dynamic_analysis_state, detectiontreshold, margin = dynamic[:3]
+        downscale = dynamic[3] if len(dynamic) > 3 else 1
+        use_keyframes = (
+            keyframe_interval is not None
+            and keyframe_interval > 1
+            and not dynamic_analysis_state
+            and not use_openvino
+        )
+        store = None
+        if (
+            (checkpoint_every or low_memory)
+            and not dynamic_analysis_state
+            and not use_openvino
+            and not use_keyframes
+        ):
+            store = _PredictionStore(
+                os.path.join(destfolder, vname + DLCscorer),
+                checkpoint_every,
+                np.float32 if use_float32 else np.float64,
+            )
         start = time.time()
         print("Starting to extract posture")
-        if dynamic_analysis_state:
+        interpolated = None
+        if use_keyframes:
+            PredictedData, nframes, interpolated = GetPoseKeyframes(
+                cfg,
+                dlc_cfg,
+                sess,
+                inputs,
+                outputs,
+                cap,
+                nframes,
+                int(dlc_cfg["batch_size"]),
+                keyframe_interval,
+                keyframe_motion_threshold,
+                TFGPUinference,
+            )
+        elif dynamic_analysis_state and int(dlc_cfg["batch_size"]) > 1:
+            PredictedData, nframes = GetPoseDynamicBatched(
+                cfg,
+                dlc_cfg,
+                sess,
+                inputs,
+                outputs,
+                cap,
+                nframes,
+                int(dlc_cfg["batch_size"]),
+                detectiontreshold,
+                margin,
+                downscale,
+            )
+        elif dynamic_analysis_state:
             PredictedData, nframes = GetPoseDynamic(
                 cfg,
                 dlc_cfg,
@@ -1065,6 +1593,7 @@ def AnalyzeVideo(
                 nframes,
                 detectiontreshold,
                 margin,
+                downscale,
             )
             # GetPoseF_GTF(cfg,dlc_cfg, sess, inputs, outputs,cap,nframes,int(dlc_cfg["batch_size"]))
         else:
@@ -1082,57 +1611,171 @@ def AnalyzeVideo(
                 if use_openvino:
                     PredictedData, nframes = GetPoseF_OV(*args)
                 elif TFGPUinference:
-                    PredictedData, nframes = GetPoseF_GTF(*args)
+                    PredictedData, nframes = GetPoseF_GTF(*args, store)
                 else:
-                    PredictedData, nframes = GetPoseF(*args)
+                    PredictedData, nframes = GetPoseF(*args, store)
             else:
                 if TFGPUinference:
                     PredictedData, nframes = GetPoseS_GTF(
-                        cfg, dlc_cfg, sess, inputs, outputs, cap, nframes
+                        cfg, dlc_cfg, sess, inputs, outputs, cap, nframes, store
                     )
                 else:
                     PredictedData, nframes = GetPoseS(
-                        cfg, dlc_cfg, sess, inputs, outputs, cap, nframes
+                        cfg, dlc_cfg, sess, inputs, outputs, cap, nframes, store
                     )
 
         stop = time.time()
-        if cfg["cropping"] == True:
-            coords = [cfg["x1"], cfg["x2"], cfg["y1"], cfg["y2"]]
-        else:
-            coords = [0, nx, 0, ny]
-
-        dictionary = {
-            "start": start,
-            "stop": stop,
-            "run_duration": stop - start,
-            "Scorer": DLCscorer,
-            "DLC-model-config file": dlc_cfg,
-            "fps": fps,
-            "batch_size": dlc_cfg["batch_size"],
-            "frame_dimensions": (ny, nx),
-            "nframes": nframes,
-            "iteration (active-learning)": cfg["iteration"],
-            "training set fraction": trainFraction,
-            "cropping": cfg["cropping"],
-            "cropping_parameters": coords
-            # "gpu_info": device_lib.list_local_devices()
-        }
-        metadata = {"data": dictionary}
-
-        print(f"Saving results in {destfolder}...")
-        dataname = os.path.join(destfolder, vname + DLCscorer + ".h5")
-        auxiliaryfunctions.save_data(
-            PredictedData[:nframes, :],
-            metadata,
-            dataname,
+        _save_video_analysis(
+            PredictedData,
+            vname,
+            destfolder,
+            DLCscorer,
+            trainFraction,
+            cfg,
+            dlc_cfg,
             pdindex,
-            range(nframes),
             save_as_csv,
+            fps,
+            nframes,
+            (ny, nx),
+            start,
+            stop,
+            chunksize=None if store is None else 10000,
+            interpolated=interpolated,
         )
+        if store is not None:
+            # Release the memory map before deleting the file it maps
+            del PredictedData
+            store.remove()
     finally:
         return DLCscorer
 
 
+def AnalyzeVideosInterleaved(
+    videos,
+    DLCscorer,
+    trainFraction,
+    cfg,
+    dlc_cfg,
+    sess,
+    inputs,
+    outputs,
+    pdindex,
+    save_as_csv,
+    destfolder=None,
+    TFGPUinference=True,
+    n_streams=4,
+):
+    """Helper function for analyzing several videos with shared inference batches.
+
+    Frames of up to ``n_streams`` videos are decoded concurrently and mixed into the
+    same batches, so that the network is kept busy independently of the videos'
+    lengths. Each video's predictions are saved as soon as its last frame is processed.
+    """
+    batchsize = int(dlc_cfg["batch_size"])
+    cropping = None
+    if cfg["cropping"]:
+        cropping = cfg["x1"], cfg["x2"], cfg["y1"], cfg["y2"]
+
+    # Only videos of identical dimensions can be stacked into a batch
+    groups = {}
+    infos = {}
+    for video in videos:
+        dest = destfolder or str(Path(video).parents[0])
+        auxiliaryfunctions.attempt_to_make_folder(dest)
+        vname = Path(video).stem
+        try:
+            _ = auxiliaryfunctions.load_analyzed_data(dest, vname, DLCscorer)
+            continue
+        except FileNotFoundError:
+            pass
+        cap = cv2.VideoCapture(video)
+        if not cap.isOpened():
+            raise IOError(
+                "Video could not be opened. Please check that the the file integrity."
+            )
+        if cfg["cropping"]:
+            checkcropping(cfg, cap)
+        size = (
+            int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+            int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+        )
+        nframes = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        infos[video] = dict(
+            vname=vname,
+            destfolder=dest,
+            fps=cap.get(cv2.CAP_PROP_FPS),
+            nframes=nframes,
+            size=size,
+        )
+        cap.release()
+        if nframes < 1:
+            warnings.warn(f"No frames found in {video}; skipping it.")
+            continue
+        groups.setdefault(size, []).append(video)
+
+    if TFGPUinference:
+        # Flip x, y, confidence and reshape
+        pose_tensor = predict.extract_GPUprediction(outputs, dlc_cfg)
+        pose_tensor = tf.gather(pose_tensor, [1, 0, 2], axis=1)
+        pose_tensor = tf.reshape(pose_tensor, (batchsize, -1))
+        n_cols = 3 * len(dlc_cfg["all_joints_names"])
+    else:
+        n_cols = dlc_cfg["num_outputs"] * 3 * len(dlc_cfg["all_joints_names"])
+
+    for size, group in groups.items():
+        nframes = [infos[video]["nframes"] for video in group]
+        print(
+            f"Analyzing {len(group)} videos with frame dimensions {size[1]}x{size[0]}, "
+            f"{min(n_streams, len(group))} at a time..."
+        )
+        PredictedData = {}
+        starts = {}
+        reader = InterleavedFrameReader(
+            group, nframes, batchsize, size, cropping, n_streams
+        )
+        pbar = tqdm(total=sum(nframes))
+        with reader:
+            for frames, inds, done in reader:
+                if inds:
+                    if TFGPUinference:
+                        pose = sess.run(pose_tensor, feed_dict={inputs: frames})
+                    else:
+                        pose = predict.getposeNP(
+                            frames, dlc_cfg, sess, inputs, outputs
+                        )
+                    for row, (video_ind, frame_ind) in enumerate(inds):
+                        if video_ind not in PredictedData:
+                            PredictedData[video_ind] = np.zeros(
+                                (nframes[video_ind], n_cols)
+                            )
+                            starts[video_ind] = time.time()
+                        PredictedData[video_ind][frame_ind] = pose[row]
+                    pbar.update(len(inds))
+                for video_ind in done:
+                    info = infos[group[video_ind]]
+                    _save_video_analysis(
+                        PredictedData.pop(
+                            video_ind, np.zeros((nframes[video_ind], n_cols))
+                        ),
+                        info["vname"],
+                        info["destfolder"],
+                        DLCscorer,
+                        trainFraction,
+                        cfg,
+                        dlc_cfg,
+                        pdindex,
+                        save_as_csv,
+                        info["fps"],
+                        info["nframes"],
+                        info["size"],
+                        starts.pop(video_ind, time.time()),
+                        time.time(),
+                    )
+        pbar.close()
+    return DLCscorer
+
+
 def GetPosesofFrames(
     cfg, dlc_cfg, sess, inputs, outputs, directory, framelist, nframes, batchsize
 ):
@@ -1554,6 +2197,38 @@ def _convert_detections_to_tracklets(
         pickle.dump(tracklets, f, pickle.HIGHEST_PROTOCOL)
 
 
+def _get_train_data_file(cfg):
+    trainingsetfolder = auxiliaryfunctions.get_training_set_folder(cfg)
+    return os.path.join(
+        cfg["project_path"],
+        str(trainingsetfolder),
+        "CollectedData_" + cfg["scorer"] + ".h5",
+    )
+
+
+def _make_tracklet_builder(
+    config, cfg, modelfolder, track_method="", calibrate=False, **kwargs
+):
+    """Set up the online assembly and tracking of a video's detections."""
+    track_method = auxfun_multianimal.get_track_method(cfg, track_method=track_method)
+    path_inference_config = Path(modelfolder) / "test" / "inference_cfg.yaml"
+    inferencecfg = auxfun_multianimal.read_inferencecfg(path_inference_config, cfg)
+    if len(cfg["multianimalbodyparts"]) == 1 and track_method != "box":
+        warnings.warn("Switching to `box` tracker for single point tracking...")
+        track_method = "box"
+        cfg["default_track_method"] = track_method
+        auxiliaryfunctions.write_config(config, cfg)
+        inferencecfg["boundingboxslack"] = max(inferencecfg["boundingboxslack"], 40)
+    train_data_file = _get_train_data_file(cfg) if calibrate else None
+    return trackingutils.TrackletBuilder(
+        cfg,
+        inferencecfg,
+        track_method,
+        train_data_file=train_data_file,
+        **kwargs,
+    )
+
+
 def convert_detections2tracklets(
     config,
     videos,
@@ -1745,14 +2420,11 @@ def convert_detections2tracklets(
             auxiliaryfunctions.attempt_to_make_folder(destfolder)
             vname = Path(video).stem
             dataname = os.path.join(destfolder, vname + DLCscorer + ".h5")
-            data, metadata = auxfun_multianimal.LoadFullMultiAnimalData(dataname)
-            if track_method == "ellipse":
-                method = "el"
-            elif track_method == "box":
-                method = "bx"
-            else:
-                method = "sk"
-            trackname = dataname.split(".h5")[0] + f"_{method}.pickle"
+            trackname = (
+                dataname.split(".h5")[0]
+                + trackingutils.TRACK_METHODS[track_method]
+                + ".pickle"
+            )
             # NOTE: If dataname line above is changed then line below is obsolete?
             # trackname = trackname.replace(videofolder, destfolder)
             if (
@@ -1761,46 +2433,19 @@ def convert_detections2tracklets(
                 print("Tracklets already computed", trackname)
                 print("Set overwrite = True to overwrite.")
             else:
+                data, metadata = auxfun_multianimal.LoadFullMultiAnimalData(dataname)
                 print("Analyzing", dataname)
                 DLCscorer = metadata["data"]["Scorer"]
                 all_jointnames = data["metadata"]["all_joints_names"]
-
-                numjoints = len(all_jointnames)
-
-                # TODO: adjust this for multi + unique bodyparts!
-                # this is only for multianimal parts and uniquebodyparts as one (not one uniquebodyparts guy tracked etc. )
-                bodypartlabels = [
-                    bpt for i, bpt in enumerate(all_jointnames) for _ in range(3)
-                ]
-                scorers = len(bodypartlabels) * [DLCscorer]
-                xylvalue = int(len(bodypartlabels) / 3) * ["x", "y", "likelihood"]
-                pdindex = pd.MultiIndex.from_arrays(
-                    np.vstack([scorers, bodypartlabels, xylvalue]),
-                    names=["scorer", "bodyparts", "coords"],
-                )
-
                 imnames = [fn for fn in data if fn != "metadata"]
 
-                if track_method == "box":
-                    mot_tracker = trackingutils.SORTBox(
-                        inferencecfg["max_age"],
-                        inferencecfg["min_hits"],
-                        inferencecfg.get("oks_threshold", 0.3),
-                    )
-                elif track_method == "skeleton":
-                    mot_tracker = trackingutils.SORTSkeleton(
-                        numjoints,
-                        inferencecfg["max_age"],
-                        inferencecfg["min_hits"],
-                        inferencecfg.get("oks_threshold", 0.5),
-                    )
-                else:
-                    mot_tracker = trackingutils.SORTEllipse(
-                        inferencecfg.get("max_age", 1),
-                        inferencecfg.get("min_hits", 1),
-                        inferencecfg.get("iou_threshold", 0.6),
-                    )
-                tracklets = {}
+                builder = trackingutils.TrackletBuilder(
+                    cfg,
+                    inferencecfg,
+                    track_method,
+                    identity_only=identity_only,
+                    ignore_bodyparts=ignore_bodyparts,
+                )
                 multi_bpts = cfg["multianimalbodyparts"]
                 assembly_builder = inferenceutils.Assembler(
                     data,
@@ -1815,15 +2460,7 @@ def convert_detections2tracklets(
                 assemblies_filename = dataname.split(".h5")[0] + "_assemblies.pickle"
                 if not os.path.exists(assemblies_filename) or overwrite:
                     if calibrate:
-                        trainingsetfolder = auxiliaryfunctions.get_training_set_folder(
-                            cfg
-                        )
-                        train_data_file = os.path.join(
-                            cfg["project_path"],
-                            str(trainingsetfolder),
-                            "CollectedData_" + cfg["scorer"] + ".h5",
-                        )
-                        assembly_builder.calibrate(train_data_file)
+                        assembly_builder.calibrate(_get_train_data_file(cfg))
                     assembly_builder.assemble()
                     assembly_builder.to_pickle(assemblies_filename)
                 else:
@@ -1834,62 +2471,13 @@ def convert_detections2tracklets(
                 except AttributeError:
                     pass
 
-                if cfg[
-                    "uniquebodyparts"
-                ]:  # Initialize storage of the 'single' individual track
-                    tracklets["single"] = {}
-                    _single = {}
-                    for index, imname in enumerate(imnames):
-                        single_detection = assembly_builder.unique.get(index)
-                        if single_detection is None:
-                            continue
-                        imindex = int(re.findall(r"\d+", imname)[0])
-                        _single[imindex] = single_detection
-                    tracklets["single"].update(_single)
-
-                if inferencecfg["topktoretain"] == 1:
-                    tracklets[0] = {}
-                    for index, imname in tqdm(enumerate(imnames)):
-                        assemblies = assembly_builder.assemblies.get(index)
-                        if assemblies is None:
-                            continue
-                        tracklets[0][imname] = assemblies[0].data
-                else:
-                    keep = set(multi_bpts).difference(ignore_bodyparts or [])
-                    keep_inds = sorted(multi_bpts.index(bpt) for bpt in keep)
-                    for index, imname in tqdm(enumerate(imnames)):
-                        assemblies = assembly_builder.assemblies.get(index)
-                        if assemblies is None:
-                            continue
-                        animals = np.stack(
-                            [assembly_builder.data for assembly_builder in assemblies]
-                        )
-                        if not identity_only:
-                            if track_method == "box":
-                                xy = trackingutils.calc_bboxes_from_keypoints(
-                                    animals[:, keep_inds],
-                                    inferencecfg["boundingboxslack"],
-                                )  # TODO: get cropping parameters and utilize!
-                            else:
-                                xy = animals[:, keep_inds, :2]
-                            trackers = mot_tracker.track(xy)
-                        else:
-                            # Optimal identity assignment based on soft voting
-                            mat = np.zeros(
-                                (len(assemblies), inferencecfg["topktoretain"])
-                            )
-                            for nrow, assembly in enumerate(assemblies):
-                                for k, v in assembly.soft_identity.items():
-                                    mat[nrow, k] = v
-                            inds = linear_sum_assignment(mat, maximize=True)
-                            trackers = np.c_[inds][:, ::-1]
-                        trackingutils.fill_tracklets(
-                            tracklets, trackers, animals, imname
-                        )
-
-                tracklets["header"] = pdindex
-                with open(trackname, "wb") as f:
-                    pickle.dump(tracklets, f, pickle.HIGHEST_PROTOCOL)
+                for index, imname in tqdm(enumerate(imnames)):
+                    builder.track(
+                        imname,
+                        assembly_builder.assemblies.get(index),
+                        assembly_builder.unique.get(index),
+                    )
+                builder.to_pickle(trackname, DLCscorer, all_jointnames)
 
         os.chdir(str(start_path))
 
@@ -12,10 +12,12 @@
 import torch
 import torch.nn as nn
 import numpy as np
+from collections import defaultdict
 from deeplabcut.pose_tracking_pytorch.config import cfg
 from deeplabcut.pose_tracking_pytorch.model import build_dlc_transformer
 from deeplabcut.pose_tracking_pytorch.model.backbones import dlc_base_kpt_TransReID
 from deeplabcut.pose_tracking_pytorch.tracking_utils import (
+    match_coord_in_img_space,
     query_feature_by_coord_in_img_space,
 )
 
@@ -39,7 +41,9 @@ class DLCTrans:
         print("loading params")
         self._load_params(ckpt_dict["state_dict"])
 
+        self.device = default_device("cuda")
         self.model.double()
+        self.model.to(self.device)
         self.model.eval()
 
     def _load_params(self, params):
@@ -58,9 +62,36 @@ class DLCTrans:
 
         return vec_a, vec_b
 
+    def embed(self, vecs, batch_size=256):
+        """Embed keypoint feature vectors in batches.
+
+        Parameters
+        ----------
+        vecs: np.ndarray
+            (n_samples, num_kpts, feature_dim) keypoint features.
+
+        batch_size: int, optional (default=256)
+            Number of samples passed through the transformer at once.
+
+        Returns
+        -------
+        np.ndarray
+            (n_samples, embedding_dim) L2-normalized embeddings, such that
+            the dot product of two embeddings is their cosine similarity.
+        """
+        embeddings = []
+        with torch.no_grad():
+            for start in range(0, len(vecs), batch_size):
+                batch = torch.from_numpy(np.asarray(vecs[start : start + batch_size]))
+                batch = batch.double().to(self.device)
+                embeddings.append(self.model(batch).cpu().numpy())
+        embeddings = np.concatenate(embeddings)
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        return embeddings / np.maximum(norms, self.cos.eps)
+
     def __call__(self, inp_a, inp_b, zfill_width, feature_dict, return_features=False):
         # tracklets
-        device = default_device("cuda")
+        device = self.device
 
         _tuple = self._get_vec(inp_a, inp_b, zfill_width, feature_dict)
         if _tuple is None:
@@ -74,8 +105,8 @@ class DLCTrans:
         vec_b = torch.from_numpy(vec_b).double()
 
         with torch.no_grad():
-            vec_a.to(device)
-            vec_b.to(device)
+            vec_a = vec_a.to(device)
+            vec_b = vec_b.to(device)
 
             vec_a = self.model(vec_a)
             vec_b = self.model(vec_b)
@@ -85,3 +116,81 @@ class DLCTrans:
                 return dist, vec_a, vec_b
             else:
                 return dist
+
+
+class TrackletEmbeddings:
+    """Transformer embeddings of the endpoints of a set of tracklets.
+
+    The first and last detections of every tracklet are matched to the keypoint
+    features stored in ``feature_dict``, and all of them are embedded at once,
+    in batches. Embeddings are cached by (frame, matched animal), so that an
+    endpoint shared by several tracklets is only embedded once.
+
+    Parameters
+    ----------
+    dlctrans: DLCTrans
+        The trained reID transformer.
+
+    tracklets: list of Tracklet
+        Tracklets whose endpoints are embedded.
+
+    feature_dict: dict or shelve.Shelf
+        Keypoint features, as written by ``transformer_reID``.
+
+    zfill_width: int
+        Number of digits of the frame indices in the keys of ``feature_dict``.
+
+    batch_size: int, optional (default=256)
+        Number of endpoints passed through the transformer at once.
+    """
+
+    def __init__(self, dlctrans, tracklets, feature_dict, zfill_width, batch_size=256):
+        self.index = dict()
+        self._heads = dict()
+        self._tails = dict()
+        endpoints = defaultdict(list)
+        for tracklet in tracklets:
+            endpoints[tracklet.inds[0]].append((tracklet, self._heads, 0))
+            endpoints[tracklet.inds[-1]].append((tracklet, self._tails, -1))
+        vecs = []
+        for frame, items in endpoints.items():
+            frame_id = "frame" + str(frame).zfill(zfill_width)
+            frame_data = feature_dict[frame_id]  # Read the shelf only once
+            for tracklet, lookup, ind in items:
+                coord = tracklet.data[ind][:, :2]
+                match = match_coord_in_img_space(frame_data["coordinates"], coord)
+                key = (int(frame), int(match))
+                if key not in self.index:
+                    self.index[key] = len(vecs)
+                    vecs.append(frame_data["features"][match])
+                lookup[tracklet] = self.index[key]
+        if vecs:
+            self.embeddings = dlctrans.embed(np.stack(vecs), batch_size)
+        else:  # No tracklets to embed
+            self.embeddings = np.empty((0, 0))
+
+    def _rows(self, tracklets1, tracklets2):
+        rows1, rows2 = [], []
+        for tracklet1, tracklet2 in zip(tracklets1, tracklets2):
+            # Compare the tail of the preceding tracklet to the head of the other
+            if tracklet1 < tracklet2:
+                rows1.append(self._tails[tracklet1])
+                rows2.append(self._heads[tracklet2])
+            else:
+                rows1.append(self._heads[tracklet1])
+                rows2.append(self._tails[tracklet2])
+        return rows1, rows2
+
+    def similarity(self, tracklets1, tracklets2):
+        """Cosine similarity between the facing endpoints of pairs of tracklets."""
+        rows1, rows2 = self._rows(tracklets1, tracklets2)
+        return np.einsum(
+            "ij,ij->i", self.embeddings[rows1], self.embeddings[rows2]
+        )
+
+    def pairwise(self, tracklets1, tracklets2):
+        """Edge weights of pairs of tracklets; the more similar, the lower."""
+        return -(self.similarity(tracklets1, tracklets2) + 1) / 2
+
+    def __call__(self, tracklet1, tracklet2):
+        return self.pairwise([tracklet1], [tracklet2])[0]
@@ -11,5 +11,6 @@
 from .preprocessing import (
     load_features_from_coord,
     convert_coord_from_img_space_to_feature_space,
+    match_coord_in_img_space,
     query_feature_by_coord_in_img_space,
 )
@@ -52,12 +52,17 @@ def convert_coord_from_img_space_to_feature_space(arr, stride):
     return arr.astype(np.int64)
 
 
+def match_coord_in_img_space(coordinates, ref_coord):
+    """Return the index of the animal in ``coordinates`` matching ``ref_coord``."""
+    diff = coordinates - ref_coord
+    diff[np.where(np.logical_or(diff > 9000, diff < 0))] = np.nan
+    return np.argmin(np.nanmean(diff, axis=(1, 2)))
+
+
 def query_feature_by_coord_in_img_space(feature_dict, frame_id, ref_coord):
     features = feature_dict[frame_id]["features"]
     coordinates = feature_dict[frame_id]["coordinates"]
 
-    diff = coordinates - ref_coord
-    diff[np.where(np.logical_or(diff > 9000, diff < 0))] = np.nan
-    match_id = np.argmin(np.nanmean(diff, axis=(1, 2)))
+    match_id = match_coord_in_img_space(coordinates, ref_coord)
 
     return features[match_id]
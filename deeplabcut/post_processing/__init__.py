@@ -20,3 +20,9 @@ Licensed under GNU Lesser General Public License v3.0
 
 from deeplabcut.post_processing.analyze_skeleton import analyzeskeleton
 from deeplabcut.post_processing.filtering import *
+from deeplabcut.post_processing.streaming import (
+    StreamingKalmanFilter,
+    StreamingMedianFilter,
+    StreamingSplineFilter,
+    filter_h5_in_chunks,
+)
@@ -10,6 +10,7 @@
 #
 
 import argparse
+from multiprocessing import Pool
 from pathlib import Path
 
 import numpy as np
@@ -17,15 +18,144 @@ import pandas as pd
 from scipy import signal
 from scipy.interpolate import CubicSpline
 
-from deeplabcut.refine_training_dataset.outlier_frames import FitSARIMAXModel
+from deeplabcut.refine_training_dataset.outlier_frames import (
+    fit_kalman_smoother,
+    fit_sarimax_models,
+)
 from deeplabcut.utils import auxiliaryfunctions, auxfun_multianimal
 
 
-def columnwise_spline_interp(data, max_gap=0):
+def _find_gaps(missing):
+    """
+    Find the runs of missing values in all columns of a boolean matrix at once.
+
+    Returns
+    -------
+    cols, starts, lengths : arrays
+        Column, first row and length of every run, sorted by column and row.
+    """
+    nrows, ncols = missing.shape
+    padded = np.zeros((ncols, nrows + 2), dtype=np.int8)
+    padded[:, 1:-1] = missing.T
+    edges = np.diff(padded, axis=1)
+    cols, starts = np.nonzero(edges == 1)
+    _, stops = np.nonzero(edges == -1)
+    return cols, starts, stops - starts
+
+
+def _cubic_splines(x, y):
+    """
+    Fit not-a-knot cubic splines through the rows of *x* and *y* all at once.
+
+    Returns
+    -------
+    coefficients of shape (4, n_splines, n_knots - 1), ordered as those of
+    :class:`scipy.interpolate.CubicSpline`.
+    """
+    nsplines, n = x.shape
+    dx = np.diff(x, axis=1)
+    slope = np.diff(y, axis=1) / dx
+    A = np.zeros((nsplines, n, n))
+    b = np.empty((nsplines, n))
+    i = np.arange(1, n - 1)
+    A[:, i, i - 1] = dx[:, 1:]
+    A[:, i, i] = 2 * (dx[:, :-1] + dx[:, 1:])
+    A[:, i, i + 1] = dx[:, :-1]
+    b[:, 1:-1] = 3 * (dx[:, 1:] * slope[:, :-1] + dx[:, :-1] * slope[:, 1:])
+    d = x[:, 2] - x[:, 0]
+    A[:, 0, 0] = dx[:, 1]
+    A[:, 0, 1] = d
+    b[:, 0] = (dx[:, 0] + 2 * d) * dx[:, 1] * slope[:, 0]
+    b[:, 0] += dx[:, 0] ** 2 * slope[:, 1]
+    b[:, 0] /= d
+    d = x[:, -1] - x[:, -3]
+    A[:, -1, -2] = d
+    A[:, -1, -1] = dx[:, -2]
+    b[:, -1] = dx[:, -1] ** 2 * slope[:, -2]
+    b[:, -1] += (2 * d + dx[:, -1]) * dx[:, -2] * slope[:, -1]
+    b[:, -1] /= d
+    s = np.linalg.solve(A, b[..., None])[..., 0]
+    t = (s[:, :-1] + s[:, 1:] - 2 * slope) / dx
+    return np.stack((t / dx, (slope - s[:, :-1]) / dx - t, s[:, :-1], y[:, :-1]))
+
+
+def _fill_gaps(data, max_gap, n_knots, max_batched_knots=64, batch_size=1024):
+    """
+    Fill the gaps of all columns of *data* with cubic splines through the
+    *n_knots* valid points on either side of them. Gaps whose knots overlap
+    share the same spline; splines through few knots are fitted in batches.
+    """
+    nrows, ncols = data.shape
+    filled = data.copy()
+    missing = np.isnan(data)
+    # Make sure there are enough points to fit the cubic spline
+    enough = np.sum(~missing, axis=0) > 3
+    cols, starts, lengths = _find_gaps(missing)
+    mask = enough[cols]
+    if max_gap > 0:
+        mask &= lengths <= max_gap
+    cols, starts, lengths = cols[mask], starts[mask], lengths[mask]
+    if not len(starts):
+        return filled
+
+    # Index the valid points of all columns one after the other
+    flat = data.T.ravel()
+    valid = np.flatnonzero(~missing.T)
+    col_bounds = np.searchsorted(valid, np.arange(ncols + 1) * nrows)
+    after = np.searchsorted(valid, cols * nrows + starts)
+    first = np.maximum(after - n_knots, col_bounds[cols])
+    last = np.minimum(after + n_knots, col_bounds[cols + 1])
+    is_new = np.r_[True, (cols[1:] != cols[:-1]) | (first[1:] >= last[:-1])]
+    groups = np.cumsum(is_new) - 1
+    group_first = first[is_new]
+    group_sizes = last[np.r_[is_new[1:], True]] - group_first
+
+    offsets = np.cumsum(lengths) - lengths
+    rows = np.repeat(starts - offsets, lengths) + np.arange(lengths.sum())
+    row_cols = np.repeat(cols, lengths)
+    row_groups = np.repeat(groups, lengths)
+    order = np.argsort(row_groups, kind="stable")
+    row_bounds = np.searchsorted(row_groups[order], np.arange(len(group_first) + 1))
+
+    for size in np.unique(group_sizes):
+        inds = np.flatnonzero(group_sizes == size)
+        # The not-a-knot conditions of the batched solve need at least 4 knots
+        if size > max_batched_knots or size < 4:
+            for ind in inds:
+                knots = valid[group_first[ind] : group_first[ind] + size]
+                spline = CubicSpline(knots % nrows, flat[knots])
+                sel = order[row_bounds[ind] : row_bounds[ind + 1]]
+                filled[rows[sel], row_cols[sel]] = spline(rows[sel])
+            continue
+        for batch in np.array_split(inds, np.ceil(len(inds) / batch_size)):
+            knots = valid[group_first[batch, None] + np.arange(size)]
+            x = knots % nrows
+            coefs = _cubic_splines(x, flat[knots])
+            sel = np.concatenate(
+                [order[row_bounds[i] : row_bounds[i + 1]] for i in batch]
+            )
+            spline_inds = np.searchsorted(batch, row_groups[sel])
+            r = rows[sel]
+            # Interval of every row, extrapolating beyond the first and last knots
+            j = np.sum(x[spline_inds] < r[:, None], axis=1) - 1
+            j = np.clip(j, 0, size - 2)
+            t = r - x[spline_inds, j]
+            c = coefs[:, spline_inds, j]
+            filled[r, row_cols[sel]] = ((c[0] * t + c[1]) * t + c[2]) * t + c[3]
+    return filled
+
+
+def columnwise_spline_interp(data, max_gap=0, n_knots=20, n_processes=1):
     """
     Perform cubic spline interpolation over the columns of *data*.
-    All gaps of size lower than or equal to *max_gap* are filled,
-    and data slightly smoothed.
+    All gaps of size lower than or equal to *max_gap* are filled.
+
+    Splines are only fitted locally, through the *n_knots* valid points
+    on each side of a gap; with enough knots, the result matches that of
+    a spline through all points. This is fastest when gaps are sparse:
+    when they are closer than *n_knots* valid points from one another
+    throughout a column, their splines merge into one through the whole
+    column.
 
     Parameters
     ----------
@@ -33,36 +163,36 @@ def columnwise_spline_interp(data, max_gap=0):
         2D matrix of data.
     max_gap : int, optional
         Maximum gap size to fill. By default, all gaps are interpolated.
+    n_knots : int, optional
+        Number of valid points on either side of a gap the spline goes through;
+        at least 3.
+    n_processes : int, optional
+        Number of processes the columns are distributed over.
 
     Returns
     -------
     interpolated data with same shape as *data*
     """
+    if n_knots < 3:
+        raise ValueError("Splines should go through at least 3 knots on each side.")
     if np.ndim(data) < 2:
         data = np.expand_dims(data, axis=1)
-    nrows, ncols = data.shape
-    temp = data.copy()
-    valid = ~np.isnan(temp)
-    x = np.arange(nrows)
-    for i in range(ncols):
-        mask = valid[:, i]
-        if (
-            np.sum(mask) > 3
-        ):  # Make sure there are enough points to fit the cubic spline
-            spl = CubicSpline(x[mask], temp[mask, i])
-            y = spl(x)
-            if max_gap > 0:
-                inds = np.flatnonzero(np.r_[True, np.diff(mask), True])
-                count = np.diff(inds)
-                inds = inds[:-1]
-                to_fill = np.ones_like(mask)
-                for ind, n, is_nan in zip(inds, count, ~mask[inds]):
-                    if is_nan and n > max_gap:
-                        to_fill[ind : ind + n] = False
-                y[~to_fill] = np.nan
-            # Get rid of the interpolation beyond the spline knots
-            y[y == 0] = np.nan
-            temp[:, i] = y
+    data = np.asarray(data, dtype=float)
+    n_processes = min(n_processes, data.shape[1])
+    if n_processes > 1:
+        blocks = np.array_split(np.arange(data.shape[1]), n_processes)
+        with Pool(n_processes) as pool:
+            filled = pool.starmap(
+                _fill_gaps, [(data[:, block], max_gap, n_knots) for block in blocks]
+            )
+        temp = np.concatenate(filled, axis=1)
+    else:
+        temp = _fill_gaps(data, max_gap, n_knots)
+    # Get rid of the interpolation beyond the spline knots
+    interpolated = np.sum(~np.isnan(data), axis=0) > 3
+    temp[:, interpolated] = np.where(
+        temp[:, interpolated] == 0, np.nan, temp[:, interpolated]
+    )
     return temp
 
 
@@ -83,11 +213,12 @@ def filterpredictions(
     modelprefix="",
     track_method="",
     return_data=False,
+    chunksize=None,
 ):
     """Fits frame-by-frame pose predictions.
 
-    The pose predictions are fitted with ARIMA model (filtertype='arima') or median
-    filter (default).
+    The pose predictions are fitted with ARIMA model (filtertype='arima'), smoothed
+    with a Kalman filter (filtertype='kalman'), or median filtered (default).
 
     Parameters
     ----------
@@ -107,7 +238,10 @@ def filterpredictions(
         Note that TrainingFraction is a list in config.yaml.
 
     filtertype: string, optional, default="median".
-        The filter type - 'arima', 'median' or 'spline'.
+        The filter type - 'arima', 'kalman', 'median' or 'spline'.
+        'arima' fits a SARIMAX model to every coordinate of every body part, in
+        parallel processes; 'kalman' smooths all of them at once with a constant
+        velocity state-space model, which is much faster.
 
     windowlength: int, optional, default=5
         For filtertype='median' filters the input array using a local window-size given
@@ -117,7 +251,7 @@ def filterpredictions(
         If filtertype='spline', windowlength is the maximal gap size to fill.
 
     p_bound: float between 0 and 1, optional, default=0.001
-        For filtertype 'arima' this parameter defines the likelihood below,
+        For filtertype 'arima' and 'kalman' this parameter defines the likelihood below,
         below which a body part will be consided as missing data for filtering purposes.
 
     ARdegree: int, optional, default=3
@@ -152,6 +286,14 @@ def filterpredictions(
     return_data: bool, optional, default=False
         If True, returns a dictionary of the filtered data keyed by video names.
 
+    chunksize: int or None, optional, default=None
+        If given, the data are read, filtered and written by chunks of that many
+        frames, rather than loaded at once; see
+        :mod:`deeplabcut.post_processing.streaming`. This is not supported by
+        filtertype 'arima', nor for data stored in fixed rather than table format,
+        which are filtered in memory; filtertype 'spline' then requires a
+        positive windowlength.
+
     Returns
     -------
     video_to_filtered_df
@@ -226,11 +368,12 @@ def filterpredictions(
         vname = Path(video).stem
 
         try:
-            df, filepath, _, _ = auxiliaryfunctions.load_analyzed_data(
+            filepath, _, _ = auxiliaryfunctions.find_analyzed_data(
                 destfolder, vname, DLCscorer, True, track_method
             )
             print(f"Data from {vname} were already filtered. Skipping...")
-            video_to_filtered_df[video] = df
+            if return_data:
+                video_to_filtered_df[video] = pd.read_hdf(filepath)
             # Data has been filtered so continue to the next video
             continue
         except FileNotFoundError:
@@ -238,7 +381,7 @@ def filterpredictions(
 
         # Data haven't been filtered yet
         try:
-            df, filepath, _, _ = auxiliaryfunctions.load_analyzed_data(
+            filepath, _, _ = auxiliaryfunctions.find_analyzed_data(
                 destfolder, vname, DLCscorer, track_method=track_method
             )
         except FileNotFoundError as e:
@@ -246,21 +389,46 @@ def filterpredictions(
             print(e)
             continue
 
+        outdataname = filepath.replace(".h5", "_filtered.h5")
+        chunked = chunksize is not None and filtertype != "arima"
+        if chunked:
+            from deeplabcut.post_processing import streaming
+
+            if not streaming.is_table(filepath):
+                print(
+                    f"{filepath} is not stored in table format and cannot be read "
+                    "in chunks; filtering it in memory."
+                )
+                chunked = False
+        if chunked:
+            pose_filter = streaming.get_streaming_filter(
+                filtertype, windowlength, p_bound
+            )
+            csv_file = None
+            if save_as_csv:
+                csv_file = outdataname.split(".h5")[0] + ".csv"
+            streaming.filter_h5_in_chunks(
+                filepath, pose_filter, outdataname, chunksize, csv_file=csv_file
+            )
+            if return_data:
+                video_to_filtered_df[video] = pd.read_hdf(outdataname)
+            continue
+
+        df = pd.read_hdf(filepath)
         nrows = df.shape[0]
-        if filtertype == "arima":
+        if filtertype in ("arima", "kalman"):
             temp = df.values.reshape((nrows, -1, 3))
-            placeholder = np.empty_like(temp)
-            for i in range(temp.shape[1]):
-                x, y, p = temp[:, i].T
-                meanx, _ = FitSARIMAXModel(
-                    x, p, p_bound, alpha, ARdegree, MAdegree, False
-                )
-                meany, _ = FitSARIMAXModel(
-                    y, p, p_bound, alpha, ARdegree, MAdegree, False
+            xy = temp[..., :2].reshape((nrows, -1))
+            p = np.repeat(temp[..., 2], 2, axis=1)
+            if filtertype == "arima":
+                means, _ = fit_sarimax_models(
+                    xy, p, p_bound, alpha, ARdegree, MAdegree
                 )
-                meanx[0] = x[0]
-                meany[0] = y[0]
-                placeholder[:, i] = np.c_[meanx, meany, p]
+            else:
+                means, _ = fit_kalman_smoother(xy, p, p_bound, alpha)
+            means[0] = xy[0]
+            placeholder = temp.copy()
+            placeholder[..., :2] = means.reshape((nrows, -1, 2))
             data = pd.DataFrame(
                 placeholder.reshape((nrows, -1)),
                 columns=df.columns,
@@ -294,7 +462,6 @@ def filterpredictions(
 
         video_to_filtered_df[video] = data
 
-        outdataname = filepath.replace(".h5", "_filtered.h5")
         data.to_hdf(outdataname, "df_with_missing", format="table", mode="w")
         if save_as_csv:
             print("Saving filtered csv poses!")
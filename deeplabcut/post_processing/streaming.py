@@ -0,0 +1,413 @@
+#
+# DeepLabCut Toolbox (deeplabcut.org)
+# © A. & M.W. Mathis Labs
+# https://github.com/DeepLabCut/DeepLabCut
+#
+# Please see AUTHORS for contributors.
+# https://github.com/DeepLabCut/DeepLabCut/blob/master/AUTHORS
+#
+# Licensed under GNU Lesser General Public License v3.0
+#
+"""
+Filters of pose data fed frame by frame, or chunk by chunk.
+
+Data are arrays of shape (n_frames, 3 * n_keypoints) holding the x, y and
+likelihood of every keypoint, in the column order of DeepLabCut's dataframes.
+Filters keep the state they need across calls, so that a recording filtered in
+chunks gives the same result as if it were filtered at once, with memory bound by
+the chunk size. Filtered frames are returned as soon as they are final, which may
+be a few frames later than they were passed in; :meth:`StreamingFilter.flush`
+returns the remaining ones at the end of the stream.
+"""
+
+import abc
+
+import numpy as np
+import pandas as pd
+from scipy import signal
+
+from deeplabcut.post_processing.filtering import _fill_gaps, _find_gaps
+from deeplabcut.refine_training_dataset.outlier_frames import (
+    _STATE_COV,
+    _kalman_predict,
+    _kalman_update,
+    _rts_smoother,
+    _select_noise_ratios,
+)
+
+
+class StreamingFilter(metaclass=abc.ABCMeta):
+    """Base class of filters of pose data streams."""
+
+    def update(self, data):
+        """
+        Feed the next frames of the stream to the filter.
+
+        Parameters
+        ----------
+        data : array_like
+            Array of shape (n_frames, 3 * n_keypoints); a single frame may also be
+            passed as a 1D array.
+
+        Returns
+        -------
+        Array of shape (n_filtered_frames, 3 * n_keypoints) of the frames whose
+        filtered values are final, in order.
+        """
+        data = np.array(data, dtype=float, ndmin=2)
+        return self._update(data)
+
+    @abc.abstractmethod
+    def flush(self):
+        """Return the frames still held back, and reset the filter."""
+        pass
+
+    @abc.abstractmethod
+    def _update(self, data):
+        pass
+
+    @staticmethod
+    def _coords_mask(ncols):
+        return np.arange(ncols) % 3 != 2
+
+
+class StreamingMedianFilter(StreamingFilter):
+    """
+    Median filter of the keypoint coordinates, equivalent to
+    ``scipy.signal.medfilt`` over the whole stream (zero-padded at both ends).
+
+    Parameters
+    ----------
+    windowlength : int, optional
+        Odd size of the median window. Frames are returned windowlength // 2
+        frames late.
+    """
+
+    def __init__(self, windowlength=5):
+        if windowlength % 2 != 1:
+            raise ValueError("The window length should be an odd number.")
+        self.windowlength = windowlength
+        self._history = None
+
+    def _update(self, data):
+        half = self.windowlength // 2
+        if self._history is None:
+            self._history = np.zeros((half, data.shape[1]))
+        buffer = np.concatenate((self._history, data))
+        self._history = buffer[max(0, len(buffer) - 2 * half) :]
+        return self._filter(buffer)
+
+    def _filter(self, buffer):
+        # Only frames whose window lies entirely in the buffer are final
+        half = self.windowlength // 2
+        filtered = buffer[half : len(buffer) - half].copy()
+        if not len(filtered):
+            return filtered
+        mask = self._coords_mask(buffer.shape[1])
+        medians = signal.medfilt(buffer[:, mask], (self.windowlength, 1))
+        filtered[:, mask] = medians[half : len(buffer) - half]
+        return filtered
+
+    def flush(self):
+        if self._history is None:
+            return np.empty((0, 0))
+        half = self.windowlength // 2
+        buffer = np.concatenate(
+            (self._history, np.zeros((half, self._history.shape[1])))
+        )
+        self._history = None
+        return self._filter(buffer)
+
+
+class StreamingSplineFilter(StreamingFilter):
+    """
+    Fill gaps of up to *max_gap* missing coordinates with cubic splines through
+    the *n_knots* valid points on either side of them, as in
+    :func:`~deeplabcut.post_processing.filtering.columnwise_spline_interp`.
+    The likelihood of filled keypoints is set to 0.01.
+
+    A gap is filled once enough valid points follow it for its spline to be
+    final; frames are held back until then, but never more than *max_delay*
+    frames. Knots are looked up at most *max_history* frames in the past.
+    """
+
+    def __init__(self, max_gap=5, n_knots=20, max_history=None, max_delay=None):
+        if max_gap < 1:
+            raise ValueError("Only gaps of bounded size can be filled on the fly.")
+        if n_knots < 3:
+            raise ValueError("Splines should go through at least 3 knots on each side.")
+        self.max_gap = max_gap
+        self.n_knots = n_knots
+        if max_history is None:
+            max_history = 2 * n_knots * (max_gap + 1)
+        self.max_history = max_history
+        if max_delay is None:
+            max_delay = max_history
+        self.max_delay = max_delay
+        self._buffer = None
+        self._n_released = 0
+
+    def _update(self, data):
+        if self._buffer is None:
+            self._buffer = data
+        else:
+            self._buffer = np.concatenate((self._buffer, data))
+        return self._release(final=False)
+
+    def flush(self):
+        if self._buffer is None:
+            return np.empty((0, 0))
+        filtered = self._release(final=True)
+        self._buffer = None
+        self._n_released = 0
+        return filtered
+
+    def _release(self, final):
+        buffer = self._buffer
+        mask = self._coords_mask(buffer.shape[1])
+        xy = buffer[:, mask]
+        nrows, ncols = xy.shape
+        missing = np.isnan(xy)
+        stop = nrows
+        if not final:
+            # Gaps that may still grow, or whose spline may still change
+            cols, starts, lengths = _find_gaps(missing)
+            n_valid = np.cumsum(~missing, axis=0)
+            n_after = n_valid[-1, cols] - n_valid[starts + lengths - 1, cols]
+            pending = (lengths <= self.max_gap) & (n_after < 2 * self.n_knots)
+            pending &= starts >= self._n_released
+            if np.any(pending):
+                stop = max(starts[pending].min(), nrows - self.max_delay)
+        if stop <= self._n_released:
+            return buffer[:0]
+
+        xy_filled = _fill_gaps(xy, self.max_gap, self.n_knots)
+        # Get rid of the interpolation beyond the spline knots
+        xy_filled[xy_filled == 0] = np.nan
+        filtered = buffer[self._n_released : stop].copy()
+        rows = slice(self._n_released, stop)
+        filled = missing[rows] & ~np.isnan(xy_filled[rows])
+        filtered[:, mask] = np.where(filled, xy_filled[rows], xy[rows])
+        filled_keypoints = filled[:, ::2] | filled[:, 1::2]
+        filtered[:, ~mask] = np.where(filled_keypoints, 0.01, filtered[:, ~mask])
+
+        # Keep enough past frames to provide the knots of the next gaps
+        start = max(0, stop - self.max_history)
+        self._buffer = buffer[start:]
+        self._n_released = stop - start
+        return filtered
+
+
+class StreamingKalmanFilter(StreamingFilter):
+    """
+    Smooth keypoint coordinates with the constant velocity state-space model of
+    :func:`~deeplabcut.refine_training_dataset.outlier_frames.fit_kalman_smoother`.
+
+    Every frame is smoothed given at least the *lag* following frames, through
+    a Kalman filter and an RTS smoother over the frames held back; as long as
+    the lag exceeds the gaps in the data, this matches smoothing the whole
+    recording. The noise ratios of the model are selected on the first
+    *n_calibration* frames. Coordinates whose likelihood is below *p_bound* are
+    treated as missing.
+    """
+
+    def __init__(
+        self,
+        p_bound=0.001,
+        lag=30,
+        n_calibration=1000,
+        ratios=np.logspace(-4, 2, 13),
+    ):
+        self.p_bound = p_bound
+        self.lag = lag
+        self.n_calibration = n_calibration
+        self.ratios = ratios
+        self._reset()
+
+    def _reset(self):
+        self._calibration = []
+        self._n_calibration_frames = 0
+        self._Q = None
+        self._m = None
+        self._C = None
+        self._data = []
+        self._means = []
+        self._covs = []
+
+    def _update(self, data):
+        if self._Q is None:
+            self._calibration.append(data)
+            self._n_calibration_frames += len(data)
+            if self._n_calibration_frames < self.n_calibration:
+                return data[:0]
+            data = self._calibrate()
+        return self._filter(data, self.lag)
+
+    def flush(self):
+        if self._Q is None:
+            if not self._n_calibration_frames:
+                self._reset()
+                return np.empty((0, 0))
+            data = self._calibrate()
+        else:
+            data = np.empty((0, self._data[0].shape[1]))
+        filtered = self._filter(data, 0)
+        self._reset()
+        return filtered
+
+    def _observations(self, data):
+        mask = self._coords_mask(data.shape[1])
+        p = np.repeat(data[:, ~mask], 2, axis=1)
+        return np.where(p >= self.p_bound, data[:, mask], np.nan)
+
+    def _calibrate(self):
+        data = np.concatenate(self._calibration)
+        Y = self._observations(data)
+        self._ratios = np.ones(Y.shape[1])
+        calibrated = np.sum(np.isfinite(Y), axis=0) > 10
+        self._ratios[calibrated] = _select_noise_ratios(
+            Y[:, calibrated], self.ratios
+        )
+        self._Q = self._ratios[:, None, None] * _STATE_COV
+        self._m = np.full((Y.shape[1], 2), np.nan)
+        self._C = np.zeros((Y.shape[1], 2, 2))
+        self._calibration = []
+        return data
+
+    def _filter(self, data, lag):
+        Y = self._observations(data)
+        m, C = self._m, self._C
+        means = np.empty((len(Y), *m.shape))
+        covs = np.empty((len(Y), *C.shape))
+        for t, y in enumerate(Y):
+            m, C = _kalman_predict(m, C, self._Q)
+            # Start at rest on the first observation of a series
+            start = np.isnan(m[:, 0]) & np.isfinite(y)
+            m[start] = np.c_[y[start], np.zeros(start.sum())]
+            C[start] = np.diag([1.0, 1e4])
+            m, C, _, _ = _kalman_update(m, C, y)
+            means[t] = m
+            covs[t] = C
+        self._m, self._C = m, C
+        self._data.append(data)
+        self._means.append(means)
+        self._covs.append(covs)
+
+        data = np.concatenate(self._data)
+        means = np.concatenate(self._means)
+        covs = np.concatenate(self._covs)
+        n_released = max(0, len(data) - lag)
+        # Keep the filtered, not smoothed, states of the frames held back
+        self._data = [data[n_released:]]
+        self._means = [means[n_released:]]
+        self._covs = [covs[n_released:]]
+        if not n_released:
+            return data[:0]
+        means, _ = _rts_smoother(means.copy(), covs.copy(), self._ratios)
+        filtered = data[:n_released].copy()
+        filtered[:, self._coords_mask(data.shape[1])] = means[:n_released, :, 0]
+        return filtered
+
+
+def get_streaming_filter(filtertype, windowlength=5, p_bound=0.001):
+    """
+    Create the streaming counterpart of a filter of ``filterpredictions``.
+
+    Parameters
+    ----------
+    filtertype : str
+        'median', 'spline' or 'kalman'.
+    windowlength : int, optional
+        Window size of the median filter, or maximal gap size filled by splines.
+    p_bound : float, optional
+        Likelihood below which coordinates are missing data for the Kalman filter.
+    """
+    if filtertype == "median":
+        return StreamingMedianFilter(windowlength)
+    elif filtertype == "spline":
+        return StreamingSplineFilter(windowlength)
+    elif filtertype == "kalman":
+        return StreamingKalmanFilter(p_bound)
+    raise ValueError(f"Unknown streaming filter type {filtertype}")
+
+
+def is_table(h5file, key=None):
+    """
+    Whether the data stored under *key* in *h5file* (by default, its only key)
+    are in table format, and can thus be read in chunks.
+    """
+    with pd.HDFStore(h5file, "r") as store:
+        if key is None:
+            key = store.keys()[0]
+        return store.get_storer(key).is_table
+
+
+def filter_h5_in_chunks(
+    h5file,
+    pose_filter,
+    output_file,
+    chunksize=10000,
+    key=None,
+    csv_file=None,
+):
+    """
+    Filter the pose data stored in *h5file* chunk by chunk, so that recordings
+    need not fit in memory.
+
+    Parameters
+    ----------
+    h5file : str
+        Path to data stored as a table, as written by ``analyze_videos``;
+        a ValueError is raised for data in fixed format.
+    pose_filter : StreamingFilter
+        Filter to run over the data.
+    output_file : str
+        Path to the filtered data; overwritten if it exists.
+    chunksize : int, optional
+        Number of frames read at once.
+    key : str, optional
+        Key of the data in *h5file*; by default, its only key, as
+        :func:`pandas.read_hdf` does. Filtered data are stored under
+        'df_with_missing'.
+    csv_file : str, optional
+        If given, the filtered data are also written to that .csv file.
+
+    Returns
+    -------
+    int
+        Number of filtered frames.
+    """
+    n_written = 0
+    with pd.HDFStore(h5file, "r") as store:
+        if key is None:
+            key = store.keys()[0]
+        storer = store.get_storer(key)
+        if not storer.is_table:
+            raise ValueError(
+                f"{h5file} is not stored in table format and cannot be read in chunks."
+            )
+        index = None
+        columns = None
+        with pd.HDFStore(output_file, "w") as out:
+
+            def write(filtered):
+                nonlocal index, n_written
+                if len(filtered):
+                    df = pd.DataFrame(
+                        filtered, columns=columns, index=index[: len(filtered)]
+                    )
+                    out.append("df_with_missing", df, format="table")
+                    if csv_file is not None:
+                        header = not n_written
+                        df.to_csv(csv_file, mode="w" if header else "a", header=header)
+                    index = index[len(filtered) :]
+                    n_written += len(filtered)
+
+            for start in range(0, storer.nrows, chunksize):
+                chunk = store.select(key, start=start, stop=start + chunksize)
+                columns = chunk.columns
+                index = chunk.index if index is None else index.append(chunk.index)
+                write(pose_filter.update(chunk.to_numpy()))
+            if columns is not None:
+                write(pose_filter.flush())
+    return n_written
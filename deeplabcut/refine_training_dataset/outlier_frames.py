@@ -14,6 +14,8 @@ import argparse
 import os
 import pickle
 import re
+from functools import partial
+from multiprocessing import Pool
 from pathlib import Path
 from typing import List, Optional
 
@@ -21,9 +23,11 @@ import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
 import statsmodels.api as sm
+from scipy.stats import norm
 from skimage.util import img_as_ubyte
 
 from deeplabcut.pose_estimation_tensorflow.lib import inferenceutils
+from deeplabcut.pose_estimation_tensorflow.lib.detectionutils import read_detections
 from deeplabcut.utils import (
     auxiliaryfunctions,
     auxfun_multianimal,
@@ -53,7 +57,7 @@ def find_outliers_in_raw_data(
         Absolute path to the project config.yaml.
 
     pickled_file : str
-        Path to a *_full.pickle or *_assemblies.pickle.
+        Path to a *_full.pickle, *_full.detections or *_assemblies.pickle.
 
     video_file : str
         Path to the corresponding video file for frame extraction.
@@ -86,12 +90,13 @@ def find_outliers_in_raw_data(
     if not pickle_name.startswith(video_name):
         raise ValueError("Video and pickle files do not match.")
 
-    with open(pickle_file, "rb") as file:
-        data = pickle.load(file)
-    if pickle_file.endswith("_full.pickle"):
+    if pickle_file.endswith(("_full.pickle", "_full.detections")):
+        data = read_detections(pickle_file)
         inds, data = find_outliers_in_raw_detections(data, threshold=pcutoff)
         with_annotations = False
     elif pickle_file.endswith("_assemblies.pickle"):
+        with open(pickle_file, "rb") as file:
+            data = pickle.load(file)
         assemblies = dict()
         for k, lst in data.items():
             if k == "single":
@@ -129,7 +134,8 @@ def find_outliers_in_raw_detections(
     Parameter
     ----------
     pickled_data : dict
-        Data in the *_full.pickle file obtained after `analyze_videos`.
+        Raw detections obtained after `analyze_videos`, as read with
+        `detectionutils.read_detections`.
 
     algo : string, optional (default="uncertain")
         Outlier detection algorithm. Currently, only 'uncertain' is supported
@@ -151,17 +157,14 @@ def find_outliers_in_raw_detections(
     if algo != "uncertain":
         raise ValueError(f"Only method 'uncertain' is currently supported.")
 
-    try:
-        _ = pickled_data.pop("metadata")
-    except KeyError:
-        pass
-
     def get_frame_ind(s):
         return int(re.findall(r"\d+", s)[0])
 
     candidates = []
     data = dict()
     for frame_name, dict_ in pickled_data.items():
+        if frame_name == "metadata":
+            continue
         frame_ind = get_frame_ind(frame_name)
         temp_coords = dict_["coordinates"][0]
         temp = dict_["confidence"]
@@ -200,6 +203,7 @@ def extract_outlier_frames(
     destfolder=None,
     modelprefix="",
     track_method="",
+    fitting_model="kalman",
 ):
     """Extracts the outlier frames.
 
@@ -320,6 +324,12 @@ def extract_outlier_frames(
          For multiple animals, must be either 'box', 'skeleton', or 'ellipse' and will
          be taken from the config.yaml file if none is given.
 
+    fitting_model: str, optional, default="kalman"
+        For outlieralgorithm ``'fitting'``: ``'kalman'`` smooths all body parts at
+        once with a constant velocity state-space model; ``'sarimax'`` fits an ARIMA
+        model of degrees ``ARdegree`` and ``MAdegree`` to every body part and
+        coordinate, which is much slower.
+
     Returns
     -------
     None
@@ -411,7 +421,13 @@ def extract_outlier_frames(
                 Indices.extend(ind)
             elif outlieralgorithm == "fitting":
                 d, o = compute_deviations(
-                    df_temp, dataname, p_bound, alpha, ARdegree, MAdegree
+                    df_temp,
+                    dataname,
+                    p_bound,
+                    alpha,
+                    ARdegree,
+                    MAdegree,
+                    model=fitting_model,
                 )
                 # Some heuristics for extracting frames based on distance:
                 ind = np.flatnonzero(
@@ -576,21 +592,242 @@ def FitSARIMAXModel(x, p, pcutoff, alpha, ARdegree, MAdegree, nforecast=0, disp=
         return np.nan * np.zeros(len(Y)), np.nan * np.zeros((len(Y), 2))
 
 
+def fit_sarimax_models(
+    X, P, pcutoff, alpha, ARdegree, MAdegree, nforecast=0, n_processes=None
+):
+    """Fit a SARIMAX model to every column of *X* in a pool of processes.
+
+    Parameters
+    ----------
+    X : array_like
+        2D matrix of shape (n_frames, n_series) of coordinates.
+    P : array_like
+        Likelihoods of the same shape as *X*.
+    n_processes : int, optional
+        Number of processes; by default, as many as there are cores.
+
+    Returns
+    -------
+    means, CIs : arrays of shape (n_frames, n_series) and (n_frames, n_series, 2)
+    """
+    X = np.asarray(X, dtype=float)
+    P = np.asarray(P, dtype=float)
+    func = partial(
+        FitSARIMAXModel,
+        pcutoff=pcutoff,
+        alpha=alpha,
+        ARdegree=ARdegree,
+        MAdegree=MAdegree,
+        nforecast=nforecast,
+    )
+    if n_processes is None:
+        n_processes = os.cpu_count() or 1
+    n_processes = min(n_processes, X.shape[1])
+    if n_processes > 1:
+        with Pool(n_processes) as pool:
+            results = pool.starmap(func, zip(X.T, P.T))
+    else:
+        results = [func(x, p) for x, p in zip(X.T, P.T)]
+    means, CIs = zip(*results)
+    return np.stack(means, axis=1), np.stack(CIs, axis=1)
+
+
+# Constant velocity model, with the acceleration noise integrated over a frame
+_TRANSITION = np.array([[1.0, 1.0], [0.0, 1.0]])
+_STATE_COV = np.array([[1 / 3, 1 / 2], [1 / 2, 1.0]])
+
+
+def _kalman_step(m, C, y, Q):
+    """Predict the states of all series one frame ahead, and update them with *y*.
+
+    The observation noise has unit variance; NaNs in *y* are missing observations.
+
+    Returns
+    -------
+    m, C : updated state means and covariances
+    innovation, S : prediction errors (0 if missing) and their variances
+    """
+    return _kalman_update(*_kalman_predict(m, C, Q), y)
+
+
+def _kalman_predict(m, C, Q):
+    F = _TRANSITION
+    return m @ F.T, F @ C @ F.T + Q
+
+
+def _kalman_update(m, C, y):
+    obs = np.isfinite(y)
+    S = C[:, 0, 0] + 1
+    K = C[:, :, 0] / S[:, None]
+    innovation = np.where(obs, y - m[:, 0], 0)
+    m = m + K * innovation[:, None]
+    C = C - obs[:, None, None] * K[:, :, None] * C[:, None, 0]
+    return m, C, innovation, S
+
+
+def _kalman_filter(Y, ratios, store=True):
+    """Run a Kalman filter over all columns of *Y* at once.
+
+    The observation noise has unit variance and the acceleration noise a variance of
+    *ratios*, one per column; NaNs are treated as missing observations.
+
+    Returns
+    -------
+    means, covs : arrays of shape (n_frames, n_series, 2) and (..., 2, 2)
+        Filtered states, only returned if *store* is True.
+    scale : array of shape (n_series,)
+        Maximum likelihood estimate of the observation noise variance.
+    loglik : array of shape (n_series,)
+        Log-likelihood of the observations given that variance, up to a constant.
+    """
+    nframes, n = Y.shape
+    observed = np.isfinite(Y)
+    Q = ratios[:, None, None] * _STATE_COV
+    # Start at rest on the first observation, with a vague prior on the velocity
+    m = np.zeros((n, 2))
+    m[:, 0] = Y[np.argmax(observed, axis=0), np.arange(n)]
+    C = np.zeros((n, 2, 2))
+    C[:, 0, 0] = 1
+    C[:, 1, 1] = 1e4
+    sumsq = np.zeros(n)
+    sumlog = np.zeros(n)
+    if store:
+        means = np.empty((nframes, n, 2))
+        covs = np.empty((nframes, n, 2, 2))
+    for t in range(nframes):
+        if t:
+            m, C, innovation, S = _kalman_step(m, C, Y[t], Q)
+        else:
+            m, C, innovation, S = _kalman_update(m, C, Y[t])
+        sumsq += innovation**2 / S
+        sumlog += observed[t] * np.log(S)
+        if store:
+            means[t] = m
+            covs[t] = C
+    nobs = observed.sum(axis=0)
+    scale = sumsq / nobs
+    loglik = -0.5 * (nobs * np.log(scale) + sumlog)
+    if store:
+        return means, covs, scale, loglik
+    return scale, loglik
+
+
+def _rts_smoother(means, covs, ratios):
+    """Rauch-Tung-Striebel smoothing of the output of :func:`_kalman_filter`, in place."""
+    F = _TRANSITION
+    Q = ratios[:, None, None] * _STATE_COV
+    for t in range(len(means) - 2, -1, -1):
+        C_pred = F @ covs[t] @ F.T + Q
+        G = covs[t] @ F.T @ np.linalg.inv(C_pred)
+        means[t] += (G @ (means[t + 1] - means[t] @ F.T)[..., None])[..., 0]
+        covs[t] += G @ (covs[t + 1] - C_pred) @ np.swapaxes(G, 1, 2)
+    return means, covs
+
+
+def _select_noise_ratios(Y, ratios):
+    """Pick, for every column of *Y*, the noise ratio maximizing the likelihood."""
+    best = np.full(Y.shape[1], -np.inf)
+    best_ratios = np.empty(Y.shape[1])
+    for ratio in ratios:
+        _, loglik = _kalman_filter(Y, np.full(Y.shape[1], ratio), store=False)
+        better = loglik > best
+        best[better] = loglik[better]
+        best_ratios[better] = ratio
+    return best_ratios
+
+
+def fit_kalman_smoother(
+    X, P, pcutoff, alpha, min_observations=10, ratios=np.logspace(-4, 2, 13)
+):
+    """Smooth all columns of *X* at once with a Kalman filter and RTS smoother.
+
+    A constant velocity state-space model is fitted to every column: the ratio of
+    acceleration to observation noise is chosen among *ratios* by maximum
+    likelihood, and the observation noise is estimated in closed form. This replaces
+    one SARIMAX fit per series by a few passes over the frames, each batched over
+    all series. Estimates whose likelihood is below *pcutoff* are treated as
+    missing data.
+
+    Parameters
+    ----------
+    X : array_like
+        2D matrix of shape (n_frames, n_series) of coordinates.
+    P : array_like
+        Likelihoods of the same shape as *X*.
+    pcutoff : float
+        Likelihood below which an estimate is considered missing.
+    alpha : float
+        Significance level of the confidence intervals.
+    min_observations : int, optional
+        Series with fewer valid estimates are returned as NaNs.
+    ratios : array_like, optional
+        Candidate ratios of acceleration to observation noise variance.
+
+    Returns
+    -------
+    means, CIs : arrays of shape (n_frames, n_series) and (n_frames, n_series, 2)
+        Smoothed coordinates and the confidence intervals of the observations.
+    """
+    X = np.asarray(X, dtype=float)
+    P = np.asarray(P, dtype=float)
+    if X.ndim < 2:
+        X = np.expand_dims(X, axis=1)
+        P = np.expand_dims(P, axis=1)
+    nframes, nseries = X.shape
+    Y = np.where(P >= pcutoff, X, np.nan)
+    valid = np.isfinite(Y).sum(axis=0) > min_observations
+    Y = Y[:, valid]
+
+    best_ratios = _select_noise_ratios(Y, ratios)
+    means, covs, scale, _ = _kalman_filter(Y, best_ratios)
+    means, covs = _rts_smoother(means, covs, best_ratios)
+
+    mean = np.full((nframes, nseries), np.nan)
+    mean[:, valid] = means[..., 0]
+    halfwidth = np.full((nframes, nseries), np.nan)
+    sd = np.sqrt(scale * (covs[:, :, 0, 0] + 1))
+    halfwidth[:, valid] = norm.ppf(1 - alpha / 2) * sd
+    CI = np.stack((mean - halfwidth, mean + halfwidth), axis=-1)
+    return mean, CI
+
+
 def compute_deviations(
-    Dataframe, dataname, p_bound, alpha, ARdegree, MAdegree, storeoutput=None
+    Dataframe,
+    dataname,
+    p_bound,
+    alpha,
+    ARdegree,
+    MAdegree,
+    storeoutput=None,
+    model="kalman",
 ):
-    """Fits Seasonal AutoRegressive Integrated Moving Average with eXogenous regressors model to data and computes confidence interval
-    as well as mean fit."""
+    """Fits state-space models to data and computes confidence interval as well as
+    mean fit.
+
+    With ``model="kalman"``, all coordinates are smoothed at once with a constant
+    velocity model (see :func:`fit_kalman_smoother`); with ``model="sarimax"``, a
+    Seasonal AutoRegressive Integrated Moving Average with eXogenous regressors model
+    of degrees ``ARdegree`` and ``MAdegree`` is fitted to every coordinate, in
+    parallel processes."""
 
-    print("Fitting state-space models with parameters:", ARdegree, MAdegree)
     df_x, df_y, df_likelihood = Dataframe.values.reshape((Dataframe.shape[0], -1, 3)).T
+    xy = np.concatenate((df_x, df_y)).T
+    p = np.concatenate((df_likelihood, df_likelihood)).T
+    if model == "kalman":
+        print("Fitting constant velocity state-space models...")
+        means, CIs = fit_kalman_smoother(xy, p, p_bound, alpha)
+    elif model == "sarimax":
+        print("Fitting state-space models with parameters:", ARdegree, MAdegree)
+        means, CIs = fit_sarimax_models(xy, p, p_bound, alpha, ARdegree, MAdegree)
+    else:
+        raise ValueError(f"Unknown state-space model {model}.")
     preds = []
-    for row in range(len(df_x)):
+    nbodyparts = df_x.shape[0]
+    for row in range(nbodyparts):
         x = df_x[row]
         y = df_y[row]
-        p = df_likelihood[row]
-        meanx, CIx = FitSARIMAXModel(x, p, p_bound, alpha, ARdegree, MAdegree)
-        meany, CIy = FitSARIMAXModel(y, p, p_bound, alpha, ARdegree, MAdegree)
+        meanx, CIx = means[:, row], CIs[:, row]
+        meany, CIy = means[:, nbodyparts + row], CIs[:, nbodyparts + row]
         distance = np.sqrt((x - meanx) ** 2 + (y - meany) ** 2)
         significant = (
             (x < CIx[:, 0]) + (x > CIx[:, 1]) + (y < CIy[:, 0]) + (y > CIy[:, 1])
@@ -793,7 +1030,8 @@ def ExtractFramesbasedonPreselection(
     print("Let's select frames indices:", frames2pick)
     colors = visualization.get_cmap(len(bodyparts), cfg["colormap"])
     strwidth = int(np.ceil(np.log10(nframes)))  # width for strings
-    for index in frames2pick:  ##tqdm(range(0,nframes,10)):
+    # Frames are visited in order, so each part of the video is decoded at most once
+    for index in sorted(frames2pick):
         if opencv:
             PlottingSingleFramecv2(
                 vid,
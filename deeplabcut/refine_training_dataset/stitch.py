@@ -8,7 +8,9 @@
 #
 # Licensed under GNU Lesser General Public License v3.0
 #
+import copy
 import matplotlib.pyplot as plt
+import multiprocessing
 import networkx as nx
 import numpy as np
 import os
@@ -22,7 +24,6 @@ from collections import defaultdict
 
 import deeplabcut
 from deeplabcut.utils.auxfun_videos import VideoWriter
-from functools import partial
 from deeplabcut.pose_estimation_tensorflow.lib.trackingutils import (
     calc_iou,
     TRACK_METHODS,
@@ -31,14 +32,15 @@ from deeplabcut.utils import auxiliaryfunctions, auxfun_multianimal
 from itertools import combinations, cycle
 from networkx.algorithms.flow import preflow_push
 from pathlib import Path
+from scipy import sparse
 from scipy.linalg import hankel
+from scipy.optimize import linear_sum_assignment, linprog
 from scipy.spatial.distance import directed_hausdorff
 from scipy.stats import mode
-from tqdm import trange
 
 
 class Tracklet:
-    def __init__(self, data, inds):
+    def __init__(self, data, inds, dtype=np.float64):
         """
         Create a Tracklet object.
 
@@ -49,6 +51,8 @@ class Tracklet:
             dimension is for x, y, likelihood and, optionally, identity.
         inds : array-like
             Corresponding time frame indices.
+        dtype : data-type, optional
+            Floating point type the data are copied to; float64 by default.
         """
         if data.ndim != 3 or data.shape[-1] not in (3, 4):
             raise ValueError("Data must of shape (nframes, nbodyparts, 3 or 4)")
@@ -58,15 +62,40 @@ class Tracklet:
                 "Data and corresponding indices must have the same length."
             )
 
-        self.data = data.astype(np.float64)
+        self.data = data.astype(dtype)
         self.inds = np.array(inds)
-        monotonically_increasing = all(a < b for a, b in zip(inds, inds[1:]))
+        monotonically_increasing = np.all(np.diff(self.inds) > 0)
         if not monotonically_increasing:
             idx = np.argsort(inds, kind="mergesort")  # For stable sort with duplicates
             self.inds = self.inds[idx]
             self.data = self.data[idx]
         self._centroid = None
 
+    @classmethod
+    def from_view(cls, data, inds, centroid=None):
+        """
+        Wrap data and time indices that are already sorted, without copying them;
+        the Tracklet is thus a view on the arrays passed in.
+        """
+        tracklet = cls.__new__(cls)
+        tracklet.data = data
+        tracklet.inds = inds
+        tracklet._centroid = centroid
+        return tracklet
+
+    @classmethod
+    def concatenate(cls, tracklets):
+        """
+        Join many tracklets at once; this is equivalent to, but much faster
+        than, `sum(tracklets)`, which copies the growing data at every addition.
+        """
+        tracklets = list(tracklets)
+        if len(tracklets) == 1:
+            return tracklets[0]
+        data = np.concatenate([t.data for t in tracklets])
+        inds = np.concatenate([t.inds for t in tracklets])
+        return cls(data, inds, data.dtype)
+
     def __len__(self):
         return self.inds.size
 
@@ -74,7 +103,7 @@ class Tracklet:
         """Join this tracklet to another one."""
         data = np.concatenate((self.data, other.data))
         inds = np.concatenate((self.inds, other.inds))
-        return Tracklet(data, inds)
+        return Tracklet(data, inds, data.dtype)
 
     def __radd__(self, other):
         if other == 0:
@@ -435,6 +464,364 @@ class Tracklet:
         return lines
 
 
+class TrackletStore:
+    """
+    Contiguous storage of the detections of many tracklets.
+
+    The data and time indices of all tracklets are packed into two arrays,
+    indexed by per-tracklet offsets; the Tracklets returned are lightweight
+    views on these arrays, whose centroids are all computed at once. This avoids
+    numerous small allocations, and, with `dtype=np.float32`, halves memory.
+
+    Parameters
+    ----------
+    tracklets : list of Tracklet
+        Tracklets to pack; they must all have the same number of bodyparts
+        and data columns.
+    dtype : data-type, optional
+        Floating point type of the stored data; float64 by default.
+    """
+
+    def __init__(self, tracklets, dtype=np.float64):
+        tracklets = list(tracklets)
+        lengths = [len(t) for t in tracklets]
+        self.offsets = np.r_[0, np.cumsum(lengths, dtype=int)]
+        shapes = {t.data.shape[1:] for t in tracklets}
+        if len(shapes) > 1:
+            raise ValueError("Tracklets must all have data of the same shape.")
+        shape = shapes.pop() if shapes else (0, 3)
+        self.data = np.empty((self.offsets[-1], *shape), dtype=dtype)
+        self.inds = np.empty(self.offsets[-1], dtype=int)
+        for tracklet, start, end in zip(tracklets, self.offsets, self.offsets[1:]):
+            self.data[start:end] = tracklet.data
+            self.inds[start:end] = tracklet.inds
+        with warnings.catch_warnings():  # All-NaN likelihoods
+            warnings.simplefilter("ignore", RuntimeWarning)
+            like = self.data[..., 2:3]
+            self.centroids = np.nansum(self.data[..., :2] * like, axis=1) / np.nansum(
+                like, axis=1
+            )
+        self.tracklets = [self._view(i) for i in range(len(tracklets))]
+
+    def _view(self, i):
+        sl = slice(self.offsets[i], self.offsets[i + 1])
+        return Tracklet.from_view(self.data[sl], self.inds[sl], self.centroids[sl])
+
+    def __getitem__(self, item):
+        return self.tracklets[item]
+
+    def __len__(self):
+        return len(self.tracklets)
+
+    @property
+    def nbytes(self):
+        return self.data.nbytes + self.inds.nbytes + self.centroids.nbytes
+
+
+class TrackletAffinities:
+    """
+    Vectorized affinities between many pairs of tracklets.
+
+    Head and tail summaries (centroids, velocities, bounding boxes and poses
+    at both ends) of all tracklets are computed once and stored in arrays,
+    so that the affinities of thousands of pairs are evaluated at once
+    rather than one pair at a time with the `Tracklet` methods.
+    Pairs of tracklets overlapping in time are rare in practice,
+    and are delegated to the corresponding `Tracklet` method.
+
+    Parameters
+    ----------
+    tracklets : list of Tracklet
+        Tracklets between which affinities are computed.
+    metric : str, optional
+        Affinity returned when the object is used as a weight function; i.e.,
+        one of "distance" (default), "motion", "shape", "box" or "dynamic".
+    """
+
+    _metrics = {
+        "distance": "distance",
+        "motion": "motion_affinity",
+        "shape": "shape_dissimilarity",
+        "box": "box_overlap",
+        "dynamic": "dynamic_dissimilarity",
+    }
+
+    def __init__(self, tracklets, metric="distance"):
+        if metric not in self._metrics:
+            raise ValueError(f"Unknown metric={metric}")
+        self.tracklets = list(tracklets)
+        self.metric = metric
+        self._index = {tracklet: i for i, tracklet in enumerate(self.tracklets)}
+        self.starts = np.array([t.start for t in self.tracklets])
+        self.ends = np.array([t.end for t in self.tracklets])
+        # First and last centroids, poses and bounding boxes,
+        # as well as the velocities of the first and last frames.
+        self.first_centroids = np.array([t.centroid[0] for t in self.tracklets])
+        self.last_centroids = np.array([t.centroid[-1] for t in self.tracklets])
+        self.first_xy = np.array([t.xy[0] for t in self.tracklets])
+        self.last_xy = np.array([t.xy[-1] for t in self.tracklets])
+        self.first_bboxes = np.array([t.calc_bbox(0) for t in self.tracklets])
+        self.last_bboxes = np.array([t.calc_bbox(-1) for t in self.tracklets])
+        with warnings.catch_warnings():  # Tracklets too short for velocities
+            warnings.simplefilter("ignore", RuntimeWarning)
+            self.first_velocities = np.array(
+                [t.calc_velocity("tail", norm=False) for t in self.tracklets]
+            )
+            self.last_velocities = np.array(
+                [t.calc_velocity("head", norm=False) for t in self.tracklets]
+            )
+        self._hankelets = dict()
+
+    def __len__(self):
+        return len(self.tracklets)
+
+    def _indices(self, tracklets):
+        return np.fromiter(
+            (self._index[t] for t in tracklets), dtype=int, count=len(tracklets)
+        )
+
+    def _orient(self, inds1, inds2):
+        """
+        Return the indices of the preceding and following tracklets of each pair,
+        as well as a mask of the pairs overlapping in time.
+        """
+        inds1 = np.asarray(inds1, dtype=int)
+        inds2 = np.asarray(inds2, dtype=int)
+        precedes = self.ends[inds1] < self.starts[inds2]
+        prev = np.where(precedes, inds1, inds2)
+        next_ = np.where(precedes, inds2, inds1)
+        overlap = ~precedes & ~(self.starts[inds1] > self.ends[inds2])
+        return prev, next_, overlap
+
+    def _fallback(self, values, inds1, inds2, overlap, method):
+        for k in np.flatnonzero(overlap):
+            t1 = self.tracklets[inds1[k]]
+            t2 = self.tracklets[inds2[k]]
+            values[k] = getattr(t1, method)(t2)
+        return values
+
+    def distance(self, inds1, inds2):
+        """Vectorized equivalent of `Tracklet.distance_to`."""
+        prev, next_, overlap = self._orient(inds1, inds2)
+        values = np.linalg.norm(
+            self.last_centroids[prev] - self.first_centroids[next_], axis=1
+        )
+        return self._fallback(values, inds1, inds2, overlap, "distance_to")
+
+    def motion_affinity(self, inds1, inds2):
+        """Vectorized equivalent of `Tracklet.motion_affinity_with`."""
+        prev, next_, overlap = self._orient(inds1, inds2)
+        time_gap = (self.starts[next_] - self.ends[prev])[:, np.newaxis]
+        d1 = self.last_centroids[prev] + time_gap * self.last_velocities[prev]
+        d2 = self.first_centroids[next_] - time_gap * self.first_velocities[next_]
+        delta1 = self.first_centroids[next_] - d1
+        delta2 = self.last_centroids[prev] - d2
+        values = (np.linalg.norm(delta1, axis=1) + np.linalg.norm(delta2, axis=1)) / 2
+        return self._fallback(values, inds1, inds2, overlap, "motion_affinity_with")
+
+    def shape_dissimilarity(self, inds1, inds2):
+        """
+        Vectorized equivalent of `Tracklet.shape_dissimilarity_with`;
+        i.e., the undirected Hausdorff distance between facing poses.
+        Missing keypoints are ignored.
+        """
+        prev, next_, overlap = self._orient(inds1, inds2)
+        u = self.last_xy[prev]
+        v = self.first_xy[next_]
+        dists = np.linalg.norm(u[:, :, np.newaxis] - v[:, np.newaxis], axis=3)
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)
+            d_uv = np.nanmax(np.nanmin(dists, axis=2), axis=1)
+            d_vu = np.nanmax(np.nanmin(dists, axis=1), axis=1)
+        values = np.maximum(d_uv, d_vu)
+        return self._fallback(values, inds1, inds2, overlap, "shape_dissimilarity_with")
+
+    def box_overlap(self, inds1, inds2):
+        """Vectorized equivalent of `Tracklet.box_overlap_with`."""
+        prev, next_, overlap = self._orient(inds1, inds2)
+        bbox1 = self.last_bboxes[prev]
+        bbox2 = self.first_bboxes[next_]
+        wh = np.prod(
+            np.clip(
+                np.minimum(bbox1[:, 2:], bbox2[:, 2:])
+                - np.maximum(bbox1[:, :2], bbox2[:, :2]),
+                0,
+                None,
+            ),
+            axis=1,
+        )
+        area1 = np.prod(bbox1[:, 2:] - bbox1[:, :2], axis=1)
+        area2 = np.prod(bbox2[:, 2:] - bbox2[:, :2], axis=1)
+        values = wh / (area1 + area2 - wh)
+        return self._fallback(values, inds1, inds2, overlap, "box_overlap_with")
+
+    def _hankelet(self, ind):
+        hk = self._hankelets.get(ind)
+        if hk is None:
+            hk = self.tracklets[ind].to_hankelet()
+            hk /= np.linalg.norm(hk)
+            self._hankelets[ind] = hk
+        return hk
+
+    def dynamic_dissimilarity(self, inds1, inds2):
+        """
+        Equivalent of `Tracklet.dynamic_dissimilarity_with`,
+        with the normalized Hankel matrices of the tracklets cached.
+        """
+        values = np.empty(len(inds1))
+        for k, (i, j) in enumerate(zip(inds1, inds2)):
+            hk1 = self._hankelet(i)
+            hk2 = self._hankelet(j)
+            min_shape = min(hk1.shape + hk2.shape)
+            # Only the leading rows of the Hankel matrices are needed
+            temp1 = hk1[:min_shape] @ hk1[:min_shape].T
+            temp2 = hk2[:min_shape] @ hk2[:min_shape].T
+            values[k] = 2 - np.linalg.norm(temp1 + temp2)
+        return values
+
+    def pairwise(self, tracklets1, tracklets2):
+        """Return the affinities (set by `metric`) of many pairs of tracklets."""
+        inds1 = self._indices(tracklets1)
+        inds2 = self._indices(tracklets2)
+        return getattr(self, self._metrics[self.metric])(inds1, inds2)
+
+    def __call__(self, tracklet1, tracklet2):
+        return self.pairwise([tracklet1], [tracklet2])[0]
+
+
+def _get_bounds(tracklets):
+    starts = np.fromiter((t.start for t in tracklets), int, len(tracklets))
+    ends = np.fromiter((t.end for t in tracklets), int, len(tracklets))
+    return starts, ends
+
+
+def _find_pairs_within(starts, ends, max_gap=0):
+    """
+    Sweep over time intervals sorted by start, and return the indices of
+    the pairs (i, j), with i < j, such that interval j starts at most
+    `max_gap` frames after interval i ends. Pairs are sorted lexicographically.
+    """
+    n = len(starts)
+    # Since intervals are sorted by start, all those starting early enough
+    # after interval i are located between i and stops[i].
+    stops = np.searchsorted(starts, ends + max_gap, side="right")
+    stops = np.maximum(stops, np.arange(1, n + 1))
+    counts = stops - np.arange(n) - 1
+    inds1 = np.repeat(np.arange(n), counts)
+    inds2 = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    inds2 += inds1 + 1
+    return inds1, inds2
+
+
+_weight_func = None
+_weight_nodes = None
+
+
+def _init_weight_worker(weight_func, nodes):
+    global _weight_func, _weight_nodes
+    _weight_func = weight_func
+    _weight_nodes = nodes
+
+
+def _compute_weights(pairs):
+    return np.array(
+        [_weight_func(_weight_nodes[i], _weight_nodes[j]) for i, j in pairs],
+        dtype=float,
+    )
+
+
+def solve_min_cost_flow(G, solver="networkx"):
+    """
+    Solve the min-cost flow problem of a stitching graph.
+
+    Parameters
+    ----------
+    G : nx.DiGraph
+        Graph whose nodes may have a "demand" and edges a "weight" and a "capacity".
+    solver : str, optional
+        "networkx" (default) uses the capacity scaling algorithm of networkx;
+        "highs" solves the equivalent linear program with the HiGHS dual simplex
+        solver shipped with SciPy, which is much faster on large graphs.
+        The constraint matrix of a flow problem being totally unimodular, the
+        optimal basic solution is integral. Ties between equally good solutions
+        may however be broken differently than with networkx.
+
+    Returns
+    -------
+    dict
+        Flow through each edge, keyed by source then target node, as returned
+        by `nx.capacity_scaling`.
+    """
+    if solver == "networkx":
+        return nx.capacity_scaling(G)[1]
+    if solver != "highs":
+        raise ValueError(f"Unknown solver={solver}")
+
+    nodes = list(G)
+    index = {node: i for i, node in enumerate(nodes)}
+    edges = list(G.edges(data=True))
+    n_edges = len(edges)
+    tails = [index[u] for u, _, _ in edges]
+    heads = [index[v] for _, v, _ in edges]
+    cost = np.array([attrs.get("weight", 0) for *_, attrs in edges], dtype=float)
+    capacity = [attrs.get("capacity", np.inf) for *_, attrs in edges]
+    demand = [G.nodes[node].get("demand", 0) for node in nodes]
+    # Node demands are the difference between inflow and outflow
+    A = sparse.coo_matrix(
+        (
+            np.r_[-np.ones(n_edges), np.ones(n_edges)],
+            (np.r_[tails, heads], np.r_[np.arange(n_edges), np.arange(n_edges)]),
+        ),
+        shape=(len(nodes), n_edges),
+    ).tocsr()
+    res = linprog(
+        cost,
+        A_eq=A,
+        b_eq=demand,
+        bounds=list(zip([0] * n_edges, capacity)),
+        method="highs-ds",
+    )
+    if res.status == 2:
+        raise nx.NetworkXUnfeasible("No flow satisfying all demands.")
+    if not res.success:
+        raise nx.NetworkXError(res.message)
+    flows = np.rint(res.x).astype(int).tolist()
+    flow = {node: dict() for node in nodes}
+    for (u, v, _), f in zip(edges, flows):
+        flow[u][v] = f
+    return flow
+
+
+_window_stitcher = None
+_window_weight_func = None
+
+
+def _init_window_worker(stitcher, weight_func=None):
+    # The weight function is handed over together with the stitcher, rather than
+    # with every task: forked workers need not pickle it at all, and spawned
+    # workers unpickle both at once, so that functions keyed by tracklets still
+    # refer to the very tracklets of the stitcher.
+    global _window_stitcher, _window_weight_func
+    _window_stitcher = stitcher
+    _window_weight_func = weight_func
+
+
+def _stitch_window(args):
+    """Return the paths found in a single window, as lists of tracklet indices."""
+    inds, max_gap, solver = args
+    weight_func = _window_weight_func
+    stitcher = copy.copy(_window_stitcher)  # Leave the graph of the original alone
+    nodes = [stitcher.tracklets[i] for i in inds]
+    index = {tracklet: i for i, tracklet in zip(inds, nodes)}
+    if len(nodes) < 2:
+        return [[i] for i in inds]
+    stitcher.build_graph(nodes, max_gap=max_gap, weight_func=weight_func)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", UserWarning)
+        paths, _ = stitcher._find_paths(solver, nodes)
+    return [[index[t] for t in path] for path in paths if path]
+
+
 class TrackletStitcher:
     def __init__(
         self,
@@ -443,7 +830,26 @@ class TrackletStitcher:
         min_length=10,
         split_tracklets=True,
         prestitch_residuals=True,
+        dtype=np.float64,
     ):
+        """
+        Parameters
+        ----------
+        tracklets : list of Tracklet
+            Tracklets to stitch.
+        n_tracks : int
+            Number of tracks to reconstruct.
+        min_length : int, optional
+            Tracklets shorter than `min_length` are set aside as residuals,
+            and only added back once tracks are formed. Must be 3 at least.
+        split_tracklets : bool, optional
+            Whether to split tracklets at their temporal discontinuities (default).
+        prestitch_residuals : bool, optional
+            Whether to group residuals by temporal proximity first (default).
+        dtype : data-type, optional
+            Floating point type tracklet data are stored in; float64 by default.
+            Pass np.float32 to halve the memory used by long recordings.
+        """
         if n_tracks < 1:
             raise ValueError("There must at least be one track to reconstruct.")
 
@@ -482,6 +888,14 @@ class TrackletStitcher:
         if prestitch_residuals:
             self._prestitch_residuals(5)  # Hard-coded but found to work very well
         self.tracklets = sorted(self.tracklets, key=lambda t: t.start)
+        # Pack all tracklets into contiguous arrays, which the Tracklets now view
+        n_tracklets = len(self.tracklets)
+        try:
+            self.store = TrackletStore(self.tracklets + self.residuals, dtype)
+            self.tracklets = self.store.tracklets[:n_tracklets]
+            self.residuals = self.store.tracklets[n_tracklets:]
+        except ValueError:  # Heterogeneous data are left as they are
+            self.store = None
         self._first_frame = self.tracklets[0].start
         self._last_frame = max(self.tracklets, key=lambda t: t.end).end
 
@@ -502,10 +916,8 @@ class TrackletStitcher:
 
         # Store tracklets and corresponding negatives (those that overlap in time)
         self._lu_overlap = defaultdict(list)
-        for tracklet1, tracklet2 in combinations(self, 2):
-            if tracklet2 in tracklet1:
-                self._lu_overlap[tracklet1].append(tracklet2)
-                self._lu_overlap[tracklet2].append(tracklet1)
+        for i, j in zip(*self._find_overlapping_pairs(self.tracklets)):
+            self._lu_overlap[self.tracklets[i]].append(self.tracklets[j])
 
     def __getitem__(self, item):
         return self.tracklets[item]
@@ -521,11 +933,12 @@ class TrackletStitcher:
         min_length=10,
         split_tracklets=True,
         prestitch_residuals=True,
+        dtype=np.float64,
     ):
         with open(pickle_file, "rb") as file:
             tracklets = pickle.load(file)
         class_ = cls.from_dict_of_dict(
-            tracklets, n_tracks, min_length, split_tracklets, prestitch_residuals
+            tracklets, n_tracks, min_length, split_tracklets, prestitch_residuals, dtype
         )
         class_.filename = pickle_file
         return class_
@@ -538,6 +951,7 @@ class TrackletStitcher:
         min_length=10,
         split_tracklets=True,
         prestitch_residuals=True,
+        dtype=np.float64,
     ):
         tracklets = []
         header = dict_of_dict.pop("header", None)
@@ -554,13 +968,18 @@ class TrackletStitcher:
                 data = data.reshape((nrows, ncols // 3, 3))
             except ValueError:
                 pass
-            tracklet = Tracklet(data, inds)
+            tracklet = Tracklet(data, inds, dtype)
             if k == "single":
                 single = tracklet
             else:
-                tracklets.append(Tracklet(data, inds))
+                tracklets.append(tracklet)
         class_ = cls(
-            tracklets, n_tracks, min_length, split_tracklets, prestitch_residuals
+            tracklets,
+            n_tracks,
+            min_length,
+            split_tracklets,
+            prestitch_residuals,
+            dtype,
         )
         class_.header = header
         class_.single = single
@@ -577,33 +996,58 @@ class TrackletStitcher:
         valid = ~np.isnan(tracklet.xy).all(axis=(1, 2))
         if not np.any(valid):
             return None
-        return Tracklet(tracklet.data[valid], tracklet.inds[valid])
+        if np.all(valid):  # Nothing to remove; avoid a copy
+            return Tracklet.from_view(tracklet.data, tracklet.inds)
+        return Tracklet(tracklet.data[valid], tracklet.inds[valid], tracklet.data.dtype)
 
     @staticmethod
     def split_tracklet(tracklet, inds):
+        """Split a tracklet at the given time indices into views on its data."""
         idx = sorted(set(np.searchsorted(tracklet.inds, inds)))
         inds_new = np.split(tracklet.inds, idx)
         data_new = np.split(tracklet.data, idx)
-        return [Tracklet(data, inds) for data, inds in zip(data_new, inds_new)]
+        return [
+            Tracklet.from_view(data, inds) for data, inds in zip(data_new, inds_new)
+        ]
 
     @property
     def n_frames(self):
         return self._last_frame - self._first_frame + 1
 
-    # TODO Avoid looping over all pairs of tracklets
+    @staticmethod
+    def _find_overlapping_pairs(tracklets):
+        """
+        Return all ordered pairs of indices of tracklets (sorted by start)
+        sharing at least one frame, sorted lexicographically.
+        """
+        starts, ends = _get_bounds(tracklets)
+        inds1, inds2 = _find_pairs_within(starts, ends)
+        # Overlapping time spans only imply common frames for continuous tracklets
+        continuous = np.array([t.is_continuous for t in tracklets], dtype=bool)
+        for k in np.flatnonzero(~(continuous[inds1] & continuous[inds2])):
+            if tracklets[inds2[k]] not in tracklets[inds1[k]]:
+                inds1[k] = -1
+        mask = inds1 != -1
+        inds1, inds2 = inds1[mask], inds2[mask]
+        pairs = np.r_[np.c_[inds1, inds2], np.c_[inds2, inds1]]
+        pairs = pairs[np.lexsort(pairs.T[::-1])]
+        return pairs[:, 0], pairs[:, 1]
+
     @staticmethod
     def compute_max_gap(tracklets):
-        gap = defaultdict(list)
-        for tracklet1, tracklet2 in combinations(tracklets, 2):
-            gap[tracklet1].append(tracklet1.time_gap_to(tracklet2))
-        max_gap = 0
-        for vals in gap.values():
-            for val in sorted(vals):
-                if val > 0:
-                    if val > max_gap:
-                        max_gap = val
-                    break
-        return max_gap
+        """
+        Return the largest of the temporal gaps separating each tracklet
+        from the first tracklet starting after it ends.
+        """
+        if not len(tracklets):
+            return 0
+        starts, ends = _get_bounds(tracklets)
+        starts = np.sort(starts)
+        next_ = np.searchsorted(starts, ends, side="right")
+        valid = next_ < len(starts)
+        if not valid.any():
+            return 0
+        return int(np.max(starts[next_[valid]] - ends[valid]))
 
     def mine(self, n_samples):
         p = np.asarray([t.likelihood for t in self])
@@ -634,7 +1078,30 @@ class TrackletStitcher:
         nodes=None,
         max_gap=None,
         weight_func=None,
+        n_processes=1,
     ):
+        """
+        Build the flow graph, linking each tracklet to those starting
+        at most `max_gap` frames after it ends.
+
+        Parameters
+        ----------
+        nodes : list of Tracklet, optional
+            Tracklets to stitch; by default, all tracklets.
+        max_gap : int, optional
+            Maximal temporal gap between linked tracklets.
+            By default, 1.5 times the value estimated from the data.
+        weight_func : callable, optional
+            Function returning the weight of the edge between two tracklets.
+            Objects that also expose a `pairwise(tracklets1, tracklets2)` method
+            (e.g., `TrackletAffinities`) are used to weigh all edges at once.
+            By default, the distance between tracklets, computed in vectorized form.
+            Pairs of tracklets whose weight is not finite (e.g., NaN, for tracklets
+            without any confident detection) are not linked.
+        n_processes : int, optional
+            Number of processes over which calls to a custom `weight_func`
+            without `pairwise` method are distributed. Serial by default.
+        """
         if nodes is None:
             nodes = self.tracklets
         nodes = sorted(nodes, key=lambda t: t.start)
@@ -646,34 +1113,49 @@ class TrackletStitcher:
         self.G = nx.DiGraph()
         self.G.add_node("source", demand=-self.n_tracks)
         self.G.add_node("sink", demand=self.n_tracks)
+        nodes_set = set(nodes)
         nodes_in, nodes_out = zip(
-            *[v.values() for k, v in self._mapping.items() if k in nodes]
+            *[v.values() for k, v in self._mapping.items() if k in nodes_set]
         )
         self.G.add_nodes_from(nodes_in, demand=1)
         self.G.add_nodes_from(nodes_out, demand=-1)
         self.G.add_edges_from(zip(nodes_in, nodes_out), capacity=1)
         self.G.add_edges_from(zip(["source"] * n_nodes, nodes_in), capacity=1)
         self.G.add_edges_from(zip(nodes_out, ["sink"] * n_nodes), capacity=1)
+
+        starts, ends = _get_bounds(nodes)
+        inds1, inds2 = _find_pairs_within(starts, ends, max_gap)
+        # Only link tracklets to those starting after they end
+        mask = starts[inds2] > ends[inds1]
+        inds1, inds2 = inds1[mask], inds2[mask]
         if weight_func is None:
-            weight_func = self.calculate_edge_weight
-        for i in trange(n_nodes):
-            node_i = nodes[i]
-            end = node_i.end
-            for j in range(i + 1, n_nodes):
-                node_j = nodes[j]
-                start = node_j.start
-                gap = start - end
-                if gap > max_gap:
-                    break
-                elif gap > 0:
-                    # The algorithm works better with integer weights
-                    w = int(100 * weight_func(node_i, node_j))
-                    self.G.add_edge(
-                        self._mapping[node_i]["out"],
-                        self._mapping[node_j]["in"],
-                        weight=w,
-                        capacity=1,
-                    )
+            weight_func = TrackletAffinities(nodes)
+        tracklets1 = [nodes[i] for i in inds1]
+        tracklets2 = [nodes[j] for j in inds2]
+        if hasattr(weight_func, "pairwise"):
+            weights = weight_func.pairwise(tracklets1, tracklets2)
+        elif n_processes is not None and n_processes > 1 and len(inds1):
+            with multiprocessing.Pool(
+                n_processes, _init_weight_worker, (weight_func, nodes)
+            ) as p:
+                chunks = np.array_split(
+                    np.c_[inds1, inds2], min(len(inds1), 4 * n_processes)
+                )
+                weights = np.concatenate(p.map(_compute_weights, chunks))
+        else:
+            weights = [weight_func(t1, t2) for t1, t2 in zip(tracklets1, tracklets2)]
+        weights = np.asarray(weights, dtype=float)
+        valid = np.isfinite(weights)
+        # The algorithm works better with integer weights
+        weights = np.trunc(100 * weights[valid]).astype(int)
+        self.G.add_edges_from(
+            (
+                self._mapping[tracklets1[i]]["out"],
+                self._mapping[tracklets2[i]]["in"],
+                {"weight": w, "capacity": 1},
+            )
+            for i, w in zip(np.flatnonzero(valid), weights.tolist())
+        )
 
     def _update_edge_weights(self, weight_func):
         if self.G is None:
@@ -684,24 +1166,61 @@ class TrackletStitcher:
                 w = weight_func(self._mapping_inv[node1], self._mapping_inv[node2])
                 self.G.edges[(node1, node2)]["weight"] = w
 
-    def stitch(self, add_back_residuals=True):
+    def stitch(self, add_back_residuals=True, solver="networkx"):
+        """
+        Find the optimal tracks through the graph built with `build_graph`.
+
+        Parameters
+        ----------
+        add_back_residuals : bool, optional
+            Whether to incorporate residuals back into the tracks (True by default).
+        solver : str, optional
+            Min-cost flow solver; either "networkx" (default) or "highs",
+            a faster solver shipped with SciPy. See `solve_min_cost_flow`.
+        """
         if self.G is None:
             raise ValueError("Inexistent graph. Call `build_graph` first")
 
         try:
-            _, self.flow = nx.capacity_scaling(self.G)
-            self.paths = self.reconstruct_paths()
+            self.paths, rejected = self._find_paths(solver)
+            self.residuals.extend(rejected)
+        finally:
+            if self.paths is None:
+                raise ValueError(
+                    f"Could not reconstruct {self.n_tracks} tracks from the tracklets given."
+                )
+
+            self.tracks = np.asarray(
+                [Tracklet.concatenate(path) for path in self.paths if path]
+            )
+            if add_back_residuals:
+                _ = self._finalize_tracks()
+
+    def _find_paths(self, solver="networkx", nodes=None):
+        """
+        Solve the flow problem of the current graph (built over `nodes`, or all
+        tracklets by default), and return the resulting paths, together with the
+        tracklets rejected when no optimal solution exists.
+        """
+        rejected = []
+        try:
+            self.flow = solve_min_cost_flow(self.G, solver)
+            paths = self.reconstruct_paths()
         except nx.exception.NetworkXUnfeasible:
             warnings.warn("No optimal solution found. Employing black magic...")
             # Let us prune the graph by removing all source and sink edges
             # but those connecting the `n_tracks` first and last tracklets.
+            if nodes is None:
+                first_tracklets = self._first_tracklets
+                last_tracklets = self._last_tracklets
+            else:
+                first_tracklets = sorted(nodes, key=lambda t: t.start)[: self.n_tracks]
+                last_tracklets = sorted(nodes, key=lambda t: t.end)[-self.n_tracks :]
             in_to_keep = [
-                self._mapping[first_tracklet]["in"]
-                for first_tracklet in self._first_tracklets
+                self._mapping[first_tracklet]["in"] for first_tracklet in first_tracklets
             ]
             out_to_keep = [
-                self._mapping[last_tracklet]["out"]
-                for last_tracklet in self._last_tracklets
+                self._mapping[last_tracklet]["out"] for last_tracklet in last_tracklets
             ]
             in_to_remove = set(
                 node for _, node in self.G.out_edges("source")
@@ -750,10 +1269,10 @@ class TrackletStitcher:
                             cv2 = dx2.std() / np.abs(dx2).mean()
                             if cv1 < cv2:
                                 remaining_nodes.add(t1)
-                                self.residuals.append(t2)
+                                rejected.append(t2)
                             else:
                                 remaining_nodes.add(t2)
-                                self.residuals.append(t1)
+                                rejected.append(t1)
                     paths.append(list(remaining_nodes))
                 elif incomplete_tracks > 1:
                     # Rebuild a full graph from the remaining nodes without
@@ -761,21 +1280,141 @@ class TrackletStitcher:
                     self.build_graph(list(remaining_nodes), max_gap=np.inf)
                     self.G.nodes["source"]["demand"] = -incomplete_tracks
                     self.G.nodes["sink"]["demand"] = incomplete_tracks
-                    _, self.flow = nx.capacity_scaling(self.G)
+                    self.flow = solve_min_cost_flow(self.G, solver)
                     paths += self.reconstruct_paths()
-            self.paths = paths
-            if len(self.paths) != self.n_tracks:
-                warnings.warn(f"Only {len(self.paths)} tracks could be reconstructed.")
+            if len(paths) != self.n_tracks:
+                warnings.warn(f"Only {len(paths)} tracks could be reconstructed.")
+        return paths, rejected
 
-        finally:
-            if self.paths is None:
-                raise ValueError(
-                    f"Could not reconstruct {self.n_tracks} tracks from the tracklets given."
-                )
+    def stitch_in_windows(
+        self,
+        window_size,
+        overlap=None,
+        max_gap=None,
+        weight_func=None,
+        n_processes=1,
+        solver="networkx",
+        add_back_residuals=True,
+    ):
+        """
+        Stitch tracklets within overlapping time windows rather than at once.
 
-            self.tracks = np.asarray([sum(path) for path in self.paths if path])
-            if add_back_residuals:
-                _ = self._finalize_tracks()
+        The flow problem of each window is solved independently (optionally in
+        parallel), which bounds memory and time for arbitrarily long recordings.
+        Tracks of consecutive windows are then matched via the tracklets they
+        share in the overlap, and each tracklet is eventually assigned
+        to the track found in the window whose center it is the closest to.
+
+        Parameters
+        ----------
+        window_size : int
+            Number of frames in each window.
+        overlap : int, optional
+            Number of frames shared by consecutive windows; half the window by default.
+            It should be long enough to contain several tracklets of each track.
+        max_gap : int, optional
+            Maximal temporal gap between linked tracklets. By default, 1.5 times
+            the value estimated from all tracklets. See `build_graph`.
+        weight_func : callable, optional
+            Edge weight function. See `build_graph`. With several processes
+            started by spawning rather than forking (the default on macOS and
+            Windows), it must be picklable; i.e., not a local function.
+        n_processes : int, optional
+            Number of processes among which windows are distributed. Serial by default.
+        solver : str, optional
+            Min-cost flow solver. See `stitch`.
+        add_back_residuals : bool, optional
+            Whether to incorporate residuals back into the tracks (True by default).
+        """
+        if overlap is None:
+            overlap = window_size // 2
+        step = window_size - overlap
+        if step < 1:
+            raise ValueError("The overlap must be shorter than the window.")
+        if not max_gap:
+            max_gap = int(1.5 * self.compute_max_gap(self.tracklets))
+
+        starts, ends = _get_bounds(self.tracklets)
+        window_starts = np.arange(self._first_frame, self._last_frame + 1, step)
+        # Drop trailing windows entirely contained in the previous one
+        n_windows = max(1, np.sum(window_starts + overlap <= self._last_frame))
+        window_starts = window_starts[:n_windows]
+        windows = [
+            np.flatnonzero((starts < s + window_size) & (ends >= s))
+            for s in window_starts
+        ]
+        tasks = [(inds, max_gap, solver) for inds in windows]
+        if n_processes is not None and n_processes > 1 and len(windows) > 1:
+            with multiprocessing.Pool(
+                n_processes, _init_window_worker, (self, weight_func)
+            ) as p:
+                results = p.map(_stitch_window, tasks)
+        else:
+            _init_window_worker(self, weight_func)
+            results = list(map(_stitch_window, tasks))
+            _init_window_worker(None)
+
+        # Each tracklet is owned by the window whose center is the closest to its
+        # own; i.e., in the middle of the overlaps of the adjacent windows.
+        owners = np.clip(
+            np.searchsorted(
+                window_starts[1:] + overlap / 2, (starts + ends) / 2, side="right"
+            ),
+            0,
+            n_windows - 1,
+        )
+        labels = np.full(len(self.tracklets), -1)
+        prev_paths = prev_labels = None
+        for n, paths in enumerate(results):
+            path_labels = self._match_window_paths(prev_paths, prev_labels, paths)
+            for path, label in zip(paths, path_labels):
+                path = np.asarray(path, dtype=int)
+                owned = path[owners[path] == n]
+                labels[owned] = label
+            # Windows without tracks must not break the chain of identities
+            if paths:
+                prev_paths, prev_labels = paths, path_labels
+
+        self.paths = [
+            [self.tracklets[i] for i in np.flatnonzero(labels == label)]
+            for label in range(self.n_tracks)
+        ]
+        self.paths = [path for path in self.paths if path]
+        # Tracklets rejected from the paths of the window owning them
+        self.residuals.extend(self.tracklets[i] for i in np.flatnonzero(labels == -1))
+        self.tracks = np.asarray([Tracklet.concatenate(path) for path in self.paths])
+        if add_back_residuals:
+            _ = self._finalize_tracks()
+
+    def _match_window_paths(self, prev_paths, prev_labels, paths):
+        """
+        Label the paths of a window with those of the matching paths found
+        in the previous window, based on the number of frames of the tracklets
+        they share, and on the distance between their endpoints to break ties.
+        Paths in excess of the number of tracks are left unlabeled (-1).
+        """
+        if prev_paths is None:
+            return [i if i < self.n_tracks else -1 for i in range(len(paths))]
+        cost = np.zeros((len(prev_paths), len(paths)))
+        for i, prev_path in enumerate(prev_paths):
+            prev_track = Tracklet.concatenate(self.tracklets[k] for k in prev_path)
+            for j, path in enumerate(paths):
+                shared = set(prev_path).intersection(path)
+                n_frames = sum(len(self.tracklets[k]) for k in shared)
+                first = min((self.tracklets[k] for k in path), key=lambda t: t.start)
+                ind = min(
+                    np.searchsorted(prev_track.inds, first.start), len(prev_track) - 1
+                )
+                dist = np.linalg.norm(prev_track.centroid[ind] - first.centroid[0])
+                cost[i, j] = -n_frames + np.arctan(dist) / np.pi  # Always < 1 frame
+        rows, cols = linear_sum_assignment(np.nan_to_num(cost, nan=0.5))
+        labels = [-1] * len(paths)
+        for i, j in zip(rows, cols):
+            labels[j] = prev_labels[i]
+        free = [l for l in range(self.n_tracks) if l not in labels][::-1]
+        return [
+            label if label != -1 else (free.pop() if free else -1) for label in labels
+        ]
 
     def _finalize_tracks(self):
         residuals = [res for res in sorted(self.residuals, key=len) if len(res) > 1]
@@ -836,25 +1475,22 @@ class TrackletStitcher:
     def _prestitch_residuals(self, max_gap=5):
         G = nx.DiGraph()
         residuals = sorted(self.residuals, key=lambda x: x.start)
-        for i in range(len(residuals)):
-            e = residuals[i].end
-            for j in range(i + 1, len(residuals)):
-                s = residuals[j].start
-                gap = s - e
-                if gap < 1:
-                    continue
-                if gap < max_gap:
-                    w = 1 - residuals[i].box_overlap_with(residuals[j])
-                    G.add_edge(i, j, weight=w)
-                else:
-                    break
+        starts, ends = _get_bounds(residuals)
+        inds1, inds2 = _find_pairs_within(starts, ends, max_gap - 1)
+        mask = starts[inds2] > ends[inds1]
+        inds1, inds2 = inds1[mask], inds2[mask]
+        if len(inds1):
+            overlaps = TrackletAffinities(residuals).box_overlap(inds1, inds2)
+            G.add_weighted_edges_from(
+                zip(inds1.tolist(), inds2.tolist(), (1 - overlaps).tolist())
+            )
         mini_tracks = []
         to_remove = []
         for comp in nx.connected_components(G.to_undirected()):
             sub_ = G.subgraph(comp)
             inds = nx.dag_longest_path(sub_)
             to_remove.extend(inds)
-            mini_tracks.append(sum(residuals[ind] for ind in inds))
+            mini_tracks.append(Tracklet.concatenate(residuals[ind] for ind in inds))
         for ind in sorted(to_remove, reverse=True):
             self.residuals.pop(ind)
         self.residuals.extend(mini_tracks)
@@ -1017,6 +1653,22 @@ class TrackletStitcher:
                 return path
 
 
+class _IdentityWeightFunc:
+    """
+    Edge weights of a stitcher, lowered between tracklets of the same identity.
+
+    Defined at module level so that it can be sent to worker processes,
+    whether they are forked or spawned.
+    """
+
+    def __init__(self, stitcher):
+        self.stitcher = stitcher
+
+    def __call__(self, tracklet1, tracklet2):
+        w = 0.01 if tracklet1.identity == tracklet2.identity else 1
+        return w * self.stitcher.calculate_edge_weight(tracklet1, tracklet2)
+
+
 def stitch_tracklets(
     config_path,
     videos,
@@ -1035,6 +1687,10 @@ def stitch_tracklets(
     output_name="",
     transformer_checkpoint="",
     save_as_csv=False,
+    window_size=None,
+    window_overlap=None,
+    n_processes=1,
+    solver="networkx",
 ):
     """
     Stitch sparse tracklets into full tracks via a graph-based,
@@ -1116,6 +1772,21 @@ def stitch_tracklets(
     save_as_csv: bool, optional
         Whether to write the tracks to a CSV file too (False by default).
 
+    window_size: int, optional
+        If given, tracklets are stitched within overlapping windows of
+        `window_size` frames rather than all at once, which keeps memory and time
+        in check on very long recordings. See `TrackletStitcher.stitch_in_windows`.
+
+    window_overlap: int, optional
+        Number of frames shared by consecutive windows; half a window by default.
+
+    n_processes: int, optional
+        Number of processes over which windows are stitched (1 by default).
+
+    solver: str, optional
+        Min-cost flow solver, either "networkx" (default) or "highs",
+        which is faster on large problems.
+
     Returns
     -------
     A TrackletStitcher object
@@ -1144,26 +1815,6 @@ def stitch_tracklets(
 
         dlctrans = inference.DLCTrans(checkpoint=transformer_checkpoint)
 
-    def trans_weight_func(tracklet1, tracklet2, nframe, feature_dict):
-        zfill_width = int(np.ceil(np.log10(nframe)))
-        if tracklet1 < tracklet2:
-            ind_img1 = tracklet1.inds[-1]
-            coord1 = tracklet1.data[-1][:, :2]
-            ind_img2 = tracklet2.inds[0]
-            coord2 = tracklet2.data[0][:, :2]
-        else:
-            ind_img2 = tracklet2.inds[-1]
-            ind_img1 = tracklet1.inds[0]
-            coord2 = tracklet2.data[-1][:, :2]
-            coord1 = tracklet1.data[0][:, :2]
-        t1 = (coord1, ind_img1)
-        t2 = (coord2, ind_img2)
-
-        dist = dlctrans(t1, t2, zfill_width, feature_dict)
-        dist = (dist + 1) / 2
-
-        return -dist
-
     for video in vids:
         print("Processing... ", video)
         nframe = len(VideoWriter(video))
@@ -1195,23 +1846,30 @@ def stitch_tracklets(
                 pickle_file, n_tracks, min_length, split_tracklets, prestitch_residuals
             )
             with_id = any(tracklet.identity != -1 for tracklet in stitcher)
+            video_weight_func = weight_func
             if with_id and weight_func is None:
                 # Add in identity weighing before building the graph
-                def weight_func(t1, t2):
-                    w = 0.01 if t1.identity == t2.identity else 1
-                    return w * stitcher.calculate_edge_weight(t1, t2)
+                video_weight_func = _IdentityWeightFunc(stitcher)
 
             if transformer_checkpoint:
-                stitcher.build_graph(
+                # Embed all tracklet endpoints at once rather than per graph edge
+                zfill_width = int(np.ceil(np.log10(nframe)))
+                video_weight_func = inference.TrackletEmbeddings(
+                    dlctrans, stitcher.tracklets, feature_dict, zfill_width
+                )
+
+            if window_size:
+                stitcher.stitch_in_windows(
+                    window_size,
+                    window_overlap,
                     max_gap=max_gap,
-                    weight_func=partial(
-                        trans_weight_func, nframe=nframe, feature_dict=feature_dict
-                    ),
+                    weight_func=video_weight_func,
+                    n_processes=n_processes,
+                    solver=solver,
                 )
             else:
-                stitcher.build_graph(max_gap=max_gap, weight_func=weight_func)
-
-            stitcher.stitch()
+                stitcher.build_graph(max_gap=max_gap, weight_func=video_weight_func)
+                stitcher.stitch(solver=solver)
             if transformer_checkpoint:
                 stitcher.write_tracks(
                     output_name=output_name,
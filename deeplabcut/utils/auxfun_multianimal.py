@@ -22,7 +22,6 @@ import math
 import os
 import pickle
 import random
-import shelve
 import warnings
 from itertools import combinations
 from pathlib import Path
@@ -33,6 +32,7 @@ import pandas as pd
 
 from deeplabcut.utils import auxiliaryfunctions, conversioncode
 from deeplabcut.generate_training_dataset import trainingsetmanipulation
+from deeplabcut.pose_estimation_tensorflow.lib.detectionutils import read_detections
 from deeplabcut.pose_estimation_tensorflow.lib.trackingutils import TRACK_METHODS
 
 
@@ -211,14 +211,16 @@ def SaveFullMultiAnimalData(data, metadata, dataname, suffix="_full"):
 
 
 def LoadFullMultiAnimalData(dataname):
-    """Save predicted data as h5 file and metadata as pickle file; created by predict_videos.py"""
-    data_file = dataname.split(".h5")[0] + "_full.pickle"
-    try:
-        with open(data_file, "rb") as handle:
-            data = pickle.load(handle)
-    except (pickle.UnpicklingError, FileNotFoundError):
-        data = shelve.open(data_file, flag="r")
-    with open(data_file.replace("_full.", "_meta."), "rb") as handle:
+    """Load the raw detections and metadata saved by predict_videos.py.
+
+    Detections are read (memory-mapped) from a "_full.detections" store if there
+    is one, and from the legacy "_full.pickle" file (pickle or shelf) otherwise.
+    """
+    data_file = dataname.split(".h5")[0] + "_full.detections"
+    if not os.path.isdir(data_file):
+        data_file = dataname.split(".h5")[0] + "_full.pickle"
+    data = read_detections(data_file)
+    with open(dataname.split(".h5")[0] + "_meta.pickle", "rb") as handle:
         metadata = pickle.load(handle)
     return data, metadata
 
@@ -26,7 +26,9 @@ import cv2
 import datetime
 import numpy as np
 import os
+import queue
 import subprocess
+import threading
 import warnings
 
 
@@ -35,6 +37,10 @@ SUPPORTED_VIDEOS = "avi", "mp4", "mov", "mpeg", "mpg", "mpv", "mkv", "flv", "qt"
 
 
 class VideoReader:
+    # Without keyframe index, frames at most this far ahead are reached with
+    # cv2.VideoCapture.grab() rather than by seeking.
+    max_grab_without_index = 16
+
     def __init__(self, video_path):
         if not os.path.isfile(video_path):
             raise ValueError(f'Video path "{video_path}" does not point to a file.')
@@ -45,6 +51,8 @@ class VideoReader:
         self.parse_metadata()
         self._bbox = 0, 1, 0, 1
         self._n_frames_robust = None
+        self._keyframes = None
+        self._keyframes_loaded = False
 
     def __repr__(self):
         string = "Video (duration={:0.2f}, fps={}, dimensions={}x{})"
@@ -126,7 +134,102 @@ class VideoReader:
                 "Setting to last frame instead."
             )
             ind = last_frame
-        self.video.set(cv2.CAP_PROP_POS_FRAMES, ind)
+        pos = int(self.video.get(cv2.CAP_PROP_POS_FRAMES))
+        if self._can_grab_to(pos, ind):
+            for _ in range(ind - pos):
+                self.video.grab()
+        else:
+            self.video.set(cv2.CAP_PROP_POS_FRAMES, ind)
+
+    def _can_grab_to(self, pos, ind):
+        # Seeking decodes again from the last keyframe before the target,
+        # so it only pays off if that keyframe lies ahead of the current position.
+        if ind < pos:
+            return False
+        if ind == pos:
+            return True
+        # The index is only built by `read_frames`, which visits many frames
+        keyframes = self._keyframes if self._keyframes_loaded else None
+        if keyframes is None:
+            return ind - pos <= self.max_grab_without_index
+        i = np.searchsorted(keyframes, ind, side="right") - 1
+        return i < 0 or keyframes[i] <= pos
+
+    @property
+    def keyframes(self):
+        """Sorted indices of the keyframes of the video, or None if unknown.
+
+        The index is built once with ffprobe, from the packets of the video
+        stream (i.e., without decoding), and cached next to the video.
+        """
+        if not self._keyframes_loaded:
+            self._keyframes = self._load_keyframes()
+            self._keyframes_loaded = True
+        return self._keyframes
+
+    @property
+    def keyframes_path(self):
+        return os.path.join(self.directory, f"{self.name}{self.format}.keyframes.npz")
+
+    def _load_keyframes(self):
+        stat = os.stat(self.video_path)
+        try:
+            with np.load(self.keyframes_path) as file:
+                if file["size"] == stat.st_size and file["mtime"] == stat.st_mtime:
+                    return file["keyframes"]
+        except (OSError, KeyError, ValueError):
+            pass
+        keyframes = self._probe_keyframes()
+        if keyframes is not None:
+            try:
+                np.savez(
+                    self.keyframes_path,
+                    keyframes=keyframes,
+                    size=stat.st_size,
+                    mtime=stat.st_mtime,
+                )
+            except OSError:  # E.g., read-only folder; the index is rebuilt next time
+                pass
+        return keyframes
+
+    def _probe_keyframes(self):
+        command = (
+            f'ffprobe -i "{self.video_path}" -v error -select_streams v:0 '
+            f"-show_entries packet=pts,flags -of csv=p=0"
+        )
+        try:
+            output = subprocess.check_output(
+                command, shell=True, stderr=subprocess.DEVNULL
+            )
+        except (subprocess.CalledProcessError, OSError):
+            return None
+        pts = []
+        is_key = []
+        for line in output.decode().splitlines():
+            if not line.strip():
+                continue
+            stamp, flags = line.split(",")[:2]
+            if stamp == "N/A":
+                return None
+            pts.append(int(stamp))
+            is_key.append("K" in flags)
+        if not pts:
+            return None
+        # Packets are listed in decoding order; frames are shown in timestamp order
+        order = np.argsort(pts, kind="stable")
+        return np.flatnonzero(np.asarray(is_key)[order])
+
+    def read_frames(self, inds, shrink=1, crop=False):
+        """Yield (index, frame) for the requested frames, in increasing order.
+
+        The video is read forward and only moved to another keyframe when this
+        skips frames, so that every group of pictures is decoded at most once.
+        Frames that cannot be read are None.
+        """
+        _ = self.keyframes  # Build or load the keyframe index once
+        for ind in np.unique(np.asarray(inds, dtype=int)):
+            self.set_to_frame(ind)
+            yield ind, self.read_frame(shrink, crop)
 
     def reset(self):
         self.set_to_frame(0)
@@ -358,12 +461,329 @@ class VideoWriter(VideoReader):
         return os.path.join(dest_folder, f"{self.name}{suffix}{self.format}")
 
 
+class BatchedFrameReader:
+    """
+    Decode frames of an opened ``cv2.VideoCapture`` on a background thread.
+
+    Frames are converted to RGB, optionally cropped, and written into a small pool
+    of preallocated batch buffers, so that decoding of the next batch overlaps with
+    inference on the current one. Iterating over the reader yields
+    ``(frames, inds)`` tuples, where ``frames`` is a (batchsize, ny, nx, 3) uint8
+    array and ``inds`` the video indices of its first ``len(inds)`` rows.
+    A buffer is handed back to the decoding thread as soon as the next batch
+    is requested; copy it if it must outlive the current iteration.
+
+    Parameters
+    ----------
+    cap: cv2.VideoCapture
+        Opened video capture, positioned at the first frame to read.
+
+    nframes: int
+        Number of frames to read.
+
+    batchsize: int
+        Number of frames per batch.
+
+    cropping: tuple(int, int, int, int) or None, optional, default=None
+        Crop coordinates as (x1, x2, y1, y2).
+
+    n_buffers: int, optional, default=3
+        Number of batch buffers; at most ``n_buffers - 1`` batches are decoded ahead.
+
+    start: int, optional, default=0
+        Index of the first frame to read; the capture is moved there if needed.
+
+    indices: array-like of int or None, optional, default=None
+        If given, only the frames at these indices are decoded; all others are
+        skipped with ``cap.grab()``, which is considerably cheaper.
+    """
+
+    def __init__(
+        self,
+        cap,
+        nframes,
+        batchsize,
+        cropping=None,
+        n_buffers=3,
+        start=0,
+        indices=None,
+    ):
+        if n_buffers < 2:
+            raise ValueError("At least two buffers are required to prefetch frames.")
+        self.cap = cap
+        self.nframes = nframes
+        self.batchsize = batchsize
+        self.cropping = cropping
+        self.start_frame = start
+        self._wanted = None
+        if indices is not None:
+            self._wanted = np.zeros(nframes, dtype=bool)
+            self._wanted[np.asarray(indices, dtype=int)] = True
+            # No need to read past the last wanted frame
+            wanted = np.flatnonzero(self._wanted)
+            self.nframes = wanted[-1] + 1 if wanted.size else 0
+        if start > 0:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+        if cropping is not None:
+            x1, x2, y1, y2 = cropping
+            self.ny, self.nx = y2 - y1, x2 - x1
+        else:
+            self.ny = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+            self.nx = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        self._init_buffers(n_buffers)
+
+    def _init_buffers(self, n_buffers):
+        self._free = queue.Queue()
+        for _ in range(n_buffers):
+            self._free.put(
+                np.empty((self.batchsize, self.ny, self.nx, 3), dtype=np.uint8)
+            )
+        self._ready = queue.Queue()
+        self._stop = threading.Event()
+        self._thread = None
+        self._held = None
+        self._exhausted = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __iter__(self):
+        self.start()
+        try:
+            while True:
+                item = self._ready.get()
+                if item is None:
+                    self._exhausted = True
+                    break
+                if isinstance(item, BaseException):
+                    raise item
+                self._held = item[0]
+                yield item
+                self._free.put(self._held)
+                self._held = None
+        finally:
+            self.close()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._decode, daemon=True)
+            self._thread.start()
+
+    def close(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        if self._held is not None:
+            self._free.put(self._held)
+            self._held = None
+        # Hand back pending buffers so the decoding thread cannot block
+        while not self._exhausted:
+            item = self._ready.get()
+            if item is None:
+                self._exhausted = True
+            elif not isinstance(item, BaseException):
+                self._free.put(item[0])
+        self._thread.join()
+        self._thread = None
+
+    def _read_into(self, cap, out):
+        ret, frame = cap.read()
+        if not ret:
+            return False
+        if self.cropping is not None:
+            x1, x2, y1, y2 = self.cropping
+            out[:] = frame[y1:y2, x1:x2, ::-1]
+        else:
+            cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=out)
+        return True
+
+    def _decode(self):
+        try:
+            ind = self.start_frame
+            while ind < self.nframes:
+                frames = self._free.get()
+                if self._stop.is_set():
+                    break
+                inds = []
+                while len(inds) < self.batchsize and ind < self.nframes:
+                    if self._wanted is not None and not self._wanted[ind]:
+                        self.cap.grab()
+                    elif self._read_into(self.cap, frames[len(inds)]):
+                        inds.append(ind)
+                    else:
+                        warnings.warn(f"Could not decode frame #{ind}.")
+                    ind += 1
+                if inds:
+                    self._ready.put((frames, inds))
+                else:
+                    self._free.put(frames)
+        except Exception as e:
+            self._ready.put(e)
+        finally:
+            self._ready.put(None)
+
+
+class InterleavedFrameReader(BatchedFrameReader):
+    """
+    Decode frames of several videos into shared batches on a background thread.
+
+    Up to ``n_streams`` videos are open at any time. Batches are filled round-robin
+    with frames from the open videos, and an exhausted video is immediately
+    replaced by the next one in the list, so that short clips still fill up
+    complete batches. Iterating over the reader yields ``(frames, inds, done)``
+    tuples, where ``inds`` lists the (video index, frame index) pairs of the
+    first ``len(inds)`` rows of ``frames`` and ``done`` the indices of the videos
+    whose last frame was read into this batch.
+
+    Parameters
+    ----------
+    videos: list[str]
+        Paths to the videos, all of the same (cropped) frame dimensions.
+
+    nframes: list[int]
+        Number of frames to read from each video.
+
+    batchsize: int
+        Number of frames per batch.
+
+    frame_dimensions: tuple(int, int)
+        Height and width of the frames (before cropping).
+
+    cropping: tuple(int, int, int, int) or None, optional, default=None
+        Crop coordinates as (x1, x2, y1, y2), applied to all videos.
+
+    n_streams: int, optional, default=4
+        Number of videos decoded concurrently.
+
+    n_buffers: int, optional, default=3
+        Number of batch buffers; at most ``n_buffers - 1`` batches are decoded ahead.
+    """
+
+    def __init__(
+        self,
+        videos,
+        nframes,
+        batchsize,
+        frame_dimensions,
+        cropping=None,
+        n_streams=4,
+        n_buffers=3,
+    ):
+        if len(videos) != len(nframes):
+            raise ValueError("`nframes` must be given for every video.")
+        if n_streams < 1:
+            raise ValueError("At least one video must be decoded at a time.")
+        if n_buffers < 2:
+            raise ValueError("At least two buffers are required to prefetch frames.")
+        self.videos = videos
+        self.nframes = nframes
+        self.batchsize = batchsize
+        self.cropping = cropping
+        self.n_streams = n_streams
+        if cropping is not None:
+            x1, x2, y1, y2 = cropping
+            self.ny, self.nx = y2 - y1, x2 - x1
+        else:
+            self.ny, self.nx = frame_dimensions
+        self._init_buffers(n_buffers)
+
+    def _decode(self):
+        streams = []  # Open videos as [video index, capture, next frame index]
+        pending = iter(range(len(self.videos)))
+
+        def open_next():
+            for video_ind in pending:
+                cap = cv2.VideoCapture(self.videos[video_ind])
+                if not cap.isOpened():
+                    raise IOError(f"Video {self.videos[video_ind]} could not be opened.")
+                streams.append([video_ind, cap, 0])
+                return
+
+        try:
+            for _ in range(self.n_streams):
+                open_next()
+            while streams:
+                frames = self._free.get()
+                if self._stop.is_set():
+                    break
+                inds, done = [], []
+                k = 0
+                while len(inds) < self.batchsize and streams:
+                    k %= len(streams)
+                    stream = streams[k]
+                    video_ind, cap, frame_ind = stream
+                    if self._read_into(cap, frames[len(inds)]):
+                        inds.append((video_ind, frame_ind))
+                    else:
+                        warnings.warn(
+                            f"Could not decode frame #{frame_ind} "
+                            f"of {self.videos[video_ind]}."
+                        )
+                    stream[2] += 1
+                    if stream[2] >= self.nframes[video_ind]:
+                        cap.release()
+                        del streams[k]
+                        done.append(video_ind)
+                        open_next()
+                    else:
+                        k += 1
+                if inds or done:
+                    self._ready.put((frames, inds, done))
+                else:
+                    self._free.put(frames)
+        except Exception as e:
+            self._ready.put(e)
+        finally:
+            for _, cap, _ in streams:
+                cap.release()
+            self._ready.put(None)
+
+
 def check_video_integrity(video_path):
     vid = VideoReader(video_path)
     vid.check_integrity()
     vid.check_integrity_robust()
 
 
+def concatenate_videos(video_paths, output_path):
+    """
+    Join videos end to end without re-encoding them.
+
+    The videos must share the same codec and encoding parameters, as is the case
+    for segments written one after the other by the same encoder.
+
+    Parameters
+    ----------
+    video_paths : list
+        Paths of the videos to concatenate, in order.
+
+    output_path: str
+        Path of the concatenated video; overwritten if it already exists.
+
+    Returns
+    -------
+    str
+        Full path to the concatenated video
+    """
+    list_path = f"{output_path}.txt"
+    with open(list_path, "w") as file:
+        for video_path in video_paths:
+            path = os.path.abspath(video_path).replace("'", r"'\''")
+            file.write(f"file '{path}'\n")
+    command = (
+        f'ffmpeg -y -v error -f concat -safe 0 -i "{list_path}" '
+        f'-c copy "{output_path}"'
+    )
+    try:
+        subprocess.check_call(command, shell=True)
+    finally:
+        os.remove(list_path)
+    return output_path
+
+
 def imread(image_path, mode="skimage"):
     """Read image either with skimage or cv2.
     Returns frame in uint with 3 color channels."""
@@ -393,13 +393,43 @@ def get_list_of_videos(
     return videos
 
 
-def save_data(PredicteData, metadata, dataname, pdindex, imagenames, save_as_csv):
-    """Save predicted data as h5 file and metadata as pickle file; created by predict_videos.py"""
-    DataMachine = pd.DataFrame(PredicteData, columns=pdindex, index=imagenames)
-    if save_as_csv:
-        print("Saving csv poses!")
-        DataMachine.to_csv(dataname.split(".h5")[0] + ".csv")
-    DataMachine.to_hdf(dataname, "df_with_missing", format="table", mode="w")
+def save_data(
+    PredicteData,
+    metadata,
+    dataname,
+    pdindex,
+    imagenames,
+    save_as_csv,
+    chunksize=None,
+):
+    """Save predicted data as h5 file and metadata as pickle file; created by predict_videos.py
+
+    If ``chunksize`` is given, data are written ``chunksize`` rows at a time, so that
+    no DataFrame of the complete (e.g., memory-mapped) array is ever built.
+    """
+    if chunksize is None:
+        DataMachine = pd.DataFrame(PredicteData, columns=pdindex, index=imagenames)
+        if save_as_csv:
+            print("Saving csv poses!")
+            DataMachine.to_csv(dataname.split(".h5")[0] + ".csv")
+        DataMachine.to_hdf(dataname, "df_with_missing", format="table", mode="w")
+    else:
+        if save_as_csv:
+            print("Saving csv poses!")
+        with pd.HDFStore(dataname, mode="w") as store:
+            for start in range(0, len(PredicteData), chunksize):
+                chunk = pd.DataFrame(
+                    PredicteData[start : start + chunksize],
+                    columns=pdindex,
+                    index=imagenames[start : start + chunksize],
+                )
+                store.append("df_with_missing", chunk, format="table")
+                if save_as_csv:
+                    chunk.to_csv(
+                        dataname.split(".h5")[0] + ".csv",
+                        mode="w" if start == 0 else "a",
+                        header=start == 0,
+                    )
     with open(dataname.split(".h5")[0] + "_meta.pickle", "wb") as f:
         # Pickle the 'data' dictionary using the highest protocol available.
         pickle.dump(metadata, f, pickle.HIGHEST_PROTOCOL)
@@ -257,6 +257,7 @@ def KmeansbasedFrameselectioncv2(
     else:
         Index = np.array(Index)
         Index = Index[(Index > startindex) * (Index < stopindex)]  # crop to range!
+        Index = np.unique(Index)  # frames are read in increasing order
 
     nframes = len(Index)
     if batchsize > nframes:
@@ -266,12 +267,11 @@ def KmeansbasedFrameselectioncv2(
     if len(Index) >= numframes2pick:
         if (
             np.mean(np.diff(Index)) > 1
-        ):  # then non-consecutive indices are present, thus cap.set is required (which slows everything down!)
+        ):  # then non-consecutive indices are present; frames are read GOP by GOP, seeking only past keyframes
             print("Extracting and downsampling...", nframes, " frames from the video.")
             if color:
-                for counter, index in tqdm(enumerate(Index)):
-                    cap.set_to_frame(index)  # extract a particular frame
-                    frame = cap.read_frame(crop=True)
+                frames = cap.read_frames(Index, crop=True)
+                for counter, (index, frame) in tqdm(enumerate(frames)):
                     if frame is not None:
                         image = img_as_ubyte(
                             cv2.resize(
@@ -293,9 +293,8 @@ def KmeansbasedFrameselectioncv2(
                             [image[:, :, 0], image[:, :, 1], image[:, :, 2]]
                         )
             else:
-                for counter, index in tqdm(enumerate(Index)):
-                    cap.set_to_frame(index)  # extract a particular frame
-                    frame = cap.read_frame(crop=True)
+                frames = cap.read_frames(Index, crop=True)
+                for counter, (index, frame) in tqdm(enumerate(frames)):
                     if frame is not None:
                         image = img_as_ubyte(
                             cv2.resize(
@@ -23,16 +23,21 @@ You can find the directory for your ffmpeg bindings by: "find / | grep ffmpeg" a
 
 import argparse
 import os
+import queue
+import threading
 
 ####################################################
 # Dependencies
 ####################################################
 import os.path
+import warnings
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 from functools import partial
 from multiprocessing import Pool, get_start_method
 from typing import Iterable, Callable, Optional, Union
 
+import cv2
 import matplotlib.colors as mcolors
 import matplotlib.pyplot as plt
 import numpy as np
@@ -41,14 +46,14 @@ from matplotlib.animation import FFMpegWriter
 from matplotlib.collections import LineCollection
 from skimage.draw import disk, line_aa, set_color
 from skimage.util import img_as_ubyte
-from tqdm import trange
+from tqdm import tqdm, trange
 from deeplabcut.modelzoo.utils import parse_available_supermodels
 from deeplabcut.pose_estimation_tensorflow.config import load_config
 from deeplabcut.utils import auxiliaryfunctions, auxfun_multianimal, visualization
 from deeplabcut.utils.video_processor import (
     VideoProcessorCV as vp,
 )  # used to CreateVideo
-from deeplabcut.utils.auxfun_videos import VideoWriter
+from deeplabcut.utils.auxfun_videos import VideoWriter, concatenate_videos
 
 
 def get_segment_indices(bodyparts2connect, all_bpts):
@@ -85,8 +90,15 @@ def CreateVideo(
     displaycropped,
     color_by,
     confidence_to_alpha=None,
+    n_workers=None,
+    n_segments=1,
 ):
-    """Creating individual frames with labeled body parts and making a video"""
+    """Creating individual frames with labeled body parts and making a video
+
+    Frames are decoded, labeled by ``n_workers`` threads (all cores by default)
+    and encoded concurrently. With ``n_segments`` > 1, consecutive time segments
+    of the video are rendered in as many processes and then concatenated.
+    """
     bpts = Dataframe.columns.get_level_values("bodyparts")
     all_bpts = bpts.values[::3]
     if draw_skeleton:
@@ -151,53 +163,314 @@ def CreateVideo(
         C = colorclass.to_rgba(np.linspace(0, 1, nindividuals))
     colors = (C[:, :3] * 255).astype(np.uint8)
 
-    with np.errstate(invalid="ignore"):
-        for index in trange(min(nframes, len(Dataframe))):
-            image = clip.load_frame()
-            if displaycropped:
-                image = image[y1:y2, x1:x2]
-
-            # Draw the skeleton for specific bodyparts to be connected as
-            # specified in the config file
-            if draw_skeleton:
-                for bpt1, bpt2 in bpts2connect:
-                    if np.all(df_likelihood[[bpt1, bpt2], index] > pcutoff) and not (
-                        np.any(np.isnan(df_x[[bpt1, bpt2], index]))
-                        or np.any(np.isnan(df_y[[bpt1, bpt2], index]))
-                    ):
-                        rr, cc, val = line_aa(
-                            int(np.clip(df_y[bpt1, index], 0, ny - 1)),
-                            int(np.clip(df_x[bpt1, index], 0, nx - 1)),
-                            int(np.clip(df_y[bpt2, index], 1, ny - 1)),
-                            int(np.clip(df_x[bpt2, index], 1, nx - 1)),
-                        )
-                        image[rr, cc] = color_for_skeleton
+    color_inds = [
+        num_bp if color_by == "bodypart" else num_ind
+        for _, num_bp, num_ind in bpts2color
+    ]
+    painter = _KeypointPainter(
+        df_x,
+        df_y,
+        df_likelihood,
+        keep,
+        colors[color_inds],
+        pcutoff,
+        dotsize,
+        (ny, nx),
+        trailpoints,
+        bpts2connect if draw_skeleton else None,
+        color_for_skeleton if draw_skeleton else None,
+        confidence_to_alpha,
+    )
+    crop = (x1, x2, y1, y2) if displaycropped else None
+    nframes = min(nframes, len(Dataframe))
+    if n_segments > 1:
+        _render_labeled_video_segments(
+            clip, painter, nframes, crop, n_segments, n_workers
+        )
+    else:
+        _render_labeled_video(clip, painter, nframes, crop, n_workers)
+        clip.close()
 
-            for ind, num_bp, num_ind in bpts2color:
-                if df_likelihood[ind, index] > pcutoff:
-                    if color_by == "bodypart":
-                        color = colors[num_bp]
-                    else:
-                        color = colors[num_ind]
-                    if trailpoints > 0:
-                        for k in range(1, min(trailpoints, index + 1)):
-                            rr, cc = disk(
-                                (df_y[ind, index - k], df_x[ind, index - k]),
-                                dotsize,
-                                shape=(ny, nx),
-                            )
-                            image[rr, cc] = color
-                    rr, cc = disk(
-                        (df_y[ind, index], df_x[ind, index]), dotsize, shape=(ny, nx)
+
+class _KeypointPainter:
+    """Draw keypoints, their trails and the skeleton onto chunks of frames.
+
+    Pixels are identical to drawing every dot with ``skimage.draw.disk`` and
+    every edge with ``skimage.draw.line_aa``. All disks of a chunk are rasterized
+    at once from a shared offset grid, and positions seen in the trails of
+    several frames are rasterized only once.
+    """
+
+    def __init__(
+        self,
+        x,
+        y,
+        likelihood,
+        keypoints,
+        colors,
+        pcutoff,
+        dotsize,
+        shape,
+        trailpoints=0,
+        segments=None,
+        skeleton_color=None,
+        confidence_to_alpha=None,
+    ):
+        self.x = x
+        self.y = y
+        self.likelihood = likelihood
+        self.keypoints = np.asarray(keypoints, dtype=int)
+        self.colors = np.asarray(colors, dtype=np.uint8).reshape((-1, 3))
+        self.pcutoff = pcutoff
+        self.dotsize = dotsize
+        self.shape = shape
+        self.trailpoints = trailpoints
+        self.segments = segments
+        self.skeleton_color = skeleton_color
+        self.confidence_to_alpha = confidence_to_alpha
+        # Side of a square containing the bounding box of any disk
+        self._grid = np.arange(int(2 * dotsize) + 2, dtype=float)
+
+    def _rasterize(self, rows, cols):
+        """Return the pixels of the disks centered on (rows, cols), grouped by disk."""
+        centers = np.c_[rows, cols]
+        valid = np.isfinite(centers).all(axis=1)
+        upper_left = np.maximum(np.ceil(centers - self.dotsize), 0)
+        lower_right = np.minimum(
+            np.floor(centers + self.dotsize), np.array(self.shape) - 1
+        )
+        shifted = centers - upper_left
+        grid = self._grid
+        with np.errstate(invalid="ignore"):
+            dr = ((grid - shifted[:, :1]) / self.dotsize) ** 2
+            dc = ((grid - shifted[:, 1:]) / self.dotsize) ** 2
+            extent = lower_right - upper_left
+            inside_r = (grid <= extent[:, :1]) & valid[:, np.newaxis]
+            inside_c = grid <= extent[:, 1:]
+            inside = (dr[:, :, np.newaxis] + dc[:, np.newaxis] < 1) & (
+                inside_r[:, :, np.newaxis] & inside_c[:, np.newaxis]
+            )
+        disk_inds, i, j = np.nonzero(inside)
+        rr = upper_left[disk_inds, 0].astype(int) + i
+        cc = upper_left[disk_inds, 1].astype(int) + j
+        offsets = np.r_[0, np.cumsum(np.bincount(disk_inds, minlength=len(centers)))]
+        return rr, cc, offsets
+
+    def _draw_skeleton(self, index):
+        ny, nx = self.shape
+        rows, cols = [], []
+        for bpt1, bpt2 in self.segments:
+            pair = [bpt1, bpt2]
+            if np.all(self.likelihood[pair, index] > self.pcutoff) and not (
+                np.any(np.isnan(self.x[pair, index]))
+                or np.any(np.isnan(self.y[pair, index]))
+            ):
+                rr, cc, _ = line_aa(
+                    int(np.clip(self.y[bpt1, index], 0, ny - 1)),
+                    int(np.clip(self.x[bpt1, index], 0, nx - 1)),
+                    int(np.clip(self.y[bpt2, index], 1, ny - 1)),
+                    int(np.clip(self.x[bpt2, index], 1, nx - 1)),
+                )
+                rows.append(rr)
+                cols.append(cc)
+        if not rows:
+            return []
+        rr = np.concatenate(rows)
+        colors = np.tile(self.skeleton_color, (len(rr), 1))
+        return [(rr, np.concatenate(cols), colors)]
+
+    @staticmethod
+    def _paint(image, strokes):
+        """Paint opaque strokes in order, later strokes covering earlier ones."""
+        if not strokes:
+            return
+        rr, cc, colors = (np.concatenate(arrays) for arrays in zip(*strokes))
+        flat = rr * image.shape[1] + cc
+        _, last = np.unique(flat[::-1], return_index=True)
+        last = len(flat) - 1 - last
+        image[rr[last], cc[last]] = colors[last]
+
+    def __call__(self, frames, start):
+        """Label the consecutive ``frames`` starting at video index ``start``."""
+        n_keypoints = len(self.keypoints)
+        first = max(start - max(self.trailpoints - 1, 0), 0)
+        stop = start + len(frames)
+        inds = self.keypoints
+        rr, cc, offsets = self._rasterize(
+            self.y[inds, first:stop].T.ravel(), self.x[inds, first:stop].T.ravel()
+        )
+        for image, index in zip(frames, range(start, stop)):
+            strokes = []
+            if self.segments:
+                strokes.extend(self._draw_skeleton(index))
+            with np.errstate(invalid="ignore"):
+                visible = np.flatnonzero(self.likelihood[inds, index] > self.pcutoff)
+            n_trail = max(min(self.trailpoints, index + 1) - 1, 0)
+            # Trail dots from the most recent to the oldest, then the current dot
+            lags = np.r_[np.arange(1, n_trail + 1), 0]
+            for k in visible:
+                disks = (index - lags - first) * n_keypoints + k
+                lengths = offsets[disks + 1] - offsets[disks]
+                pixels = np.arange(lengths.sum()) + np.repeat(
+                    offsets[disks] - np.cumsum(lengths) + lengths, lengths
+                )
+                color = self.colors[k]
+                if self.confidence_to_alpha is None:
+                    strokes.append(
+                        (rr[pixels], cc[pixels], np.tile(color, (len(pixels), 1)))
                     )
-                    alpha = 1
-                    if confidence_to_alpha is not None:
-                        alpha = confidence_to_alpha(df_likelihood[ind, index])
+                    continue
+                n_current = lengths[-1]
+                trail = pixels[: len(pixels) - n_current]
+                strokes.append(
+                    (rr[trail], cc[trail], np.tile(color, (len(trail), 1)))
+                )
+                self._paint(image, strokes)
+                strokes = []
+                current = pixels[len(pixels) - n_current :]
+                alpha = self.confidence_to_alpha(self.likelihood[inds[k], index])
+                set_color(image, (rr[current], cc[current]), color, alpha)
+            self._paint(image, strokes)
+        return frames
 
-                    set_color(image, (rr, cc), color, alpha)
 
-            clip.save_frame(image)
-    clip.close()
+def _render_labeled_video(
+    clip, painter, nframes, crop=None, n_workers=None, chunksize=16, start=0
+):
+    """Decode, label and encode the next ``nframes`` frames of ``clip``.
+
+    Frames are decoded on the calling thread in chunks of ``chunksize``,
+    labeled by a pool of ``n_workers`` threads (all cores by default), and
+    written in order by an encoder thread, so that the three stages overlap.
+    ``start`` is the index of the first decoded frame in the video.
+    """
+    if n_workers is None:
+        n_workers = os.cpu_count() or 1
+    pending = queue.Queue(maxsize=2 * n_workers)
+    errors = []
+    pbar = tqdm(total=nframes)
+
+    def encode():
+        while True:
+            future = pending.get()
+            if future is None:
+                break
+            if errors:  # Keep draining so the decoding thread never blocks
+                continue
+            try:
+                for frame in future.result():
+                    clip.save_frame(frame)
+                    pbar.update()
+            except BaseException as e:
+                errors.append(e)
+
+    encoder = threading.Thread(target=encode, daemon=True)
+    encoder.start()
+    try:
+        with ThreadPoolExecutor(n_workers) as pool:
+            stop = start + nframes
+            exhausted = False
+            while start < stop and not exhausted and not errors:
+                frames = []
+                while len(frames) < min(chunksize, stop - start):
+                    frame = clip.load_frame()
+                    if frame is None:
+                        exhausted = True
+                        break
+                    if crop is not None:
+                        x1, x2, y1, y2 = crop
+                        frame = frame[y1:y2, x1:x2]
+                    frames.append(frame)
+                if frames:
+                    pending.put(pool.submit(painter, frames, start))
+                    start += len(frames)
+    finally:
+        pending.put(None)
+        encoder.join()
+        pbar.close()
+    if errors:
+        raise errors[0]
+
+
+_segment_job = None
+
+
+def _run_segment(i):
+    return _segment_job(i)
+
+
+def _map_segments(job, n_segments):
+    """Run ``job(i)`` for every segment ``i``, in forked processes if possible.
+
+    The job is inherited by the workers rather than pickled, so it may close over
+    painters, dataframes and open videos.
+    """
+    global _segment_job
+    if n_segments < 2 or get_start_method() != "fork":
+        return [job(i) for i in range(n_segments)]
+    _segment_job = job
+    try:
+        with Pool(min(n_segments, os.cpu_count() or 1)) as pool:
+            return pool.map(_run_segment, range(n_segments))
+    finally:
+        _segment_job = None
+
+
+def _render_labeled_video_segments(
+    clip, painter, nframes, crop=None, n_segments=2, n_workers=None
+):
+    """Render the first ``nframes`` frames of ``clip`` in ``n_segments`` processes.
+
+    Every process seeks to the first frame of its time segment and encodes it to a
+    separate file with the settings of ``clip``; the segments are then joined
+    without re-encoding. The painter indexes the full data, so the trails of the
+    first frames of a segment are drawn from the keypoints of the previous one.
+    Segments are only rendered in parallel in forked processes; with other start
+    methods, the video is rendered in a single pass instead.
+    """
+    if get_start_method() != "fork":
+        warnings.warn(
+            "Rendering in segments requires the 'fork' start method, "
+            f"not '{get_start_method()}'; rendering in a single pass instead."
+        )
+        _render_labeled_video(clip, painter, nframes, crop, n_workers)
+        clip.close()
+        return
+
+    bounds = np.linspace(0, nframes, n_segments + 1).astype(int)
+    root, ext = os.path.splitext(clip.sname)
+    parts = [f"{root}_part{i}{ext}" for i in range(n_segments)]
+    if n_workers is None:
+        n_workers = max(1, (os.cpu_count() or 1) // n_segments)
+
+    def render(i):
+        segment = vp(
+            fname=clip.fname,
+            sname=parts[i],
+            codec=clip.codec,
+            sw=clip.sw,
+            sh=clip.sh,
+            fps=clip.FPS,
+        )
+        segment.vid.set(cv2.CAP_PROP_POS_FRAMES, bounds[i])
+        _render_labeled_video(
+            segment,
+            painter,
+            bounds[i + 1] - bounds[i],
+            crop,
+            n_workers,
+            start=bounds[i],
+        )
+        segment.close()
+
+    clip.close()  # The labeled video is written by the concatenation
+    try:
+        _map_segments(render, n_segments)
+        concatenate_videos(parts, clip.sname)
+    finally:
+        for part in parts:
+            if os.path.isfile(part):
+                os.remove(part)
 
 
 def CreateVideoSlow(
@@ -391,6 +664,7 @@ def create_labeled_video(
     alphavalue=0.5,
     overwrite=False,
     confidence_to_alpha: Union[bool, Callable[[float], float]] = False,
+    n_segments=1,
 ):
     """Labels the bodyparts in a video.
 
@@ -511,6 +785,14 @@ def create_labeled_video(
         keypoint will be set as a function of its score: alpha = f(score). The default
         function used when True is f(x) = max(0, (x - pcutoff)/(1 - pcutoff)).
 
+    n_segments: int, optional, default=1
+        Number of time segments each video is split into (only available in
+        ``fastmode``). Segments are rendered in parallel processes and
+        concatenated without re-encoding, which requires ffmpeg; videos are then
+        processed one after the other. Segments need forked processes: with the
+        'spawn' or 'forkserver' start methods (default on Windows and macOS),
+        a warning is issued and videos are rendered in a single pass.
+
     Returns
     -------
         results : list[bool]
@@ -661,10 +943,16 @@ def create_labeled_video(
         overwrite,
         init_weights=init_weights,
         confidence_to_alpha=confidence_to_alpha,
+        n_segments=n_segments,
     )
 
-    if get_start_method() == "fork":
-        with Pool(min(os.cpu_count(), len(Videos))) as pool:
+    # Videos split into segments are rendered one at a time, as pool workers
+    # cannot start processes of their own
+    if get_start_method() == "fork" and n_segments < 2:
+        n_processes = min(os.cpu_count(), len(Videos))
+        # Share the cores among the videos rendered in parallel
+        func = partial(func, n_workers=max(1, os.cpu_count() // n_processes))
+        with Pool(n_processes) as pool:
             results = pool.map(func, Videos)
     else:
         results = []
@@ -701,6 +989,8 @@ def proc_video(
     video,
     init_weights="",
     confidence_to_alpha: Optional[Callable[[float], float]] = None,
+    n_workers=None,
+    n_segments=1,
 ):
     """Helper function for create_videos
 
@@ -839,6 +1129,8 @@ def proc_video(
                     fps=outputframerate,
                     display_cropped=displaycropped,
                     confidence_to_alpha=confidence_to_alpha,
+                    n_workers=n_workers,
+                    n_segments=n_segments,
                 )
             return True
 
@@ -865,6 +1157,8 @@ def _create_labeled_video(
     fps=None,
     output_path="",
     confidence_to_alpha=None,
+    n_workers=None,
+    n_segments=1,
 ):
     if color_by not in ("bodypart", "individual"):
         raise ValueError("`color_by` should be either 'bodypart' or 'individual'.")
@@ -919,6 +1213,8 @@ def _create_labeled_video(
         display_cropped,
         color_by,
         confidence_to_alpha=confidence_to_alpha,
+        n_workers=n_workers,
+        n_segments=n_segments,
     )
 
 
@@ -1014,7 +1310,8 @@ def create_video_with_all_detections(
     confidence_to_alpha: Union[bool, Callable[[float], float]] = False,
 ):
     """
-    Create a video labeled with all the detections stored in a '*_full.pickle' file.
+    Create a video labeled with all the detections stored in a '*_full.detections'
+    store (or legacy '*_full.pickle' file).
 
     Parameters
     ----------
@@ -1083,12 +1380,10 @@ def create_video_with_all_detections(
         if not (os.path.isfile(outputname)):
             print("Creating labeled video for ", str(Path(video).stem))
             h5file = full_pickle.replace("_full.pickle", ".h5")
+            # Frames are read on demand from the (memory-mapped) detections
             data, _ = auxfun_multianimal.LoadFullMultiAnimalData(h5file)
-            data = dict(
-                data
-            )  # Cast to dict (making a copy) so items can safely be popped
 
-            header = data.pop("metadata")
+            header = data["metadata"]
             all_jointnames = header["all_joints_names"]
 
             if displayedbodyparts == "all":
@@ -1100,8 +1395,11 @@ def create_video_with_all_detections(
                     if bp in displayedbodyparts:
                         bpts.append(bptindex)
                 numjoints = len(bpts)
-            frame_names = list(data)
-            frames = [int(re.findall(r"\d+", name)[0]) for name in frame_names]
+            frame_names = {
+                int(re.findall(r"\d+", name)[0]): name
+                for name in data.keys()
+                if name != "metadata"
+            }
             colorclass = plt.cm.ScalarMappable(cmap=cfg["colormap"])
             C = colorclass.to_rgba(np.linspace(0, 1, numjoints))
             colors = (C[:, :3] * 255).astype(np.uint8)
@@ -1116,8 +1414,7 @@ def create_video_with_all_detections(
                 if frame is None:
                     continue
                 try:
-                    ind = frames.index(n)
-                    dets = Assembler._flatten_detections(data[frame_names[ind]])
+                    dets = Assembler._flatten_detections(data[frame_names[n]])
                     for det in dets:
                         if det.label not in bpts or det.confidence < pcutoff:
                             continue
@@ -1133,7 +1430,7 @@ def create_video_with_all_detections(
                             colors[bpts.index(det.label)],
                             alpha,
                         )
-                except ValueError as err:  # No data stored for that particular frame
+                except KeyError as err:  # No data stored for that particular frame
                     print(n, f"no data: {err}")
                     pass
                 try:
@@ -1146,7 +1443,9 @@ def create_video_with_all_detections(
             print("Detections already plotted, ", outputname)
 
 
-def _create_video_from_tracks(video, tracks, destfolder, output_name, pcutoff, scale=1):
+def _create_video_from_tracks(
+    video, tracks, destfolder, output_name, pcutoff, scale=1, n_segments=1
+):
     import subprocess
     from tqdm import tqdm
 
@@ -1164,24 +1463,35 @@ def _create_video_from_tracks(video, tracks, destfolder, output_name, pcutoff, s
     numtracks = len(tracks.keys()) - 1
     trackids = [t for t in tracks.keys() if t != "header"]
     cc = np.random.rand(numtracks + 1, 3)
-    fig, ax = visualization.prepare_figure_axes(nx, ny, scale)
-    im = ax.imshow(np.zeros((ny, nx)))
-    markers = sum([ax.plot([], [], ".", c=c) for c in cc], [])
-    for index in tqdm(range(nframes)):
-        vid.set_to_frame(index)
-        imname = "frame" + str(index).zfill(strwidth)
-        image_output = os.path.join(destfolder, imname + ".png")
-        frame = vid.read_frame()
-        if frame is not None and not os.path.isfile(image_output):
-            im.set_data(frame[:, X1:X2])
-            for n, trackid in enumerate(trackids):
-                if imname in tracks[trackid]:
-                    x, y, p = tracks[trackid][imname].reshape((-1, 3)).T
-                    markers[n].set_data(x[p > pcutoff], y[p > pcutoff])
-                else:
-                    markers[n].set_data([], [])
-            fig.subplots_adjust(left=0, bottom=0, right=1, top=1, wspace=0, hspace=0)
-            plt.savefig(image_output)
+    bounds = np.linspace(0, nframes, n_segments + 1).astype(int)
+
+    def plot_segment(i):
+        # Every segment reads its own frames and draws on its own figure
+        reader = VideoWriter(video)
+        fig, ax = visualization.prepare_figure_axes(nx, ny, scale)
+        im = ax.imshow(np.zeros((ny, nx)))
+        markers = sum([ax.plot([], [], ".", c=c) for c in cc], [])
+        for index in tqdm(range(bounds[i], bounds[i + 1])):
+            reader.set_to_frame(index)
+            imname = "frame" + str(index).zfill(strwidth)
+            image_output = os.path.join(destfolder, imname + ".png")
+            frame = reader.read_frame()
+            if frame is not None and not os.path.isfile(image_output):
+                im.set_data(frame[:, X1:X2])
+                for n, trackid in enumerate(trackids):
+                    if imname in tracks[trackid]:
+                        x, y, p = tracks[trackid][imname].reshape((-1, 3)).T
+                        markers[n].set_data(x[p > pcutoff], y[p > pcutoff])
+                    else:
+                        markers[n].set_data([], [])
+                fig.subplots_adjust(
+                    left=0, bottom=0, right=1, top=1, wspace=0, hspace=0
+                )
+                fig.savefig(image_output)
+        plt.close(fig)
+        reader.close()
+
+    _map_segments(plot_segment, n_segments)
 
     outputframerate = 30
     os.chdir(destfolder)
@@ -1201,7 +1511,7 @@ def _create_video_from_tracks(video, tracks, destfolder, output_name, pcutoff, s
 
 
 def create_video_from_pickled_tracks(
-    video, pickle_file, destfolder="", output_name="", pcutoff=0.6
+    video, pickle_file, destfolder="", output_name="", pcutoff=0.6, n_segments=1
 ):
     if not destfolder:
         destfolder = os.path.splitext(video)[0]
@@ -1209,7 +1519,9 @@ def create_video_from_pickled_tracks(
         video_name, ext = os.path.splitext(os.path.split(video)[1])
         output_name = video_name + "DLClabeled" + ext
     tracks = auxiliaryfunctions.read_pickle(pickle_file)
-    _create_video_from_tracks(video, tracks, destfolder, output_name, pcutoff)
+    _create_video_from_tracks(
+        video, tracks, destfolder, output_name, pcutoff, n_segments=n_segments
+    )
 
 
 def _get_default_conf_to_alpha(
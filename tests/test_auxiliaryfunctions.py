@@ -8,6 +8,8 @@
 #
 # Licensed under GNU Lesser General Public License v3.0
 #
+import numpy as np
+import pandas as pd
 from pathlib import Path
 import pytest
 from deeplabcut.utils import auxiliaryfunctions
@@ -230,3 +232,24 @@ def test_find_next_unlabeled_folder(
     monkeypatch.setattr(Path, "rglob", get_rglob_results)
     next_folder = auxiliaryfunctions.find_next_unlabeled_folder(fake_cfg)
     assert str(next_folder) == str(Path(data_folder / next_folder_name))
+
+
+@pytest.mark.parametrize("chunksize", [7, 25, 100])
+def test_save_data_chunked(tmp_path, chunksize):
+    data = np.random.rand(25, 6)
+    pdindex = pd.MultiIndex.from_product(
+        [["scorer"], ["bp1", "bp2"], ["x", "y", "likelihood"]],
+        names=["scorer", "bodyparts", "coords"],
+    )
+    metadata = {"data": {}}
+    ref = str(tmp_path / "ref.h5")
+    auxiliaryfunctions.save_data(data, metadata, ref, pdindex, range(25), True)
+    dataname = str(tmp_path / "chunked.h5")
+    auxiliaryfunctions.save_data(
+        data, metadata, dataname, pdindex, range(25), True, chunksize
+    )
+    pd.testing.assert_frame_equal(pd.read_hdf(dataname), pd.read_hdf(ref))
+    pd.testing.assert_frame_equal(
+        pd.read_csv(str(tmp_path / "chunked.csv"), header=[0, 1, 2], index_col=0),
+        pd.read_csv(str(tmp_path / "ref.csv"), header=[0, 1, 2], index_col=0),
+    )
@@ -0,0 +1,276 @@
+#
+# DeepLabCut Toolbox (deeplabcut.org)
+# © A. & M.W. Mathis Labs
+# https://github.com/DeepLabCut/DeepLabCut
+#
+# Please see AUTHORS for contributors.
+# https://github.com/DeepLabCut/DeepLabCut/blob/master/AUTHORS
+#
+# Licensed under GNU Lesser General Public License v3.0
+#
+import numpy as np
+import os
+import pickle
+import pytest
+import shelve
+from conftest import TEST_DATA_DIR
+from deeplabcut.pose_estimation_tensorflow.core import predict_multianimal
+from deeplabcut.pose_estimation_tensorflow.lib import inferenceutils
+from deeplabcut.pose_estimation_tensorflow.lib.detectionutils import (
+    DetectionStore,
+    DetectionTable,
+    DetectionTableWriter,
+    read_detections,
+)
+
+
+N_BODYPARTS = 4
+GRAPH = [[0, 1], [1, 2], [2, 3], [0, 3]]
+
+
+def _fake_detections(n_frames=6, n_animals=2, n_id_channels=0, seed=0):
+    rng = np.random.default_rng(seed)
+    h, w = 24, 32
+    n_channels = N_BODYPARTS + n_id_channels
+    scmaps = rng.random((n_frames, h, w, n_channels)).astype(np.float32)
+    locrefs = rng.normal(size=(n_frames, h, w, n_channels, 2)).astype(np.float32)
+    pafs = rng.normal(size=(n_frames, h, w, len(GRAPH), 2)).astype(np.float32)
+    peak_inds = np.array(
+        [
+            (i, rng.integers(h), rng.integers(w), j)
+            for i in range(n_frames)
+            for j in range(N_BODYPARTS)
+            for _ in range(rng.integers(0, n_animals + 1))
+        ]
+    )
+    preds = predict_multianimal.compute_peaks_and_costs(
+        scmaps,
+        locrefs,
+        pafs,
+        peak_inds,
+        GRAPH,
+        np.arange(len(GRAPH)),
+        stride=8,
+        n_id_channels=n_id_channels,
+    )
+    data = {
+        "metadata": {
+            "all_joints_names": [f"bpt{i}" for i in range(N_BODYPARTS)],
+            "PAFgraph": GRAPH,
+            "PAFinds": np.arange(len(GRAPH)),
+        }
+    }
+    for i, pred in enumerate(preds):
+        data[f"frame{i:02d}"] = pred
+    return data
+
+
+def _assert_frames_equal(frame, frame_ref):
+    assert set(frame) == set(frame_ref)
+    for xy, xy_ref in zip(frame["coordinates"][0], frame_ref["coordinates"][0]):
+        np.testing.assert_array_equal(xy, xy_ref)
+    for key in ("confidence", "identity"):
+        for arr, arr_ref in zip(frame.get(key, []), frame_ref.get(key, [])):
+            np.testing.assert_array_equal(arr, arr_ref)
+    costs, costs_ref = frame["costs"], frame_ref["costs"]
+    assert list(costs) == list(costs_ref)
+    for k in costs:
+        for key in ("m1", "distance"):
+            np.testing.assert_array_equal(costs[k][key], costs_ref[k][key])
+
+
+@pytest.mark.parametrize("n_id_channels", [0, 3])
+def test_detection_table_round_trip(tmp_path, n_id_channels):
+    data = _fake_detections(n_id_channels=n_id_channels)
+    table = DetectionTable.from_dict(data)
+    assert list(table) == list(data)
+    assert table["metadata"] is data["metadata"]
+    for name in table.frame_names:
+        _assert_frames_equal(table[name], data[name])
+
+    path = str(tmp_path / "dets.npz")
+    table.save(path)
+    table_loaded = DetectionTable.load(path)
+    for name in table.frame_names:
+        _assert_frames_equal(table_loaded[name], data[name])
+    table_unpickled = pickle.loads(pickle.dumps(table))
+    for name in table.frame_names:
+        _assert_frames_equal(table_unpickled[name], data[name])
+
+
+def test_detection_table_writer_missing_costs():
+    data = _fake_detections()
+    writer = DetectionTableWriter()
+    writer["metadata"] = data["metadata"]
+    frame = dict(data["frame00"])
+    frame["costs"] = {}
+    writer["frame00"] = frame
+    writer["frame01"] = data["frame01"]
+    assert "frame01" in writer
+    table = writer.to_table()
+    assert table["frame00"]["costs"] == {}
+    _assert_frames_equal(table["frame01"], data["frame01"])
+
+
+def _assemble(data, window_size=0, **kwargs):
+    ass = inferenceutils.Assembler(
+        data,
+        max_n_individuals=2,
+        n_multibodyparts=N_BODYPARTS,
+        pcutoff=0.1,
+        min_affinity=0,
+        window_size=window_size,
+    )
+    ass.assemble(**{"chunk_size": 0, **kwargs})
+    return ass
+
+
+def _assert_assemblies_equal(ass, ass_ref):
+    assert ass.assemblies.keys() == ass_ref.assemblies.keys()
+    for i, assemblies in ass.assemblies.items():
+        assert len(assemblies) == len(ass_ref.assemblies[i])
+        for a, a_ref in zip(assemblies, ass_ref.assemblies[i]):
+            np.testing.assert_array_equal(a.data, a_ref.data)
+
+
+def test_assembler_reads_detection_table():
+    data = _fake_detections(n_frames=10, n_animals=3)
+    ass_ref = _assemble(data)
+    ass = _assemble(DetectionTable.from_dict(data))
+    assert ass.metadata["imnames"] == ass_ref.metadata["imnames"]
+    assert ass.assemblies.keys() == ass_ref.assemblies.keys()
+    for i, assemblies in ass.assemblies.items():
+        for a, a_ref in zip(assemblies, ass_ref.assemblies[i]):
+            np.testing.assert_array_equal(a.data, a_ref.data)
+
+
+def test_assembler_reads_detection_table_real_data():
+    with open(os.path.join(TEST_DATA_DIR, "trimouse_full.pickle"), "rb") as file:
+        data = pickle.load(file)
+    table = DetectionTable.from_dict(data)
+    kwargs = dict(max_n_individuals=3, n_multibodyparts=12)
+    ass_ref = inferenceutils.Assembler(data, **kwargs)
+    ass_ref.assemble(chunk_size=0)
+    ass = inferenceutils.Assembler(table, **kwargs)
+    ass.assemble(chunk_size=0)
+    assert ass.assemblies.keys() == ass_ref.assemblies.keys()
+    for i, assemblies in ass.assemblies.items():
+        for a, a_ref in zip(assemblies, ass_ref.assemblies[i]):
+            np.testing.assert_array_equal(a.data, a_ref.data)
+
+
+class _FrameCounter:
+    n_frames = 0
+
+    def __init__(self, total):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def update(self, n):
+        _FrameCounter.n_frames += n
+
+
+@pytest.mark.parametrize("as_table", [False, True])
+@pytest.mark.parametrize("window_size", [0, 2])
+def test_assembler_parallel_matches_serial(monkeypatch, as_table, window_size):
+    data = _fake_detections(n_frames=12, n_animals=3, seed=1)
+    if as_table:
+        data = DetectionTable.from_dict(data)
+    ass_ref = _assemble(data, window_size)
+    # An overlap spanning the whole video makes the segments exact
+    monkeypatch.setattr(inferenceutils, "tqdm", _FrameCounter)
+    monkeypatch.setattr(_FrameCounter, "n_frames", 0)
+    ass = _assemble(data, window_size, chunk_size=2, n_processes=2, overlap=12)
+    assert _FrameCounter.n_frames == 12  # Every frame is only assembled once
+    assert ass.assemblies
+    _assert_assemblies_equal(ass, ass_ref)
+
+
+def test_detection_table_slice():
+    data = _fake_detections(n_frames=8, n_id_channels=2)
+    table = DetectionTable.from_dict(data)
+    sub = table.slice(3, 6)
+    assert sub.frame_names == table.frame_names[3:6]
+    for name in sub.frame_names:
+        _assert_frames_equal(sub[name], data[name])
+
+
+@pytest.mark.parametrize("n_id_channels", [0, 3])
+def test_detection_store_round_trip(tmp_path, n_id_channels):
+    data = _fake_detections(n_frames=10, n_id_channels=n_id_channels)
+    path = str(tmp_path / "dets_full.detections")
+    store = DetectionStore(path, chunk_size=4)
+    for key, value in data.items():
+        store[key] = value
+    assert list(store.keys()) == list(data)
+    # Buffered frames are flushed on access
+    _assert_frames_equal(store["frame09"], data["frame09"])
+    table = store.close()
+    assert isinstance(table.xy, np.memmap)
+    assert table.frame_names == list(data)[1:]
+    for name in table.frame_names:
+        _assert_frames_equal(table[name], data[name])
+    sub = table.slice(5, 8)
+    for name in sub.frame_names:
+        _assert_frames_equal(sub[name], data[name])
+    table_in_memory = read_detections(path, mmap_mode=None)
+    assert not isinstance(table_in_memory.xy, np.memmap)
+    assert table_in_memory["metadata"]["PAFgraph"] == data["metadata"]["PAFgraph"]
+    _assert_assemblies_equal(_assemble(table), _assemble(data))
+
+
+def test_detection_store_resume(tmp_path):
+    data = _fake_detections(n_frames=10)
+    names = list(data)[1:]
+    path = str(tmp_path / "dets_full.detections")
+    store = DetectionStore(path, chunk_size=4)
+    store["metadata"] = data["metadata"]
+    for name in names[:6]:
+        store[name] = data[name]
+    # Simulate a crash while appending the next chunk
+    with open(os.path.join(path, "xy.bin"), "ab") as file:
+        file.write(b"garbage")
+    del store
+
+    store = DetectionStore(path, chunk_size=4)
+    assert store.keys() == ["metadata", *names[:4]]
+    for name in names[4:]:
+        store[name] = data[name]
+    table = store.close()
+    assert table.frame_names == names
+    for name in names:
+        _assert_frames_equal(table[name], data[name])
+
+
+def test_detection_store_missing_costs(tmp_path):
+    data = _fake_detections(n_frames=4)
+    store = DetectionStore(str(tmp_path / "dets"), chunk_size=2)
+    store["metadata"] = data["metadata"]
+    for name in ("frame00", "frame01"):
+        frame = dict(data[name])
+        frame.pop("costs")
+        store[name] = frame
+    store["frame02"] = data["frame02"]
+    table = store.close()
+    assert table["frame00"]["costs"] == {}
+    _assert_frames_equal(table["frame02"], data["frame02"])
+
+
+def test_read_legacy_detections(tmp_path):
+    data = _fake_detections()
+    path = str(tmp_path / "dets_full.pickle")
+    with open(path, "wb") as file:
+        pickle.dump(data, file)
+    assert read_detections(path).keys() == data.keys()
+    path = str(tmp_path / "shelf_full.pickle")
+    with shelve.open(path) as db:
+        db.update(data)
+    with read_detections(path) as db:
+        for name in data:
+            if name != "metadata":
+                _assert_frames_equal(db[name], data[name])
@@ -0,0 +1,228 @@
+#
+# DeepLabCut Toolbox (deeplabcut.org)
+# © A. & M.W. Mathis Labs
+# https://github.com/DeepLabCut/DeepLabCut
+#
+# Please see AUTHORS for contributors.
+# https://github.com/DeepLabCut/DeepLabCut/blob/master/AUTHORS
+#
+# Licensed under GNU Lesser General Public License v3.0
+#
+import numpy as np
+import pandas as pd
+import pytest
+from scipy import signal
+from scipy.interpolate import CubicSpline
+from deeplabcut.post_processing import filtering, streaming
+from deeplabcut.refine_training_dataset.outlier_frames import fit_kalman_smoother
+
+
+def _spline_interp_reference(data, max_gap=0):
+    # One spline through all valid points of a column, as historically done
+    temp = data.copy()
+    valid = ~np.isnan(temp)
+    x = np.arange(len(temp))
+    for i in range(temp.shape[1]):
+        mask = valid[:, i]
+        if np.sum(mask) > 3:
+            y = CubicSpline(x[mask], temp[mask, i])(x)
+            if max_gap > 0:
+                inds = np.flatnonzero(np.r_[True, np.diff(mask), True])
+                count = np.diff(inds)
+                inds = inds[:-1]
+                to_fill = np.ones_like(mask)
+                for ind, n, is_nan in zip(inds, count, ~mask[inds]):
+                    if is_nan and n > max_gap:
+                        to_fill[ind : ind + n] = False
+                y[~to_fill] = np.nan
+            y[y == 0] = np.nan
+            temp[:, i] = y
+    return temp
+
+
+def _fake_data_with_gaps(nrows=3000, ncols=6, seed=0):
+    rng = np.random.default_rng(seed)
+    t = np.arange(nrows)[:, None]
+    data = 100 * np.sin(t / 50 + np.arange(ncols))
+    data += 0.1 * np.cumsum(rng.normal(size=data.shape), axis=0)
+    for i in range(ncols):
+        for start in rng.integers(nrows, size=40):
+            data[start : start + rng.integers(1, 30), i] = np.nan
+    data[:5, 0] = np.nan
+    data[-3:, 1] = np.nan
+    # Too few points to fit a spline
+    data[:, -1] = np.nan
+    data[[10, nrows // 6, 3 * nrows // 10], -1] = 1
+    return data
+
+
+def test_find_gaps():
+    missing = np.array(
+        [[1, 0], [1, 0], [0, 1], [1, 1], [0, 0], [0, 1]],
+        dtype=bool,
+    )
+    cols, starts, lengths = filtering._find_gaps(missing)
+    np.testing.assert_array_equal(cols, [0, 0, 1, 1])
+    np.testing.assert_array_equal(starts, [0, 3, 2, 5])
+    np.testing.assert_array_equal(lengths, [2, 1, 2, 1])
+
+
+def test_cubic_splines_match_scipy():
+    rng = np.random.default_rng(0)
+    x = np.cumsum(rng.integers(1, 5, size=(7, 12)), axis=1)
+    y = rng.normal(size=x.shape)
+    coefs = filtering._cubic_splines(x, y)
+    for i in range(len(x)):
+        np.testing.assert_allclose(coefs[:, i], CubicSpline(x[i], y[i]).c)
+
+
+@pytest.mark.parametrize("max_gap", [0, 10])
+def test_columnwise_spline_interp_matches_global_spline(max_gap):
+    data = _fake_data_with_gaps()
+    expected = _spline_interp_reference(data, max_gap)
+    filled = filtering.columnwise_spline_interp(data, max_gap)
+    np.testing.assert_array_equal(np.isnan(filled), np.isnan(expected))
+    np.testing.assert_allclose(filled, expected, atol=1e-6)
+    # Batched and per-spline fits, in one or several processes, agree
+    filled_large_splines = filtering._fill_gaps(
+        data, max_gap, 20, max_batched_knots=0
+    )
+    np.testing.assert_allclose(filled_large_splines, filled, atol=1e-9)
+    filled_parallel = filtering.columnwise_spline_interp(data, max_gap, n_processes=2)
+    np.testing.assert_array_equal(filled_parallel, filled)
+
+
+def test_columnwise_spline_interp_edge_gaps_with_few_knots():
+    data = np.full((20, 1), np.nan)
+    data[5:15, 0] = np.sin(np.arange(5, 15))
+    filled = filtering.columnwise_spline_interp(data, n_knots=3)
+    x = np.arange(20)
+    head = CubicSpline(x[5:8], data[5:8, 0])(x[:5])
+    tail = CubicSpline(x[12:15], data[12:15, 0])(x[15:])
+    np.testing.assert_allclose(filled[:5, 0], head)
+    np.testing.assert_allclose(filled[15:, 0], tail)
+    pose_filter = streaming.StreamingSplineFilter(max_gap=5, n_knots=3)
+    data = np.c_[data, data, np.isfinite(data)]
+    filtered = np.concatenate([pose_filter.update(data), pose_filter.flush()])
+    np.testing.assert_allclose(filtered[:, 0], filled[:, 0])
+
+
+@pytest.mark.parametrize("n_knots", [1, 2])
+def test_columnwise_spline_interp_too_few_knots(n_knots):
+    with pytest.raises(ValueError):
+        filtering.columnwise_spline_interp(_fake_data_with_gaps(), n_knots=n_knots)
+    with pytest.raises(ValueError):
+        streaming.StreamingSplineFilter(n_knots=n_knots)
+
+
+def _fake_poses(nrows=600, nkeypoints=3, seed=0):
+    rng = np.random.default_rng(seed)
+    xy = _fake_data_with_gaps(ncols=2 * nkeypoints, seed=seed)[:nrows, :-1]
+    xy = np.c_[xy, 100 + np.cumsum(rng.normal(size=nrows))]
+    p = rng.random((nrows, nkeypoints))
+    p[np.isnan(xy[:, ::2]) | np.isnan(xy[:, 1::2])] = 0
+    p[0] = 1
+    xy[0] = np.nan_to_num(xy[0], nan=50)
+    data = np.empty((nrows, 3 * nkeypoints))
+    data[:, 0::3] = xy[:, ::2]
+    data[:, 1::3] = xy[:, 1::2]
+    data[:, 2::3] = p
+    return data
+
+
+def _stream(pose_filter, data, seed=0):
+    # Feed chunks of random sizes, including single frames
+    rng = np.random.default_rng(seed)
+    bounds = np.unique(np.r_[0, rng.integers(0, len(data), 40), 1, 2, len(data)])
+    filtered = [pose_filter.update(data[i:j]) for i, j in zip(bounds, bounds[1:])]
+    filtered.append(pose_filter.flush())
+    return np.concatenate(filtered)
+
+
+@pytest.mark.parametrize("windowlength", [1, 5])
+def test_streaming_median_filter(windowlength):
+    data = _fake_poses()
+    filtered = _stream(streaming.StreamingMedianFilter(windowlength), data)
+    expected = data.copy()
+    mask = np.arange(data.shape[1]) % 3 != 2
+    expected[:, mask] = signal.medfilt(data[:, mask], (windowlength, 1))
+    np.testing.assert_array_equal(filtered, expected)
+
+
+def test_streaming_median_filter_short_stream():
+    data = _fake_poses()[:2]
+    pose_filter = streaming.StreamingMedianFilter(7)
+    assert not len(pose_filter.update(data))
+    expected = signal.medfilt(data[:, 0], 7)
+    np.testing.assert_array_equal(pose_filter.flush()[:, 0], expected)
+
+
+def test_streaming_spline_filter():
+    data = _fake_poses()
+    filtered = _stream(streaming.StreamingSplineFilter(max_gap=10), data)
+    mask = np.arange(data.shape[1]) % 3 != 2
+    xy = data[:, mask]
+    xy_filled = filtering.columnwise_spline_interp(xy, 10)
+    filled = np.isnan(xy) & ~np.isnan(xy_filled)
+    np.testing.assert_allclose(filtered[:, mask][filled], xy_filled[filled], atol=1e-6)
+    np.testing.assert_array_equal(np.isnan(filtered[:, mask]), np.isnan(xy_filled))
+    p = filtered[:, ~mask]
+    np.testing.assert_array_equal(p == 0.01, filled[:, ::2] | filled[:, 1::2])
+
+
+def test_streaming_kalman_filter():
+    data = _fake_poses()
+    mask = np.arange(data.shape[1]) % 3 != 2
+    p = np.repeat(data[:, ~mask], 2, axis=1)
+    expected, _ = fit_kalman_smoother(data[:, mask], p, 0.1, 0.01)
+    # Calibrated on the whole stream, and smoothed at once
+    pose_filter = streaming.StreamingKalmanFilter(0.1, n_calibration=len(data))
+    filtered = _stream(pose_filter, data)
+    np.testing.assert_allclose(filtered[:, mask], expected, atol=1e-8)
+    np.testing.assert_array_equal(filtered[:, ~mask], data[:, ~mask])
+
+    # Fixed-lag smoothing, with a lag longer than the gaps in the data
+    ratios = [1.0]
+    expected, _ = fit_kalman_smoother(data[:, mask], p, 0.1, 0.01, ratios=ratios)
+    pose_filter = streaming.StreamingKalmanFilter(
+        0.1, lag=100, n_calibration=0, ratios=ratios
+    )
+    filtered = _stream(pose_filter, data)
+    np.testing.assert_allclose(filtered[:, mask], expected, atol=1e-6)
+
+
+def test_filter_h5_in_chunks(tmp_path):
+    data = _fake_poses()
+    columns = pd.MultiIndex.from_product(
+        [["scorer"], ["bpt0", "bpt1", "bpt2"], ["x", "y", "likelihood"]],
+        names=["scorer", "bodyparts", "coords"],
+    )
+    df = pd.DataFrame(data, columns=columns, index=np.arange(len(data)) + 10)
+    h5file = str(tmp_path / "data.h5")
+    df.to_hdf(h5file, "tracks", format="table", mode="w")
+    output_file = str(tmp_path / "data_filtered.h5")
+    csv_file = str(tmp_path / "data_filtered.csv")
+    pose_filter = streaming.get_streaming_filter("median", 5)
+    n_frames = streaming.filter_h5_in_chunks(
+        h5file, pose_filter, output_file, chunksize=64, csv_file=csv_file
+    )
+    assert n_frames == len(df)
+    expected = df.copy()
+    mask = df.columns.get_level_values("coords") != "likelihood"
+    expected.loc[:, mask] = signal.medfilt(data[:, mask], (5, 1))
+    pd.testing.assert_frame_equal(pd.read_hdf(output_file), expected)
+    df_csv = pd.read_csv(csv_file, header=[0, 1, 2], index_col=0)
+    np.testing.assert_allclose(df_csv.to_numpy(), expected.to_numpy())
+
+
+def test_filter_h5_in_chunks_fixed_format(tmp_path):
+    df = pd.DataFrame(_fake_poses())
+    h5file = str(tmp_path / "data.h5")
+    df.to_hdf(h5file, "df_with_missing", format="fixed", mode="w")
+    assert not streaming.is_table(h5file)
+    output_file = tmp_path / "data_filtered.h5"
+    with pytest.raises(ValueError):
+        streaming.filter_h5_in_chunks(
+            h5file, streaming.StreamingMedianFilter(), str(output_file)
+        )
+    assert not output_file.exists()
@@ -0,0 +1,226 @@
+#
+# DeepLabCut Toolbox (deeplabcut.org)
+# © A. & M.W. Mathis Labs
+# https://github.com/DeepLabCut/DeepLabCut
+#
+# Please see AUTHORS for contributors.
+# https://github.com/DeepLabCut/DeepLabCut/blob/master/AUTHORS
+#
+# Licensed under GNU Lesser General Public License v3.0
+#
+import cv2
+import numpy as np
+import os
+import pytest
+from conftest import TEST_DATA_DIR
+from skimage.draw import disk, line_aa, set_color
+from deeplabcut.utils import make_labeled_video
+from deeplabcut.utils.video_processor import VideoProcessorCV
+
+
+SHAPE = 60, 80
+
+
+def _fake_predictions(n_keypoints=5, n_frames=12, seed=0):
+    rng = np.random.default_rng(seed)
+    x = rng.uniform(-5, SHAPE[1] + 5, size=(n_keypoints, n_frames))
+    y = rng.uniform(-5, SHAPE[0] + 5, size=(n_keypoints, n_frames))
+    likelihood = rng.random((n_keypoints, n_frames))
+    x[0, 3] = np.nan
+    likelihood[1, 4] = np.nan
+    return x, y, likelihood
+
+
+def _draw_reference(
+    image,
+    index,
+    x,
+    y,
+    likelihood,
+    keypoints,
+    colors,
+    pcutoff,
+    dotsize,
+    trailpoints,
+    segments,
+    skeleton_color,
+    to_alpha,
+):
+    # Frame-by-frame drawing, as historically done in CreateVideo
+    ny, nx = SHAPE
+    with np.errstate(invalid="ignore"):
+        for bpt1, bpt2 in segments or []:
+            if np.all(likelihood[[bpt1, bpt2], index] > pcutoff) and not (
+                np.any(np.isnan(x[[bpt1, bpt2], index]))
+                or np.any(np.isnan(y[[bpt1, bpt2], index]))
+            ):
+                rr, cc, _ = line_aa(
+                    int(np.clip(y[bpt1, index], 0, ny - 1)),
+                    int(np.clip(x[bpt1, index], 0, nx - 1)),
+                    int(np.clip(y[bpt2, index], 1, ny - 1)),
+                    int(np.clip(x[bpt2, index], 1, nx - 1)),
+                )
+                image[rr, cc] = skeleton_color
+        for ind, color in zip(keypoints, colors):
+            if likelihood[ind, index] > pcutoff:
+                for k in range(1, min(trailpoints, index + 1)):
+                    rr, cc = disk(
+                        (y[ind, index - k], x[ind, index - k]), dotsize, shape=SHAPE
+                    )
+                    image[rr, cc] = color
+                rr, cc = disk((y[ind, index], x[ind, index]), dotsize, shape=SHAPE)
+                alpha = 1 if to_alpha is None else to_alpha(likelihood[ind, index])
+                set_color(image, (rr, cc), color, alpha)
+
+
+@pytest.mark.parametrize("trailpoints", [0, 4])
+@pytest.mark.parametrize("with_skeleton", [False, True])
+@pytest.mark.parametrize("to_alpha", [None, lambda p: p])
+def test_keypoint_painter_matches_reference(trailpoints, with_skeleton, to_alpha):
+    x, y, likelihood = _fake_predictions()
+    keypoints = [0, 1, 3, 4]
+    colors = np.array([[255, 0, 0], [0, 255, 0], [0, 0, 255], [255, 255, 0]])
+    segments = [(0, 1), (1, 3), (2, 4)] if with_skeleton else None
+    skeleton_color = np.array([255, 255, 255], dtype=np.uint8)
+    painter = make_labeled_video._KeypointPainter(
+        x,
+        y,
+        likelihood,
+        keypoints,
+        colors,
+        0.3,
+        6.5,
+        SHAPE,
+        trailpoints,
+        segments,
+        skeleton_color,
+        to_alpha,
+    )
+    rng = np.random.default_rng(1)
+    frames = rng.integers(0, 255, size=(x.shape[1], *SHAPE, 3), dtype=np.uint8)
+    expected = frames.copy()
+    for index, image in enumerate(expected):
+        _draw_reference(
+            image,
+            index,
+            x,
+            y,
+            likelihood,
+            keypoints,
+            colors,
+            0.3,
+            6.5,
+            trailpoints,
+            segments,
+            skeleton_color,
+            to_alpha,
+        )
+    # Chunks must not depend on each other
+    for start in range(0, len(frames), 5):
+        painter(list(frames[start : start + 5]), start)
+    np.testing.assert_array_equal(frames, expected)
+
+
+class _FakeClip:
+    def __init__(self, frames):
+        self.frames = list(frames)
+        self.saved = []
+
+    def load_frame(self):
+        return self.frames.pop(0) if self.frames else None
+
+    def save_frame(self, frame):
+        self.saved.append(frame.copy())
+
+
+@pytest.mark.parametrize("n_workers, nframes", [(1, 20), (3, 20), (3, 50)])
+def test_render_labeled_video_keeps_order(n_workers, nframes):
+    frames = np.arange(30, dtype=np.uint8).reshape((30, 1, 1, 1)) * np.ones(
+        (1, 4, 6, 3), dtype=np.uint8
+    )
+    clip = _FakeClip(frames)
+
+    def painter(chunk, start):
+        for i, frame in enumerate(chunk):
+            assert frame[0, 0, 0] == start + i
+        return chunk
+
+    make_labeled_video._render_labeled_video(
+        clip, painter, nframes, crop=(1, 5, 0, 2), n_workers=n_workers, chunksize=4
+    )
+    assert len(clip.saved) == min(nframes, 30)
+    for i, frame in enumerate(clip.saved):
+        assert frame.shape == (2, 4, 3)
+        assert np.all(frame == i)
+
+
+def test_render_labeled_video_from_offset():
+    frames = np.arange(10, 30, dtype=np.uint8).reshape((20, 1, 1, 1)) * np.ones(
+        (1, 2, 2, 3), dtype=np.uint8
+    )
+    clip = _FakeClip(frames)
+
+    def painter(chunk, start):
+        for i, frame in enumerate(chunk):
+            assert frame[0, 0, 0] == start + i
+        return chunk
+
+    make_labeled_video._render_labeled_video(
+        clip, painter, 15, n_workers=2, chunksize=4, start=10
+    )
+    assert [frame[0, 0, 0] for frame in clip.saved] == list(range(10, 25))
+
+
+def test_render_labeled_video_segments(tmp_path, monkeypatch):
+    video = os.path.join(TEST_DATA_DIR, "vid.avi")
+    output_path = str(tmp_path / "vid_labeled.mp4")
+    n_frames = {}
+
+    def concatenate(parts, path):
+        assert path == output_path
+        for part in parts:
+            cap = cv2.VideoCapture(part)
+            n_frames[part] = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+            cap.release()
+
+    monkeypatch.setattr(make_labeled_video, "concatenate_videos", concatenate)
+    clip = VideoProcessorCV(fname=video, sname=output_path, codec="mp4v")
+    make_labeled_video._render_labeled_video_segments(
+        clip, lambda chunk, start: chunk, 100, n_segments=3, n_workers=2
+    )
+    assert list(n_frames.values()) == [33, 33, 34]
+    # Temporary segments are cleaned up
+    assert all(not os.path.exists(part) for part in n_frames)
+
+
+def test_render_labeled_video_segments_without_fork(tmp_path, monkeypatch):
+    video = os.path.join(TEST_DATA_DIR, "vid.avi")
+    output_path = str(tmp_path / "vid_labeled.mp4")
+
+    def concatenate(parts, path):
+        raise AssertionError("Segments should not be rendered")
+
+    monkeypatch.setattr(make_labeled_video, "concatenate_videos", concatenate)
+    monkeypatch.setattr(make_labeled_video, "get_start_method", lambda: "spawn")
+    clip = VideoProcessorCV(fname=video, sname=output_path, codec="mp4v")
+    with pytest.warns(UserWarning, match="single pass"):
+        make_labeled_video._render_labeled_video_segments(
+            clip, lambda chunk, start: chunk, 100, n_segments=3, n_workers=2
+        )
+    cap = cv2.VideoCapture(output_path)
+    assert int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) == 100
+    cap.release()
+
+
+def test_render_labeled_video_propagates_errors():
+    clip = _FakeClip(np.zeros((30, 2, 2, 3), dtype=np.uint8))
+
+    def painter(chunk, start):
+        if start >= 8:
+            raise RuntimeError("drawing failed")
+        return chunk
+
+    with pytest.raises(RuntimeError):
+        make_labeled_video._render_labeled_video(
+            clip, painter, 30, n_workers=2, chunksize=4
+        )
@@ -0,0 +1,90 @@
+#
+# DeepLabCut Toolbox (deeplabcut.org)
+# © A. & M.W. Mathis Labs
+# https://github.com/DeepLabCut/DeepLabCut
+#
+# Please see AUTHORS for contributors.
+# https://github.com/DeepLabCut/DeepLabCut/blob/master/AUTHORS
+#
+# Licensed under GNU Lesser General Public License v3.0
+#
+import numpy as np
+import pandas as pd
+import pytest
+import statsmodels.api as sm
+from deeplabcut.refine_training_dataset import outlier_frames
+
+
+def _fake_trajectories(n_frames=500, n_series=4, seed=0):
+    rng = np.random.default_rng(seed)
+    acc = rng.normal(scale=0.5, size=(n_frames, n_series))
+    X = np.cumsum(np.cumsum(acc, axis=0), axis=0)
+    X += rng.normal(scale=2, size=X.shape)
+    P = rng.random(X.shape)
+    P[100:130, 0] = 0
+    return X, P
+
+
+class _ConstantVelocityModel(sm.tsa.statespace.MLEModel):
+    def __init__(self, y, q, r, m0, C0):
+        super().__init__(y, k_states=2)
+        self["design"] = np.array([[1.0, 0.0]])
+        self["transition"] = np.array([[1.0, 1.0], [0.0, 1.0]])
+        self["selection"] = np.eye(2)
+        self["state_cov"] = q * np.array([[1 / 3, 1 / 2], [1 / 2, 1]])
+        self["obs_cov"] = np.array([[r]])
+        self.ssm.initialize_known(m0, C0)
+
+
+@pytest.mark.parametrize("ratio", [0.01, 1])
+def test_kalman_smoother_matches_statsmodels(ratio):
+    X, P = _fake_trajectories()
+    Y = np.where(P >= 0.05, X, np.nan)
+    ratios = np.full(Y.shape[1], ratio)
+    means, covs, scale, loglik = outlier_frames._kalman_filter(Y, ratios)
+    means, covs = outlier_frames._rts_smoother(means, covs, ratios)
+    for i, y in enumerate(Y.T):
+        m0 = np.array([y[np.isfinite(y)][0], 0])
+        model = _ConstantVelocityModel(
+            y, ratio * scale[i], scale[i], m0, scale[i] * np.diag([1, 1e4])
+        )
+        res = model.smooth([])
+        nobs = np.isfinite(y).sum()
+        assert loglik[i] - nobs * (1 + np.log(2 * np.pi)) / 2 == pytest.approx(
+            res.llf
+        )
+        np.testing.assert_allclose(means[:, i, 0], res.smoothed_state[0], atol=1e-6)
+        np.testing.assert_allclose(
+            scale[i] * covs[:, i, 0, 0], res.smoothed_state_cov[0, 0], atol=1e-6
+        )
+
+
+def test_fit_kalman_smoother():
+    X, P = _fake_trajectories()
+    P[:, 3] = 0
+    mean, CI = outlier_frames.fit_kalman_smoother(X, P, 0.05, 0.01)
+    assert mean.shape == X.shape
+    assert CI.shape == (*X.shape, 2)
+    # Too few observations
+    assert np.all(np.isnan(mean[:, 3]))
+    inside = (X[:, :3] >= CI[:, :3, 0]) & (X[:, :3] <= CI[:, :3, 1])
+    assert inside.mean() > 0.95
+    assert np.mean(np.abs(mean[:, :3] - X[:, :3])) < 2
+
+
+def test_compute_deviations(tmp_path):
+    X, P = _fake_trajectories(n_series=6)
+    values = np.stack((X[:, :3], X[:, 3:], P[:, :3]), axis=-1)
+    columns = pd.MultiIndex.from_product(
+        [["scorer"], ["bpt0", "bpt1", "bpt2"], ["x", "y", "likelihood"]],
+        names=["scorer", "bodyparts", "coords"],
+    )
+    df = pd.DataFrame(values.reshape((len(X), -1)), columns=columns)
+    d, o, data = outlier_frames.compute_deviations(
+        df, str(tmp_path / "fake.h5"), 0.05, 0.01, 3, 1, storeoutput="full"
+    )
+    assert d.shape == o.shape == (len(X),)
+    mean, _ = outlier_frames.fit_kalman_smoother(
+        X, np.c_[P[:, :3], P[:, :3]], 0.05, 0.01
+    )
+    np.testing.assert_allclose(data.xs("meany", axis=1, level=-1), mean[:, 3:])
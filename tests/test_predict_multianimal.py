@@ -93,3 +93,59 @@ def test_compute_peaks_and_costs_no_graph(model_outputs):
         stride=STRIDE,
     )[0]
     assert "costs" not in preds
+
+
+def _edge_costs_reference(pafs, peak_inds, graph, paf_inds, n_points=10):
+    """Compute the cost of every candidate edge one pair of peaks at a time."""
+    all_costs = []
+    for i in range(pafs.shape[0]):
+        peaks = peak_inds[peak_inds[:, 0] == i]
+        costs = dict()
+        for (s, t), k in zip(graph, paf_inds):
+            sources = peaks[peaks[:, 3] == s, 1:3]
+            targets = peaks[peaks[:, 3] == t, 1:3]
+            m1 = np.zeros((len(sources), len(targets)), dtype=np.float32)
+            distance = np.zeros_like(m1)
+            for a, source in enumerate(sources):
+                for b, target in enumerate(targets):
+                    xy = np.linspace(source, target, n_points, dtype=np.int32)
+                    y = pafs[i, xy[:, 0], xy[:, 1], k]
+                    integ = np.trapz(y, xy[:, ::-1], axis=0)
+                    length = np.linalg.norm(target - source) + np.spacing(1)
+                    m1[a, b] = np.linalg.norm(integ) / length
+                    distance[a, b] = length
+            costs[k] = {"m1": m1, "distance": distance}
+        all_costs.append(costs)
+    return all_costs
+
+
+def test_compute_edge_costs():
+    rng = np.random.default_rng(42)
+    n_samples, n_bodyparts, h, w = 4, 5, 30, 40
+    graph = [[i, j] for i in range(n_bodyparts) for j in range(i + 1, n_bodyparts)]
+    paf_inds = rng.permutation(len(graph))
+    pafs = rng.random((n_samples, h, w, len(graph), 2)).astype(np.float32)
+    peak_inds = np.array(
+        [
+            (i, rng.integers(1, h), rng.integers(1, w), j)
+            for i in range(n_samples - 1)  # Last sample without detections
+            for j in range(n_bodyparts)
+            for _ in range(rng.integers(0, 4))
+        ]
+    )
+    rng.shuffle(peak_inds)
+    costs = predict_multianimal.compute_edge_costs(
+        pafs, peak_inds.copy(), graph, paf_inds, n_bodyparts
+    )
+    costs_ref = _edge_costs_reference(pafs, peak_inds, graph, paf_inds)
+    assert len(costs) == n_samples
+    for costs_i, costs_ref_i in zip(costs, costs_ref):
+        assert list(costs_i) == list(costs_ref_i)
+        for k, v in costs_i.items():
+            for key in ("m1", "distance"):
+                if not v[key].size:
+                    assert not costs_ref_i[k][key].size
+                else:
+                    np.testing.assert_allclose(
+                        v[key], costs_ref_i[k][key], atol=1e-3
+                    )
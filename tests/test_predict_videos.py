@@ -0,0 +1,189 @@
+#
+# DeepLabCut Toolbox (deeplabcut.org)
+# © A. & M.W. Mathis Labs
+# https://github.com/DeepLabCut/DeepLabCut
+#
+# Please see AUTHORS for contributors.
+# https://github.com/DeepLabCut/DeepLabCut/blob/master/AUTHORS
+#
+# Licensed under GNU Lesser General Public License v3.0
+#
+import numpy as np
+import os
+import pytest
+from deeplabcut.pose_estimation_tensorflow import predict_videos
+
+
+def test_analysis_checkpoint(tmp_path):
+    prefix = str(tmp_path / "videoDLC_resnet50")
+    nframes, n_cols = 100, 6
+    checkpoint = predict_videos._PredictionStore(prefix, checkpoint_every=10)
+    data, start = checkpoint.open(nframes, n_cols)
+    assert start == 0
+    assert not data.any()
+    data[:25] = 1
+    checkpoint.update(5)
+    assert not os.path.isfile(checkpoint.manifest_path)
+    checkpoint.update(25)
+    assert os.path.isfile(checkpoint.manifest_path)
+    del data
+
+    # Resume from the last checkpoint
+    checkpoint = predict_videos._PredictionStore(prefix, checkpoint_every=10)
+    data, start = checkpoint.open(nframes, n_cols)
+    assert start == 25
+    np.testing.assert_array_equal(data[:25], 1)
+    del data
+    checkpoint.remove()
+    assert not os.path.isfile(checkpoint.data_path)
+    assert not os.path.isfile(checkpoint.manifest_path)
+
+    # A checkpoint of a different shape is discarded
+    checkpoint = predict_videos._PredictionStore(prefix, checkpoint_every=10)
+    data, _ = checkpoint.open(nframes, n_cols)
+    checkpoint.update(50)
+    checkpoint = predict_videos._PredictionStore(prefix, checkpoint_every=10)
+    _, start = checkpoint.open(nframes, n_cols + 3)
+    assert start == 0
+
+
+def test_prediction_store_without_checkpoint(tmp_path):
+    prefix = str(tmp_path / "videoDLC_resnet50")
+    store = predict_videos._PredictionStore(prefix, dtype=np.float32)
+    data, start = store.open(100, 6)
+    assert start == 0
+    assert isinstance(data, np.memmap)
+    assert data.dtype == np.float32
+    store.update(50)
+    assert not os.path.isfile(store.manifest_path)
+    del data
+    store.remove()
+    assert not os.path.isfile(store.data_path)
+
+
+def test_resume_frame_reader(tmp_path):
+    import cv2
+
+    path = str(tmp_path / "vid.avi")
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), 30, (64, 48))
+    for i in range(20):
+        writer.write(np.full((48, 64, 3), i * 10, dtype=np.uint8))
+    writer.release()
+    cap = cv2.VideoCapture(path)
+    cfg = {"cropping": False}
+    with predict_videos._make_frame_reader(cfg, cap, 20, 4, start=12) as reader:
+        inds = [ind for _, batch_inds in reader for ind in batch_inds]
+    assert inds == list(range(12, 20))
+
+
+def test_predict_crop_origins():
+    box = (10, 30, 5, 25)
+    xs, ys = predict_videos._predict_crop_origins(
+        box, np.array([4.0, -2.0]), [1, 2, 10], 50, 40
+    )
+    np.testing.assert_array_equal(xs, [14, 18, 30])
+    np.testing.assert_array_equal(ys, [3, 1, 0])
+
+
+def _fake_getposeNP(images, *args, **kwargs):
+    """Detect the centroid of bright pixels in each image."""
+    pose = np.zeros((len(images), 3))
+    for i, image in enumerate(images):
+        ys, xs = np.nonzero(image[..., 0] > 127)
+        if xs.size:
+            pose[i] = xs.mean(), ys.mean(), 1
+    return pose
+
+
+def _write_square_video(path, centers, ny=120, nx=160):
+    import cv2
+
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), 30, (nx, ny))
+    for x, y in centers:
+        frame = np.zeros((ny, nx, 3), dtype=np.uint8)
+        frame[y - 4 : y + 5, x - 4 : x + 5] = 255
+        writer.write(frame)
+    writer.release()
+
+
+def test_dynamic_cropping_batched(tmp_path, monkeypatch):
+    import cv2
+
+    nframes, ny, nx = 30, 120, 160
+    centers = [(20 + 3 * i, 30 + 2 * i) for i in range(nframes)]
+    path = str(tmp_path / "vid.avi")
+    _write_square_video(path, centers, ny, nx)
+    calls = []
+
+    def fake_getposeNP(images, *args, **kwargs):
+        calls.append(images.shape)
+        return _fake_getposeNP(images)
+
+    monkeypatch.setattr(predict_videos.predict, "getposeNP", fake_getposeNP)
+    cfg = {"cropping": False}
+    dlc_cfg = {"all_joints_names": ["center"]}
+    data, _ = predict_videos.GetPoseDynamicBatched(
+        cfg, dlc_cfg, None, None, None, cv2.VideoCapture(path), nframes, 8, 0.5, 20
+    )
+    np.testing.assert_allclose(data[:, :2], centers, atol=1)
+    np.testing.assert_array_equal(data[:, 2], 1)
+    # Only the first batch is analyzed on full frames
+    assert calls[0][1:3] == (ny, nx)
+    assert all(shape[1:3] != (ny, nx) for shape in calls[1:])
+
+
+def test_coarse_to_fine_pose(monkeypatch):
+    frames = np.zeros((2, 200, 240, 3), dtype=np.uint8)
+    frames[0, 150:157, 40:47] = 255
+    shapes = []
+
+    def fake_getposeNP(images, *args, **kwargs):
+        shapes.append(images.shape)
+        return _fake_getposeNP(images)
+
+    monkeypatch.setattr(predict_videos.predict, "getposeNP", fake_getposeNP)
+    dlc_cfg = {"stride": 8}
+    pose = predict_videos._coarse_to_fine_pose(
+        frames, dlc_cfg, None, None, None, 0.5, 10, 4
+    )
+    np.testing.assert_allclose(pose[0], [43, 153, 1])
+    assert pose[1, 2] == 0
+    assert shapes[0] == (2, 50, 60, 3)
+    assert shapes[1][1] < 200 and shapes[1][2] < 240
+
+
+@pytest.mark.parametrize("motion_threshold", [None, 10])
+def test_keyframe_inference(tmp_path, monkeypatch, motion_threshold):
+    import cv2
+
+    nframes = 40
+    centers = [(20 + 2 * i, 30 + i) for i in range(nframes)]
+    centers[20:] = [(x + 30, y) for x, y in centers[20:]]  # sudden jump
+    path = str(tmp_path / "vid.avi")
+    _write_square_video(path, centers)
+    monkeypatch.setattr(predict_videos.predict, "getposeNP", _fake_getposeNP)
+    cfg = {"cropping": False, "pcutoff": 0.5}
+    dlc_cfg = {"all_joints_names": ["center"], "num_outputs": 1}
+    data, _, interpolated = predict_videos.GetPoseKeyframes(
+        cfg,
+        dlc_cfg,
+        None,
+        None,
+        None,
+        cv2.VideoCapture(path),
+        nframes,
+        4,
+        5,
+        motion_threshold,
+    )
+    assert not np.isnan(data).any()
+    if motion_threshold is None:
+        keyframes = np.setdiff1d(np.arange(nframes), interpolated)
+        np.testing.assert_array_equal(keyframes, [0, 5, 10, 15, 20, 25, 30, 35, 39])
+        # y moves linearly and is thus recovered exactly by the splines
+        np.testing.assert_allclose(data[:, 1], np.array(centers)[:, 1], atol=1)
+    else:
+        # Frames around the jump are analyzed rather than interpolated
+        assert not np.isin(np.arange(16, 20), interpolated).any()
+        np.testing.assert_allclose(data[:, :2], centers, atol=1)
+    np.testing.assert_allclose(data[:, 2], 1)
@@ -8,10 +8,17 @@
 #
 # Licensed under GNU Lesser General Public License v3.0
 #
+import multiprocessing
 import numpy as np
 import pandas as pd
 import pytest
-from deeplabcut.refine_training_dataset.stitch import Tracklet, TrackletStitcher
+from deeplabcut.refine_training_dataset import stitch
+from deeplabcut.refine_training_dataset.stitch import (
+    Tracklet,
+    TrackletAffinities,
+    TrackletStitcher,
+    TrackletStore,
+)
 
 
 TRACKLET_LEN = 1000
@@ -123,6 +130,235 @@ def test_tracklet_affinities(tracklet):
     _ = tracklet.distance_to(other_tracklet)
 
 
+def make_random_tracklets(n_tracklets=30, seed=0):
+    rng = np.random.default_rng(seed)
+    tracklets = []
+    for _ in range(n_tracklets):
+        start = rng.integers(0, 200)
+        length = rng.integers(5, 40)
+        data = rng.random((length, N_DETS, 3))
+        data[..., :2] *= 100
+        tracklets.append(Tracklet(data, np.arange(start, start + length)))
+    return tracklets
+
+
+@pytest.mark.parametrize(
+    "metric, method",
+    [
+        ("distance", "distance_to"),
+        ("motion", "motion_affinity_with"),
+        ("shape", "shape_dissimilarity_with"),
+        ("box", "box_overlap_with"),
+        ("dynamic", "dynamic_dissimilarity_with"),
+    ],
+)
+def test_tracklet_affinities_vectorized(metric, method):
+    tracklets = make_random_tracklets()
+    affinities = TrackletAffinities(tracklets, metric)
+    pairs = [(t1, t2) for t1 in tracklets for t2 in tracklets if t1 is not t2]
+    values = affinities.pairwise(*zip(*pairs))
+    values_ref = [getattr(t1, method)(t2) for t1, t2 in pairs]
+    np.testing.assert_allclose(values, values_ref)
+
+
+def _legacy_edges(stitcher, max_gap):
+    nodes = sorted(stitcher.tracklets, key=lambda t: t.start)
+    edges = []
+    for i, node_i in enumerate(nodes):
+        for node_j in nodes[i + 1 :]:
+            gap = node_j.start - node_i.end
+            if gap > max_gap:
+                break
+            elif gap > 0:
+                edges.append(
+                    (
+                        stitcher._mapping[node_i]["out"],
+                        stitcher._mapping[node_j]["in"],
+                        int(100 * node_i.distance_to(node_j)),
+                    )
+                )
+    return edges
+
+
+@pytest.mark.parametrize("n_processes", [1, 2])
+def test_stitcher_build_graph_vectorized(n_processes):
+    stitcher = TrackletStitcher(make_random_tracklets(), n_tracks=3)
+    max_gap = 20
+    stitcher.build_graph(max_gap=max_gap)
+    edges = [e for e in stitcher.G.edges.data("weight") if e[2] is not None]
+    assert edges == _legacy_edges(stitcher, max_gap)
+
+    # Custom weight functions are still called pair by pair
+    stitcher.build_graph(
+        max_gap=max_gap,
+        weight_func=TrackletStitcher.calculate_edge_weight,
+        n_processes=n_processes,
+    )
+    edges_custom = [e for e in stitcher.G.edges.data("weight") if e[2] is not None]
+    assert edges_custom == edges
+
+
+def test_stitcher_interval_lookups():
+    tracklets = make_random_tracklets(60, seed=1)
+    # Make a few tracklets discontinuous
+    for tracklet in tracklets[::7]:
+        tracklet.inds[len(tracklet) // 2 :] += 3
+    stitcher = TrackletStitcher(tracklets, n_tracks=3, split_tracklets=False)
+    for tracklet in stitcher:
+        overlapping = [t for t in stitcher if t is not tracklet and t in tracklet]
+        assert stitcher._lu_overlap[tracklet] == overlapping
+
+    # Gap to the closest tracklet starting after each one ends
+    gaps = []
+    for tracklet1 in stitcher:
+        vals = [t.start - tracklet1.end for t in stitcher if t.start > tracklet1.end]
+        if vals:
+            gaps.append(min(vals))
+    assert stitcher.compute_max_gap(stitcher.tracklets) == max(gaps)
+
+
+def make_fake_tracks(n_frames=1500, n_animals=3, seed=0):
+    """Fragment well-separated random walks into tracklets of known identity."""
+    rng = np.random.default_rng(seed)
+    tracklets = []
+    for i in range(n_animals):
+        pos = np.cumsum(rng.normal(size=(n_frames, 2)), axis=0) + [200 * i, 0]
+        data = np.ones((n_frames, N_DETS, 4))
+        data[..., :2] = pos[:, np.newaxis] + rng.normal(size=(n_frames, N_DETS, 2))
+        data[..., 3] = i
+        start = 0
+        while start < n_frames:
+            end = min(start + rng.integers(20, 80), n_frames)
+            tracklets.append(Tracklet(data[start:end], np.arange(start, end)))
+            start = end + rng.integers(1, 4)
+    return tracklets
+
+
+def _track_identities(stitcher):
+    return sorted(sorted({t.identity for t in path}) for path in stitcher.paths)
+
+
+def test_stitcher_skips_non_finite_weights():
+    tracklets = make_fake_tracks()
+    stitcher = TrackletStitcher(tracklets, n_tracks=3)
+
+    def weight_func(t1, t2):
+        if t1.identity != t2.identity:
+            return np.nan
+        return stitcher.calculate_edge_weight(t1, t2)
+
+    stitcher.build_graph(weight_func=weight_func)
+    weights = [w for *_, w in stitcher.G.edges.data("weight") if w is not None]
+    assert weights and all(w >= 0 for w in weights)
+    stitcher.stitch()
+    assert _track_identities(stitcher) == [[0], [1], [2]]
+
+
+@pytest.mark.parametrize("solver", ["networkx", "highs"])
+def test_stitcher_solvers(solver):
+    stitcher = TrackletStitcher(make_fake_tracks(), n_tracks=3)
+    stitcher.build_graph()
+    stitcher.stitch(solver=solver)
+    assert _track_identities(stitcher) == [[0], [1], [2]]
+
+
+@pytest.mark.parametrize("n_processes", [1, 2])
+def test_stitcher_in_windows(n_processes):
+    tracklets = make_fake_tracks()
+    stitcher = TrackletStitcher(tracklets, n_tracks=3)
+    stitcher.build_graph()
+    stitcher.stitch()
+    stitcher_win = TrackletStitcher(tracklets, n_tracks=3)
+    stitcher_win.stitch_in_windows(300, n_processes=n_processes)
+    assert _track_identities(stitcher_win) == [[0], [1], [2]]
+    np.testing.assert_equal(
+        stitcher_win.format_df().to_numpy(), stitcher.format_df().to_numpy()
+    )
+    with pytest.raises(ValueError):
+        stitcher_win.stitch_in_windows(300, overlap=300)
+
+
+@pytest.mark.parametrize("n_processes", [1, 2])
+def test_stitcher_in_windows_custom_weight_func(n_processes):
+    tracklets = make_fake_tracks()
+    stitcher = TrackletStitcher(tracklets, n_tracks=3)
+
+    # Local function, and function keyed by the tracklets of the stitcher
+    def weight_func(t1, t2):
+        return stitcher.calculate_edge_weight(t1, t2)
+
+    for func in weight_func, TrackletAffinities(stitcher.tracklets):
+        stitcher.stitch_in_windows(300, weight_func=func, n_processes=n_processes)
+        assert _track_identities(stitcher) == [[0], [1], [2]]
+
+
+def test_stitcher_in_windows_spawned_workers(monkeypatch):
+    tracklets = make_fake_tracks()
+    stitcher = TrackletStitcher(tracklets, n_tracks=3)
+    monkeypatch.setattr(
+        stitch.multiprocessing, "Pool", multiprocessing.get_context("spawn").Pool
+    )
+    weight_funcs = [
+        stitch._IdentityWeightFunc(stitcher),
+        TrackletAffinities(stitcher.tracklets),
+    ]
+    for func in weight_funcs:
+        stitcher.stitch_in_windows(300, weight_func=func, n_processes=2)
+        assert _track_identities(stitcher) == [[0], [1], [2]]
+
+
+def test_stitcher_in_windows_across_empty_windows():
+    tracklets = make_fake_tracks()
+    before = [t for t in tracklets if t.end < 560]
+    after = [t for t in tracklets if t.start > 1060]
+    # Paths before the gap are not labeled in the order of identities
+    tracklets = before[::-1] + after
+    stitcher = TrackletStitcher(tracklets, n_tracks=3)
+    stitcher.stitch_in_windows(300)
+    assert _track_identities(stitcher) == [[0], [1], [2]]
+
+
+def test_match_window_paths_with_extra_paths():
+    stitcher = TrackletStitcher(make_fake_tracks(), n_tracks=3)
+    paths = [[0], [1], [2], [3]]
+    assert stitcher._match_window_paths(None, None, paths) == [0, 1, 2, -1]
+    labels = stitcher._match_window_paths([[0], [1]], [2, 0], paths)
+    assert labels[:2] == [2, 0]
+    assert sorted(labels) == [-1, 0, 1, 2]
+
+
+def test_tracklet_concatenate():
+    tracklets = make_random_tracklets(10)
+    joined = Tracklet.concatenate(tracklets[::-1])
+    summed = sum(tracklets[::-1])
+    np.testing.assert_equal(joined.inds, summed.inds)
+    np.testing.assert_equal(joined.data, summed.data)
+    assert Tracklet.concatenate(tracklets[:1]) is tracklets[0]
+
+
+@pytest.mark.parametrize("dtype", [np.float64, np.float32])
+def test_tracklet_store(dtype):
+    tracklets = make_random_tracklets(10)
+    store = TrackletStore(tracklets, dtype)
+    assert len(store) == len(tracklets)
+    assert store.data.dtype == dtype
+    for tracklet, view in zip(tracklets, store):
+        assert np.shares_memory(view.data, store.data)
+        np.testing.assert_equal(view.inds, tracklet.inds)
+        np.testing.assert_allclose(view.data, tracklet.data, rtol=1e-6)
+        np.testing.assert_allclose(view.centroid, tracklet.centroid, rtol=1e-6)
+    # Splitting only creates views
+    pieces = TrackletStitcher.split_tracklet(store[0], store[0].inds[[2, 4]])
+    assert all(np.shares_memory(piece.data, store.data) for piece in pieces)
+    assert sum(len(piece) for piece in pieces) == len(store[0])
+
+    stitcher = TrackletStitcher(make_fake_tracks(), n_tracks=3, dtype=dtype)
+    assert all(np.shares_memory(t.data, stitcher.store.data) for t in stitcher)
+    stitcher.build_graph()
+    stitcher.stitch()
+    assert _track_identities(stitcher) == [[0], [1], [2]]
+
+
 @pytest.mark.parametrize("tracklet", make_fake_tracklets())
 def test_stitcher_wrong_inputs(tracklet):
     with pytest.raises(IOError):
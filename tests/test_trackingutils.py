@@ -10,7 +10,12 @@
 #
 import numpy as np
 import pytest
-from deeplabcut.pose_estimation_tensorflow.lib import trackingutils
+from deeplabcut.pose_estimation_tensorflow.lib import inferenceutils, trackingutils
+from deeplabcut.pose_estimation_tensorflow.predict_multianimal import (
+    _close_detection_store,
+    _open_detection_store,
+)
+from test_detectionutils import N_BODYPARTS, _fake_detections
 
 
 @pytest.fixture()
@@ -40,6 +45,40 @@ def test_ellipse_fitter():
     assert np.isclose(el.parameters, [0, 0, 4, 2, 0]).all()
 
 
+def test_ellipse_fitter_batch():
+    rng = np.random.default_rng(0)
+    xy = rng.normal(size=(6, 3, 8, 2)) * [3, 1]
+    xy[rng.random(xy.shape[:3]) < 0.2] = np.nan
+    xy[0, 0, 2:] = np.nan  # Too few keypoints
+    fitter = trackingutils.EllipseFitter()
+    params = fitter.fit_batch(xy)
+    assert params.shape == (6, 3, 5)
+    assert np.isnan(params[0, 0]).all()
+    for ind in np.ndindex(xy.shape[:2]):
+        el = fitter.fit(xy[ind])
+        if el is None:
+            assert np.isnan(params[ind]).all()
+        else:
+            np.testing.assert_allclose(params[ind], el.parameters)
+
+    fitter.sd = 0
+    xy = np.asarray([[-2, 0], [2, 0], [0, 1], [0, -1], [1, 0.5], [-1, -0.5]])
+    xy[-2:] *= np.sqrt(2)
+    params = fitter.fit_batch(xy[np.newaxis])
+    np.testing.assert_allclose(params, [[0, 0, 4, 2, 0]], atol=1e-8)
+
+    # Random poses of few keypoints, away from the origin
+    xy = rng.normal(size=(500, 6, 2)) * [3, 1] + rng.normal(size=(500, 1, 2)) * 50
+    xy[::2, -1] = np.nan
+    params = fitter.fit_batch(xy)
+    for xy_, params_ in zip(xy, params):
+        el = fitter.fit(xy_)
+        if el is None or np.isnan(el.parameters).any():
+            assert np.isnan(params_).all()
+        else:
+            np.testing.assert_allclose(params_, el.parameters, rtol=1e-6, atol=1e-6)
+
+
 def test_ellipse_tracker(ellipse):
     tracker1 = trackingutils.EllipseTracker(ellipse.parameters)
     tracker2 = trackingutils.EllipseTracker(ellipse.parameters)
@@ -81,6 +120,96 @@ def test_tracking_ellipse(real_assemblies, real_tracklets):
     )
 
 
+def test_batch_tracker_matches_trackers(ellipse):
+    rng = np.random.default_rng(0)
+    params = np.asarray(ellipse.parameters) + rng.normal(size=(3, 5))
+    trackers = [trackingutils.EllipseTracker(p) for p in params]
+    batch = trackingutils.BatchTracker(trackers[0].kf)
+    batch.add(params)
+    np.testing.assert_array_equal(batch.id, [0, 1, 2])
+    for _ in range(5):
+        np.testing.assert_allclose(
+            batch.predict(), np.stack([t.predict() for t in trackers])
+        )
+        z = params + rng.normal(size=params.shape)
+        batch.update([0, 2], z[[0, 2]])
+        trackers[0].update(z[0])
+        trackers[2].update(z[2])
+        np.testing.assert_allclose(batch.state, np.stack([t.state for t in trackers]))
+        np.testing.assert_allclose(batch.P, np.stack([t.kf.P for t in trackers]))
+        for attr in ("time_since_update", "age", "hits", "hit_streak"):
+            np.testing.assert_equal(
+                getattr(batch, attr), [getattr(t, attr) for t in trackers]
+            )
+    batch.remove([False, True, False])
+    assert len(batch) == 2
+    np.testing.assert_array_equal(batch.id, [0, 2])
+
+
+def test_batch_tracker_partial_update():
+    n_bodyparts = 4
+    pose = np.random.rand(n_bodyparts, 2)
+    tracker = trackingutils.SkeletonTracker(n_bodyparts)
+    tracker.state = pose
+    batch = trackingutils.BatchTracker(tracker.kf)
+    batch.add(pose.reshape((1, -1)))
+    tracker.predict()
+    batch.predict()
+    pose[1] = np.nan
+    flat = pose.reshape((1, -1))
+    batch.update([0], flat, observed=~np.isnan(flat))
+    tracker.update(pose)
+    np.testing.assert_allclose(batch.state[0], tracker.state)
+    assert batch.hits[0] == tracker.hits == 0
+
+
+def test_pairwise_costs():
+    rng = np.random.default_rng(1)
+    params = rng.random((4, 5)) * [10, 10, 5, 5, np.pi]
+    params_ref = rng.random((3, 5)) * [10, 10, 5, 5, np.pi]
+    mat = trackingutils.calc_pairwise_ellipse_similarity(params, params_ref)
+    for i, p in enumerate(params):
+        for j, p_ref in enumerate(params_ref):
+            el = trackingutils.Ellipse(*p)
+            el_ref = trackingutils.Ellipse(*p_ref)
+            assert np.isclose(mat[i, j], el.calc_similarity_with(el_ref))
+
+    xy = rng.random((4, 10, 2)) * 10
+    bboxes = np.c_[xy.min(axis=1), xy.max(axis=1)]
+    mat = trackingutils.calc_pairwise_iou(bboxes, bboxes[:2])
+    for i, bbox in enumerate(bboxes):
+        for j, bbox_ref in enumerate(bboxes[:2]):
+            assert np.isclose(mat[i, j], trackingutils.calc_iou(bbox, bbox_ref))
+
+    xy[0, 3] = np.nan
+    mot_tracker = trackingutils.SORTSkeleton(10)
+    hausdorff = mot_tracker.calc_pairwise_hausdorff_dist(xy, xy[1:])
+    oks = mot_tracker.calc_pairwise_oks(xy, xy[1:])
+    for i, pose in enumerate(xy):
+        for j, pose_ref in enumerate(xy[1:]):
+            assert np.isclose(
+                hausdorff[i, j], mot_tracker.weighted_hausdorff(pose, pose_ref)
+            )
+            assert np.isclose(
+                oks[i, j], mot_tracker.object_keypoint_similarity(pose, pose_ref)
+            )
+
+
+def test_sort_skeleton():
+    mot_tracker = trackingutils.SORTSkeleton(10, max_age=5)
+    poses = np.random.rand(3, 10, 2) * 100
+    trackers = mot_tracker.track(poses)
+    assert trackers.shape == (3, 22)
+    np.testing.assert_array_equal(trackers[::-1, -2:], [[0, 0], [1, 1], [2, 2]])
+    # Animals swap order and one goes missing
+    trackers = mot_tracker.track(poses[[2, 0]])
+    ids = dict(trackers[:, -2:].astype(int))
+    assert ids[0] == 1 and ids[2] == 0 and ids[1] == -1
+    for _ in range(2):
+        trackers = mot_tracker.track(poses[[2, 0]])
+    assert sorted(trackers[:, -2]) == [0, 2]
+
+
 def test_box_tracker():
     bbox = 0, 0, 100, 100
     tracker1 = trackingutils.BoxTracker(bbox)
@@ -94,6 +223,16 @@ def test_box_tracker():
     assert tracker1.hit_streak == 0
 
 
+def test_sort_box():
+    mot_tracker = trackingutils.SORTBox(1, 1, 0.3)
+    bboxes = np.asarray([[0, 0, 10, 10, 1], [50, 50, 70, 80, 1]], dtype=float)
+    trackers = mot_tracker.track(bboxes)
+    assert trackers.shape == (2, 6)
+    np.testing.assert_allclose(trackers[::-1, :4], bboxes[:, :4])
+    trackers = mot_tracker.track(bboxes[::-1] + 1)
+    np.testing.assert_array_equal(trackers[::-1, -2:], [[0, 1], [1, 0]])
+
+
 def test_tracking_box(real_assemblies, real_tracklets):
     tracklets_ref = real_tracklets.copy()
     _ = tracklets_ref.pop("header", None)
@@ -167,3 +306,84 @@ def test_calc_bboxes_from_keypoints():
     offset = 50
     bboxes = trackingutils.calc_bboxes_from_keypoints(xyp, offset=offset)
     np.testing.assert_equal(bboxes, [[offset, 0, width + offset, height, 0.5]])
+
+
+@pytest.mark.parametrize("window_size", [0, 2])
+def test_assembler_assemble_frame(window_size):
+    data = _fake_detections(n_frames=12, n_animals=3, seed=2)
+    params = dict(
+        max_n_individuals=3,
+        n_multibodyparts=N_BODYPARTS,
+        pcutoff=0.1,
+        min_affinity=0,
+        window_size=window_size,
+    )
+    ass = inferenceutils.Assembler(data, **params)
+    ass.assemble(chunk_size=0)
+    imnames = ass.metadata["imnames"]
+    first = {"metadata": data["metadata"], imnames[0]: data[imnames[0]]}
+    online = inferenceutils.Assembler(first, **params)
+    for ind, imname in enumerate(imnames):
+        assemblies, _ = online.assemble_frame(data[imname], ind)
+        assert len(online._trees) <= window_size
+        if assemblies:
+            assert online.assemblies[ind] is assemblies
+    assert online.assemblies.keys() == ass.assemblies.keys()
+    for ind, assemblies in ass.assemblies.items():
+        np.testing.assert_array_equal(
+            [a.data for a in online.assemblies[ind]], [a.data for a in assemblies]
+        )
+
+
+@pytest.mark.parametrize("track_method", ["ellipse", "box", "skeleton"])
+@pytest.mark.parametrize("keep_detections", [False, True])
+def test_tracklet_builder_online_matches_offline(track_method, keep_detections):
+    data = _fake_detections(n_frames=12, n_animals=3, seed=2)
+    cfg = {
+        "multianimalbodyparts": data["metadata"]["all_joints_names"],
+        "uniquebodyparts": [],
+    }
+    inferencecfg = {
+        "topktoretain": 3,
+        "max_age": 1,
+        "min_hits": 1,
+        "pcutoff": 0.1,
+        "pafthreshold": 0,
+        "boundingboxslack": 0,
+    }
+    ass = inferenceutils.Assembler(
+        data,
+        max_n_individuals=3,
+        n_multibodyparts=N_BODYPARTS,
+        pcutoff=0.1,
+        min_affinity=0,
+    )
+    ass.assemble(chunk_size=0)
+    assert ass.assemblies
+    offline = trackingutils.TrackletBuilder(cfg, inferencecfg, track_method)
+    for i, imname in enumerate(ass.metadata["imnames"]):
+        offline.track(imname, ass.assemblies.get(i), ass.unique.get(i))
+
+    online = trackingutils.TrackletBuilder(
+        cfg, inferencecfg, track_method, keep_detections=keep_detections
+    )
+    dlc_cfg = {
+        "nmsradius": 5,
+        "minconfidence": 0.01,
+        "partaffinityfield_graph": data["metadata"]["PAFgraph"],
+        "all_joints": [[i] for i in range(N_BODYPARTS)],
+        "all_joints_names": data["metadata"]["all_joints_names"],
+    }
+    db, start = _open_detection_store("", dlc_cfg, 12, online)
+    assert db is online and start == 0
+    for name in ass.metadata["imnames"]:
+        db[name] = data[name]
+    table = _close_detection_store(db)
+    assert (table is not None) == keep_detections
+
+    assert online.tracklets.keys() == offline.tracklets.keys()
+    for k, tracklet in online.tracklets.items():
+        assert tracklet.keys() == offline.tracklets[k].keys()
+        for imname, pose in tracklet.items():
+            np.testing.assert_array_equal(pose, offline.tracklets[k][imname])
+    assert online.assembler.assemblies.keys() == ass.assemblies.keys()
@@ -0,0 +1,100 @@
+#
+# DeepLabCut Toolbox (deeplabcut.org)
+# © A. & M.W. Mathis Labs
+# https://github.com/DeepLabCut/DeepLabCut
+#
+# Please see AUTHORS for contributors.
+# https://github.com/DeepLabCut/DeepLabCut/blob/master/AUTHORS
+#
+# Licensed under GNU Lesser General Public License v3.0
+#
+import numpy as np
+import pytest
+from deeplabcut.refine_training_dataset.stitch import Tracklet
+
+pytest.importorskip("torch")
+from deeplabcut.pose_tracking_pytorch.inference import TrackletEmbeddings
+
+
+N_FRAMES = 10
+N_KPTS = 2
+FEATURE_DIM = 8
+ZFILL_WIDTH = 1
+# Keypoints are swapped between animals so each detection matches a single one
+COORDINATES = np.array([[[10, 10], [60, 60]], [[60, 60], [10, 10]]])
+
+
+class StubTransformer:
+    """Stands in for DLCTrans, embedding features as their normalized flattening."""
+
+    def __init__(self):
+        self.n_embedded = 0
+
+    def embed(self, vecs, batch_size=256):
+        self.n_embedded += len(vecs)
+        vecs = vecs.reshape((len(vecs), -1))
+        return vecs / np.linalg.norm(vecs, axis=1, keepdims=True)
+
+
+@pytest.fixture
+def feature_dict():
+    rng = np.random.default_rng(0)
+    return {
+        f"frame{frame}": {
+            "coordinates": COORDINATES,
+            "features": rng.random((len(COORDINATES), N_KPTS, FEATURE_DIM)),
+        }
+        for frame in range(N_FRAMES)
+    }
+
+
+def make_tracklet(animal, start, end):
+    inds = np.arange(start, end + 1)
+    data = np.ones((len(inds), N_KPTS, 3))
+    data[..., :2] = COORDINATES[animal]
+    return Tracklet(data, inds)
+
+
+def old_weight(feature_dict, frame1, animal1, frame2, animal2):
+    vec1 = feature_dict[f"frame{frame1}"]["features"][animal1].ravel()
+    vec2 = feature_dict[f"frame{frame2}"]["features"][animal2].ravel()
+    cos = vec1 @ vec2 / (np.linalg.norm(vec1) * np.linalg.norm(vec2))
+    return -(cos + 1) / 2
+
+
+def test_tracklet_embeddings_pairwise(feature_dict):
+    tracklet1 = make_tracklet(0, 0, 3)
+    tracklet2 = make_tracklet(1, 0, 4)
+    tracklet3 = make_tracklet(0, 5, 9)
+    embeddings = TrackletEmbeddings(
+        StubTransformer(), [tracklet1, tracklet2, tracklet3], feature_dict, ZFILL_WIDTH
+    )
+    # The tail of the preceding tracklet faces the head of the following one
+    expected = [
+        old_weight(feature_dict, 3, 0, 5, 0),
+        old_weight(feature_dict, 4, 1, 5, 0),
+    ]
+    np.testing.assert_allclose(
+        embeddings.pairwise([tracklet1, tracklet2], [tracklet3, tracklet3]), expected
+    )
+    np.testing.assert_allclose(
+        embeddings.pairwise([tracklet3, tracklet3], [tracklet1, tracklet2]), expected
+    )
+    assert embeddings(tracklet1, tracklet3) == pytest.approx(expected[0])
+
+
+def test_tracklet_embeddings_shared_endpoints(feature_dict):
+    # The second tracklet starts where and when the first one ends
+    tracklets = [make_tracklet(0, 0, 3), make_tracklet(0, 3, 7)]
+    dlctrans = StubTransformer()
+    embeddings = TrackletEmbeddings(dlctrans, tracklets, feature_dict, ZFILL_WIDTH)
+    assert dlctrans.n_embedded == 3
+    assert len(embeddings.embeddings) == 3
+    assert embeddings.index == {(0, 0): 0, (3, 0): 1, (7, 0): 2}
+
+
+def test_tracklet_embeddings_no_tracklets(feature_dict):
+    dlctrans = StubTransformer()
+    embeddings = TrackletEmbeddings(dlctrans, [], feature_dict, ZFILL_WIDTH)
+    assert dlctrans.n_embedded == 0
+    assert embeddings.pairwise([], []).size == 0
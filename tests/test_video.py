@@ -8,10 +8,15 @@
 #
 # Licensed under GNU Lesser General Public License v3.0
 #
+import numpy as np
 import os
 import pytest
 from conftest import TEST_DATA_DIR
-from deeplabcut.utils.auxfun_videos import VideoWriter
+from deeplabcut.utils.auxfun_videos import (
+    BatchedFrameReader,
+    InterleavedFrameReader,
+    VideoWriter,
+)
 
 
 POS_FRAMES = 1  # Equivalent to cv2.CAP_PROP_POS_FRAMES
@@ -73,6 +78,68 @@ def test_reader_set_frame(video_clip):
     assert int(video_clip.video.get(POS_FRAMES)) == 0
 
 
+class _CountingCapture:
+    def __init__(self, cap):
+        self.cap = cap
+        self.n_seeks = 0
+
+    def set(self, prop, value):
+        self.n_seeks += 1
+        return self.cap.set(prop, value)
+
+    def __getattr__(self, name):
+        return getattr(self.cap, name)
+
+
+@pytest.fixture()
+def video_copy(tmp_path):
+    path = tmp_path / "vid.avi"
+    path.write_bytes(open(os.path.join(TEST_DATA_DIR, "vid.avi"), "rb").read())
+    return str(path)
+
+
+def test_reader_keyframes_cached(video_copy, monkeypatch):
+    calls = []
+
+    def probe(self):
+        calls.append(self.video_path)
+        return np.array([0, 100, 200])
+
+    monkeypatch.setattr(VideoWriter, "_probe_keyframes", probe)
+    reader = VideoWriter(video_copy)
+    np.testing.assert_array_equal(reader.keyframes, [0, 100, 200])
+    assert os.path.isfile(reader.keyframes_path)
+    np.testing.assert_array_equal(VideoWriter(video_copy).keyframes, [0, 100, 200])
+    assert len(calls) == 1
+
+
+def test_reader_set_frame_does_not_index(video_copy, monkeypatch):
+    calls = []
+    monkeypatch.setattr(VideoWriter, "_probe_keyframes", lambda self: calls.append(1))
+    reader = VideoWriter(video_copy)
+    reader.set_to_frame(100)
+    assert int(reader.video.get(POS_FRAMES)) == 100
+    assert not calls
+    assert not os.path.isfile(reader.keyframes_path)
+
+
+@pytest.mark.parametrize("keyframes", [None, np.array([0, 100, 200])])
+def test_reader_read_frames(video_copy, monkeypatch, keyframes):
+    monkeypatch.setattr(VideoWriter, "_probe_keyframes", lambda self: keyframes)
+    reader = VideoWriter(video_copy)
+    expected = [reader.read_frame() for _ in range(len(reader))]
+    reader.reset()
+    reader.video = _CountingCapture(reader.video)
+    inds = [150, 3, 7, 7, 20, 120, 230]
+    read_inds = []
+    for ind, frame in reader.read_frames(inds):
+        np.testing.assert_array_equal(frame, expected[ind])
+        read_inds.append(ind)
+    assert read_inds == sorted(set(inds))
+    # Only jumps past a keyframe require seeking
+    assert reader.video.n_seeks == (3 if keyframes is None else 2)
+
+
 @pytest.mark.parametrize("shrink, crop", [(1, False), (1, True), (2, False), (2, True)])
 def test_reader_read_frame(video_clip, shrink, crop):
     if crop:
@@ -83,6 +150,75 @@ def test_reader_read_frame(video_clip, shrink, crop):
     assert width == video_clip.width // shrink
 
 
+@pytest.mark.parametrize("batchsize, cropping", [(1, None), (7, None), (4, (10, 60, 5, 45))])
+def test_batched_frame_reader(video_clip, batchsize, cropping):
+    nframes = 30
+    expected = []
+    for _ in range(nframes):
+        frame = video_clip.read_frame()
+        if cropping is not None:
+            x1, x2, y1, y2 = cropping
+            frame = frame[y1:y2, x1:x2]
+        expected.append(frame)
+    video_clip.reset()
+    reader = BatchedFrameReader(video_clip.video, nframes, batchsize, cropping)
+    inds_all = []
+    for frames, inds in reader:
+        assert frames.shape[0] == batchsize
+        for frame, ind in zip(frames, inds):
+            np.testing.assert_array_equal(frame, expected[ind])
+        inds_all.extend(inds)
+    assert inds_all == list(range(nframes))
+
+
+def test_batched_frame_reader_early_exit(video_clip):
+    reader = BatchedFrameReader(video_clip.video, 50, 2, n_buffers=2)
+    with reader:
+        for _, inds in reader:
+            if inds[0] == 10:
+                break
+    assert reader._thread is None
+
+
+def test_batched_frame_reader_indices(video_clip):
+    expected = [video_clip.read_frame() for _ in range(30)]
+    video_clip.reset()
+    indices = [0, 7, 8, 21, 29]
+    reader = BatchedFrameReader(video_clip.video, 256, 2, indices=indices)
+    inds_all = []
+    for frames, inds in reader:
+        for frame, ind in zip(frames, inds):
+            np.testing.assert_array_equal(frame, expected[ind])
+        inds_all.extend(inds)
+    assert inds_all == indices
+    assert int(video_clip.video.get(POS_FRAMES)) == 30
+
+
+@pytest.mark.parametrize("n_streams", [1, 2, 3])
+def test_interleaved_frame_reader(video_clip, n_streams):
+    nframes = [5, 12, 3]
+    expected = [video_clip.read_frame() for _ in range(max(nframes))]
+    videos = [video_clip.video_path] * len(nframes)
+    reader = InterleavedFrameReader(
+        videos,
+        nframes,
+        4,
+        (video_clip.height, video_clip.width),
+        n_streams=n_streams,
+    )
+    seen = {i: [] for i in range(len(videos))}
+    finished = []
+    for frames, inds, done in reader:
+        for frame, (video_ind, frame_ind) in zip(frames, inds):
+            assert video_ind not in finished
+            np.testing.assert_array_equal(frame, expected[frame_ind])
+            seen[video_ind].append(frame_ind)
+        finished.extend(done)
+    assert sorted(finished) == list(range(len(videos)))
+    for video_ind, n in enumerate(nframes):
+        assert seen[video_ind] == list(range(n))
+
+
 def test_writer_bbox(video_clip):
     bbox = 0, 100, 0, 100
     video_clip.set_bbox(*bbox)
@@ -0,0 +1,146 @@
+"""Benchmark the computation of PAF edge costs against the former loop-based code.
+
+Usage (from the repository root)::
+
+    python tools/benchmark_edge_costs.py --batchsize 32 --n_bodyparts 20 --n_animals 5
+"""
+
+import argparse
+import timeit
+
+import numpy as np
+
+from deeplabcut.pose_estimation_tensorflow.core.predict_multianimal import (
+    compute_edge_costs,
+)
+
+
+def compute_edge_costs_loop(
+    pafs,
+    peak_inds_in_batch,
+    graph,
+    paf_inds,
+    n_bodyparts,
+    n_points=10,
+    n_decimals=3,
+):
+    """Previous implementation, looping over samples and edges."""
+    # Clip peak locations to PAFs dimensions
+    h, w = pafs.shape[1:3]
+    peak_inds_in_batch[:, 1] = np.clip(peak_inds_in_batch[:, 1], 0, h - 1)
+    peak_inds_in_batch[:, 2] = np.clip(peak_inds_in_batch[:, 2], 0, w - 1)
+
+    n_samples = pafs.shape[0]
+    sample_inds = []
+    edge_inds = []
+    all_edges = []
+    all_peaks = []
+    for i in range(n_samples):
+        samples_i = peak_inds_in_batch[:, 0] == i
+        peak_inds = peak_inds_in_batch[samples_i, 1:]
+        if not np.any(peak_inds):
+            continue
+        peaks = peak_inds[:, :2]
+        bpt_inds = peak_inds[:, 2]
+        idx = np.arange(peaks.shape[0])
+        idx_per_bpt = {j: idx[bpt_inds == j].tolist() for j in range(n_bodyparts)}
+        edges = []
+        for k, (s, t) in zip(paf_inds, graph):
+            inds_s = idx_per_bpt[s]
+            inds_t = idx_per_bpt[t]
+            if not (inds_s and inds_t):
+                continue
+            candidate_edges = ((i, j) for i in inds_s for j in inds_t)
+            edges.extend(candidate_edges)
+            edge_inds.extend([k] * len(inds_s) * len(inds_t))
+        if not edges:
+            continue
+        sample_inds.extend([i] * len(edges))
+        all_edges.extend(edges)
+        all_peaks.append(peaks[np.asarray(edges)])
+    if not all_peaks:
+        return [dict() for _ in range(n_samples)]
+
+    sample_inds = np.asarray(sample_inds, dtype=np.int32)
+    edge_inds = np.asarray(edge_inds, dtype=np.int32)
+    all_edges = np.asarray(all_edges, dtype=np.int32)
+    all_peaks = np.concatenate(all_peaks)
+    vecs_s = all_peaks[:, 0]
+    vecs_t = all_peaks[:, 1]
+    vecs = vecs_t - vecs_s
+    lengths = np.linalg.norm(vecs, axis=1).astype(np.float32)
+    lengths += np.spacing(1, dtype=np.float32)
+    xy = np.linspace(vecs_s, vecs_t, n_points, axis=1, dtype=np.int32)
+    y = pafs[
+        sample_inds.reshape((-1, 1)),
+        xy[..., 0],
+        xy[..., 1],
+        edge_inds.reshape((-1, 1)),
+    ]
+    integ = np.trapz(y, xy[..., ::-1], axis=1)
+    affinities = np.linalg.norm(integ, axis=1).astype(np.float32)
+    # unit_vecs = vecs / lengths[:, np.newaxis]
+    # affinities = np.squeeze(y @ np.expand_dims(unit_vecs, axis=2)).sum(axis=1)
+    affinities /= lengths
+    np.round(affinities, decimals=n_decimals, out=affinities)
+    np.round(lengths, decimals=n_decimals, out=lengths)
+
+    # Form cost matrices
+    all_costs = []
+    for i in range(n_samples):
+        samples_i_mask = sample_inds == i
+        costs = dict()
+        for k in paf_inds:
+            edges_k_mask = edge_inds == k
+            idx = np.flatnonzero(samples_i_mask & edges_k_mask)
+            s, t = all_edges[idx].T
+            n_sources = np.unique(s).size
+            n_targets = np.unique(t).size
+            costs[k] = dict()
+            costs[k]["m1"] = affinities[idx].reshape((n_sources, n_targets))
+            costs[k]["distance"] = lengths[idx].reshape((n_sources, n_targets))
+        all_costs.append(costs)
+
+    return all_costs
+
+
+def make_inputs(batchsize, n_bodyparts, n_animals, height=64, width=80, seed=0):
+    rng = np.random.default_rng(seed)
+    graph = [[i, j] for i in range(n_bodyparts) for j in range(i + 1, n_bodyparts)]
+    pafs = rng.random((batchsize, height, width, len(graph), 2)).astype(np.float32)
+    n_peaks = batchsize * n_bodyparts * n_animals
+    peak_inds = np.c_[
+        np.repeat(np.arange(batchsize), n_bodyparts * n_animals),
+        rng.integers(0, height, n_peaks),
+        rng.integers(0, width, n_peaks),
+        np.tile(np.repeat(np.arange(n_bodyparts), n_animals), batchsize),
+    ]
+    return pafs, peak_inds, graph, np.arange(len(graph)), n_bodyparts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--batchsize", type=int, default=32)
+    parser.add_argument("--n_bodyparts", type=int, default=20)
+    parser.add_argument("--n_animals", type=int, default=5)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    inputs = make_inputs(args.batchsize, args.n_bodyparts, args.n_animals)
+    costs = compute_edge_costs(*inputs)
+    costs_loop = compute_edge_costs_loop(*inputs)
+    for c1, c2 in zip(costs, costs_loop):
+        for k in c1:
+            np.testing.assert_array_equal(c1[k]["m1"], c2[k]["m1"])
+            np.testing.assert_array_equal(c1[k]["distance"], c2[k]["distance"])
+
+    for name, func in [
+        ("loop", compute_edge_costs_loop),
+        ("vectorized", compute_edge_costs),
+    ]:
+        t = min(timeit.repeat(lambda: func(*inputs), number=1, repeat=args.repeats))
+        print(f"{name:>10}: {1000 * t:.1f} ms per batch")
+
+
+if __name__ == "__main__":
+    main()